@@ -60,6 +60,8 @@ from .processing import (
 
 from .matching import ReferenceMatcher
 
+from .utils.metrics import load_metrics, summarize_metrics, format_metrics_table
+
 # =============================================================================
 # Convenience Function: Run Full Pipeline
 # =============================================================================
@@ -68,6 +70,17 @@ def run_full_pipeline(
     data_output: str,
     parallel: bool = True,
     max_workers: int = None,
+    executor: str = "thread",
+    chunk_size: int = None,
+    resume: bool = True,
+    compact_json: bool = False,
+    paper_timeout: float = None,
+    max_rss_mb: int = None,
+    max_tasks_per_child: int = None,
+    version_workers: int = None,
+    file_cache_mb: float = None,
+    root_cache: bool = True,
+    flatten_cache: bool = False,
     run_matching: bool = True,
     verbose: bool = True
 ) -> dict:
@@ -79,12 +92,27 @@ def run_full_pipeline(
         data_output: Đường dẫn thư mục xuất kết quả
         parallel: Sử dụng xử lý song song (mặc định: True)
         max_workers: Số luồng tối đa (mặc định: số CPU)
+        executor: "thread" hoặc "process" khi chạy song song (mặc định: "thread")
+        chunk_size: Số papers tối đa mỗi task gửi vào executor (mặc định: tự động)
+        resume: Bỏ qua papers không đổi kể từ lần chạy trước (mặc định: True)
+        compact_json: Ghi hierarchy.json dạng compact, không indent (mặc định: False)
+        paper_timeout: Thời gian tối đa (giây) mỗi paper, vượt quá -> quarantine (mặc định: không giới hạn)
+        max_rss_mb: RSS tối đa (MB) mỗi paper, vượt quá -> quarantine (mặc định: không giới hạn)
+        max_tasks_per_child: Thay worker process mới sau N tasks (mặc định: không thay)
+        version_workers: Số workers xử lý song song các versions trong một paper (mặc định: tuần tự)
+        file_cache_mb: Giới hạn (MB) cache nội dung file nguồn mỗi process (mặc định: 64MB, 0 = tắt)
+        root_cache: Dùng lại quyết định root file đã lưu trong data_output/.root_cache (mặc định: True)
+        flatten_cache: Lưu phân tích từng file của flatten vào data_output/.flatten_cache (mặc định: False)
         run_matching: Chạy phase matching sau khi xử lý (mặc định: True)
         verbose: In thông tin tiến trình (mặc định: True)
     
     Returns:
         dict: Thống kê kết quả xử lý
             - processed: Số papers đã xử lý
+            - failed: Dict {paper_id: lỗi} của các papers xử lý thất bại
+            - quarantined: Dict {paper_id: lý do} của các papers bị cách ly (timeout / memory / crashed)
+            - metrics_path: File metrics.jsonl (thời gian & counters từng stage)
+            - stage_summary: Bảng tổng hợp thời gian theo stage của Phase 1
             - matched: Số papers đã match (nếu run_matching=True)
             - output_path: Đường dẫn output
     
@@ -102,6 +130,7 @@ def run_full_pipeline(
     stats = {
         "processed": 0,
         "matched": 0,
+        "failed": {},
         "output_path": data_output
     }
     
@@ -111,12 +140,26 @@ def run_full_pipeline(
         print("=" * 60)
     
     # Phase 1: Processing
-    run_processing_pipeline(
+    phase1 = run_processing_pipeline(
         data_raw_path=data_raw,
         data_output_path=data_output,
         parallel=parallel,
-        max_workers=max_workers
+        max_workers=max_workers,
+        executor=executor,
+        chunk_size=chunk_size,
+        resume=resume,
+        compact_json=compact_json,
+        paper_timeout=paper_timeout,
+        max_rss_mb=max_rss_mb,
+        max_tasks_per_child=max_tasks_per_child,
+        version_workers=version_workers,
+        file_cache_mb=file_cache_mb,
+        root_cache=root_cache,
+        flatten_cache=flatten_cache
     )
+    stats["failed"] = phase1["failed"]
+    stats["quarantined"] = phase1["quarantined"]
+    stats["metrics_path"] = phase1["metrics_path"]
     
     # Count processed
     if os.path.exists(data_output):
@@ -127,6 +170,13 @@ def run_full_pipeline(
     
     if verbose:
         print(f"\n✅ Phase 1 Complete: {stats['processed']} papers processed")
+        if stats["failed"]:
+            print(f"   ⚠️  {len(stats['failed'])} papers failed (xem pipeline.log)")
+        if stats["quarantined"]:
+            print(f"   ☣️  {len(stats['quarantined'])} papers quarantined (xem quarantine.json)")
+    
+    # Tổng hợp metrics theo stage (root detection, flatten, references, ...)
+    stats["stage_summary"] = summarize_metrics(load_metrics(phase1["metrics_path"]))
     
     # Phase 2: Matching (optional)
     if run_matching:
@@ -147,6 +197,11 @@ def run_full_pipeline(
             print(f"\n✅ Phase 2 Complete: {stats['matched']} papers matched")
     
     if verbose:
+        if stats["stage_summary"]["papers"]:
+            print("\n" + "=" * 60)
+            print("⏱️  PHASE 1 STAGE TIMINGS")
+            print("=" * 60)
+            print(format_metrics_table(stats["stage_summary"]))
         print("\n" + "=" * 60)
         print("🎉 PIPELINE COMPLETE!")
         print(f"   Output: {data_output}")
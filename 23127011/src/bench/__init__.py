@@ -0,0 +1,37 @@
+"""
+Benchmark Module
+================
+
+Benchmark hiệu năng các stage của pipeline trên corpus giả lập.
+
+Modules:
+    - corpus: Sinh corpus giả lập theo cấu trúc arXiv (data_raw)
+    - runner: Đo thời gian từng stage, xuất / so sánh kết quả JSON
+
+Chạy từ command line:
+    python -m src.main bench --papers 20 --scale medium --repeat 3 --json bench.json
+"""
+
+from .corpus import generate_corpus, SCALE_PRESETS, CORPUS_MARKER
+from .runner import (
+    STAGES,
+    BenchStage,
+    run_benchmarks,
+    save_results,
+    load_results,
+    compare_results,
+    format_results_table
+)
+
+__all__ = [
+    'generate_corpus',
+    'SCALE_PRESETS',
+    'CORPUS_MARKER',
+    'STAGES',
+    'BenchStage',
+    'run_benchmarks',
+    'save_results',
+    'load_results',
+    'compare_results',
+    'format_results_table'
+]
@@ -0,0 +1,341 @@
+"""
+Synthetic Corpus Generator
+==========================
+
+Sinh bộ dữ liệu giả lập theo cấu trúc arXiv (data_raw) để benchmark pipeline.
+
+Mỗi paper gồm:
+    - Nhiều version (v1, v2, ...): version sau sao chép version trước và sửa một phần file
+    - Cây `\\input` nhiều file (sections/, nested subsections, chuỗi include lồng sâu)
+    - `.bib` hoặc `.bbl` (+ `\\bibliography`), hoặc `thebibliography` nhúng trong main.tex
+    - Bảng lớn, nhiều công thức, list lồng nhau, ngoặc nhọn lồng sâu (pathological)
+    - File .tex "rác" (dữ liệu hình, template) để làm nhiễu bước tìm file gốc
+    - metadata.json & references.json (ground truth cho matching)
+
+Cùng `seed` + cùng tham số -> cùng nội dung byte-for-byte.
+
+Thư mục corpus được đánh dấu bằng file `CORPUS_MARKER`; `generate_corpus` chỉ xóa / ghi đè thư mục
+không rỗng khi có file này (corpus sinh bởi lần chạy trước) hoặc khi gọi với `overwrite=True`.
+
+Example:
+    >>> from src.bench.corpus import generate_corpus
+    >>> info = generate_corpus("/tmp/bench_raw", papers=10, scale="medium", seed=42)
+    >>> info["total_bytes"]
+"""
+
+import json
+import os
+import random
+import shutil
+from typing import Optional
+
+# File đánh dấu thư mục do generate_corpus sinh ra (được phép xóa để sinh lại)
+CORPUS_MARKER = ".bench_corpus"
+
+# Các preset kích thước corpus
+SCALE_PRESETS = {
+    "small": {
+        "sections": 4, "paragraphs": 3, "sentences": 5, "table_rows": 10,
+        "equations": 2, "nesting_depth": 3, "refs": 20, "junk_files": 2,
+    },
+    "medium": {
+        "sections": 8, "paragraphs": 6, "sentences": 8, "table_rows": 60,
+        "equations": 5, "nesting_depth": 6, "refs": 60, "junk_files": 10,
+    },
+    "large": {
+        "sections": 16, "paragraphs": 12, "sentences": 10, "table_rows": 400,
+        "equations": 12, "nesting_depth": 12, "refs": 150, "junk_files": 50,
+    },
+    # Project nhiều file: cây \input rộng (nhiều section) + chuỗi include rất sâu (đo throughput của flatten)
+    "project": {
+        "sections": 120, "paragraphs": 4, "sentences": 6, "table_rows": 20,
+        "equations": 2, "nesting_depth": 200, "refs": 100, "junk_files": 20,
+    },
+    # Một paper rất lớn (~10MB sau flatten, dùng với --papers 1): đo độ tuyến tính của processing / export
+    "huge": {
+        "sections": 400, "paragraphs": 12, "sentences": 10, "table_rows": 400,
+        "equations": 12, "nesting_depth": 20, "refs": 150, "junk_files": 0,
+    },
+}
+
+_WORDS = (
+    "model data learning network graph signal theory proof bound estimate kernel "
+    "sample entropy gradient convergence operator manifold spectrum tensor matrix "
+    "random process optimal linear method result analysis system energy field "
+    "quantum state measure function space algorithm approximation error"
+).split()
+
+_SURNAMES = ("Nguyen", "Smith", "Tran", "Garcia", "Kim", "Le", "Muller", "Rossi", "Chen", "Ivanova")
+
+
+class _PaperWriter:
+    """Sinh nội dung LaTeX cho một paper (dùng Random riêng để tái lập được)."""
+
+    def __init__(self, rng: random.Random, params: dict, paper_idx: int):
+        self.rng = rng
+        self.params = params
+        self.paper_idx = paper_idx
+        self.refs = [self._make_ref(i) for i in range(params["refs"])]
+
+    # --- Text helpers ---
+
+    def _words(self, n):
+        return " ".join(self.rng.choice(_WORDS) for _ in range(n))
+
+    def _sentence(self):
+        s = self._words(self.rng.randint(8, 20)).capitalize()
+        roll = self.rng.random()
+        if roll < 0.25 and self.refs:
+            s += " \\cite{%s}" % self.rng.choice(self.refs)["key"]
+        elif roll < 0.45:
+            s += " with $x_{%d}^{2} + \\alpha$" % self.rng.randint(0, 9)
+        elif roll < 0.55:
+            s += ", see Fig. %d and \\textbf{%s}" % (self.rng.randint(1, 9), self._words(2))
+        elif roll < 0.6:
+            s += " (i.e. 3.14 percent, 100\\% sure)"
+        return s + "."
+
+    def _paragraph(self):
+        return " ".join(self._sentence() for _ in range(self.params["sentences"]))
+
+    def _make_ref(self, i):
+        authors = [f"{self.rng.choice(_SURNAMES)}, {chr(65 + self.rng.randint(0, 25))}." for _ in range(self.rng.randint(1, 4))]
+        return {
+            "key": f"ref{self.paper_idx}_{i}",
+            "title": self._words(self.rng.randint(5, 10)).capitalize(),
+            "authors": authors,
+            "year": 1990 + self.rng.randint(0, 34),
+            "arxiv_id": f"{2000 + self.rng.randint(0, 99):04d}.{self.rng.randint(0, 99999):05d}",
+        }
+
+    # --- Block helpers ---
+
+    def _equation(self):
+        kind = self.rng.choice(("equation", "display", "dollars"))
+        body = " + ".join("\\frac{%s}{%d}" % (self.rng.choice("abcxyz"), self.rng.randint(1, 9)) for _ in range(self.rng.randint(2, 6)))
+        if kind == "equation":
+            return "\\begin{equation}\n%s \\label{eq:%d}\n\\end{equation}" % (body, self.rng.randint(0, 10 ** 6))
+        if kind == "display":
+            return "\\[ %s \\]" % body
+        return "$$ %s $$" % body
+
+    def _table(self):
+        rows = self.params["table_rows"]
+        cols = self.rng.randint(3, 6)
+        lines = ["\\begin{table}[htbp]", "\\centering", "\\caption{Results on \\textbf{%s} data}" % self._words(2),
+                 "\\begin{tabular}{%s}" % ("c" * cols), "\\hline"]
+        for _ in range(rows):
+            lines.append(" & ".join(f"{self.rng.random():.4f}" for _ in range(cols)) + " \\\\")
+        lines += ["\\hline", "\\end{tabular}", "\\label{tab:%d}" % self.rng.randint(0, 10 ** 6), "\\end{table}"]
+        return "\n".join(lines)
+
+    def _figure(self):
+        return ("\\begin{figure}[t]\n\\centering\n\\includegraphics[width=0.8\\linewidth]{images/fig%d.png}\n"
+                "\\caption{A {\\em nested {caption {with {braces}}}} about %s}\n\\label{fig:%d}\n\\end{figure}"
+                % (self.rng.randint(0, 99), self._words(3), self.rng.randint(0, 10 ** 6)))
+
+    def _nested_list(self, depth):
+        env = self.rng.choice(("itemize", "enumerate"))
+        items = []
+        for _ in range(self.rng.randint(2, 4)):
+            item = "\\item " + self._sentence()
+            if depth > 1 and self.rng.random() < 0.5:
+                item += "\n" + self._nested_list(depth - 1)
+            items.append(item)
+        return "\\begin{%s}\n%s\n\\end{%s}" % (env, "\n".join(items), env)
+
+    def _deep_braces(self, depth):
+        """Ngoặc nhọn lồng sâu trong title/command (pathological cho brace matching)."""
+        text = self._words(2)
+        for _ in range(depth):
+            text = "\\textbf{%s {%s}}" % (self._words(1), text)
+        return text
+
+    def section_body(self, sec_idx):
+        parts = []
+        for p in range(self.params["paragraphs"]):
+            parts.append(self._paragraph())
+            if p < self.params["equations"]:
+                parts.append(self._equation())
+            if p == 1:
+                parts.append(self._nested_list(3))
+            if p == 2:
+                parts.append(self._figure())
+        if sec_idx % 3 == 0:
+            parts.append(self._table())
+        parts.append("% TODO: rewrite this paragraph \\input{draft_notes}")
+        return "\n\n".join(parts)
+
+    def bibtex(self):
+        entries = []
+        for ref in self.refs:
+            entries.append(
+                "@article{%s,\n  title = {%s},\n  author = {%s},\n  year = {%d},\n  eprint = {%s},\n}\n"
+                % (ref["key"], ref["title"], " and ".join(ref["authors"]), ref["year"], ref["arxiv_id"])
+            )
+        return "\n".join(entries)
+
+    def thebibliography(self):
+        lines = ["\\begin{thebibliography}{%d}" % len(self.refs)]
+        for ref in self.refs:
+            lines.append("\\bibitem{%s} %s. %s. arXiv:%s, %d." % (
+                ref["key"], ", ".join(ref["authors"]), ref["title"], ref["arxiv_id"], ref["year"]))
+        lines.append("\\end{thebibliography}")
+        return "\n".join(lines)
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def _generate_version(writer: _PaperWriter, ver_dir: str, bib_mode: str, version_idx: int, prev_dir: Optional[str]):
+    """Sinh một version. Version > 1 copy version trước rồi sửa khoảng 1/3 số section."""
+    params = writer.params
+    rng = writer.rng
+
+    if prev_dir:
+        shutil.copytree(prev_dir, ver_dir)
+        for sec in range(params["sections"]):
+            if rng.random() < 0.33:
+                _write(os.path.join(ver_dir, "sections", f"sec{sec}.tex"), _section_file(writer, sec))
+        # Thêm 1 đoạn ở cuối phần kết luận để nội dung main.tex khác đi
+        with open(os.path.join(ver_dir, "sections", "conclusion.tex"), "a", encoding="utf-8") as f:
+            f.write("\n\n%% revision v%d\n%s\n" % (version_idx, writer._paragraph()))
+        return
+
+    # --- main.tex ---
+    main = [
+        "%% Generated benchmark paper %d" % writer.paper_idx,
+        "\\documentclass[11pt]{article}",
+        "\\usepackage{amsmath,graphicx}",
+        "\\newcommand{\\R}{\\mathbb{R}}",
+        "\\title{%s}" % writer._deep_braces(3),
+        "\\author{%s}" % " \\and ".join(writer.refs[0]["authors"] if writer.refs else ["Anonymous"]),
+        "\\begin{document}",
+        "\\maketitle",
+        "\\begin{abstract}\n%s\n\\end{abstract}" % writer._paragraph(),
+    ]
+    for sec in range(params["sections"]):
+        main.append("\\input{sections/sec%d}" % sec)
+        _write(os.path.join(ver_dir, "sections", f"sec{sec}.tex"), _section_file(writer, sec))
+
+    # Chuỗi include lồng sâu: appendix -> app1 -> app2 -> ...
+    main.append("\\appendix\n\\include{appendix/app0}")
+    depth = params["nesting_depth"]
+    for d in range(depth):
+        body = "\\subsection{Appendix part %d}\n%s" % (d, writer._paragraph())
+        if d + 1 < depth:
+            body += "\n\\input{appendix/app%d}" % (d + 1)
+        _write(os.path.join(ver_dir, "appendix", f"app{d}.tex"), body)
+
+    main.append("\\input{sections/conclusion}")
+    _write(os.path.join(ver_dir, "sections", "conclusion.tex"), "\\section{Conclusion}\n" + writer._paragraph())
+
+    if bib_mode == "bib":
+        main += ["\\bibliographystyle{plain}", "\\bibliography{refs}"]
+        _write(os.path.join(ver_dir, "refs.bib"), writer.bibtex())
+    elif bib_mode == "bbl":
+        main += ["\\bibliographystyle{plain}", "\\bibliography{refs}"]
+        _write(os.path.join(ver_dir, "main.bbl"), writer.thebibliography())
+    else:
+        main.append(writer.thebibliography())
+    main.append("\\end{document}")
+    _write(os.path.join(ver_dir, "main.tex"), "\n".join(main) + "\n")
+
+    # File nhiễu: dữ liệu hình vẽ, template, response letter
+    for j in range(params["junk_files"]):
+        rows = "\n".join(f"{rng.random():.5f} {rng.random():.5f}" for _ in range(50))
+        _write(os.path.join(ver_dir, "plots", f"data{j}.tex"), "% pgfplots data\n" + rows)
+    _write(os.path.join(ver_dir, "template.tex"),
+           "\\documentclass{article}\n\\begin{document}\nTemplate example.\n\\end{document}\n")
+    _write(os.path.join(ver_dir, "response_letter.tex"),
+           "\\documentclass{letter}\n\\begin{document}\nDear editor.\n\\end{document}\n")
+
+
+def _section_file(writer: _PaperWriter, sec: int) -> str:
+    body = "\\section{%s}\n\\label{sec:%d}\n%s" % (writer._deep_braces(sec % 4), sec, writer.section_body(sec))
+    body += "\n\n\\subsection{%s}\n%s" % (writer._words(3).capitalize(), writer._paragraph())
+    if sec % 2 == 1:
+        body += "\n\n\\subsubsection*{%s}\n%s" % (writer._words(2).capitalize(), writer._paragraph())
+    return body
+
+
+def generate_corpus(output_dir: str, papers: int = 10, versions: int = 2, scale: str = "small",
+                    seed: int = 42, overwrite: bool = False, **overrides) -> dict:
+    """
+    Sinh corpus giả lập theo cấu trúc data_raw.
+
+    Args:
+        output_dir: Thư mục đích (cấu trúc giống data_raw)
+        papers: Số papers
+        versions: Số version mỗi paper
+        scale: Preset kích thước ("small", "medium", "large", "project", "huge")
+        seed: Seed cho random (cùng seed -> cùng corpus)
+        overwrite: Xóa output_dir cũ kể cả khi không phải corpus sinh bởi generate_corpus
+            (mặc định chỉ xóa thư mục rỗng hoặc có file CORPUS_MARKER)
+        **overrides: Ghi đè từng tham số của preset (sections, paragraphs, table_rows...)
+
+    Returns:
+        dict: Thông tin corpus (tham số, số file, tổng bytes)
+
+    Raises:
+        FileExistsError: output_dir không rỗng, không có CORPUS_MARKER và overwrite=False
+    """
+    if scale not in SCALE_PRESETS:
+        raise ValueError(f"Unknown scale '{scale}'. Expected one of {list(SCALE_PRESETS)}")
+    params = dict(SCALE_PRESETS[scale])
+    unknown = set(overrides) - set(params)
+    if unknown:
+        raise ValueError(f"Unknown corpus parameters: {sorted(unknown)}")
+    params.update(overrides)
+
+    if os.path.isdir(output_dir) and os.listdir(output_dir):
+        if not overwrite and not os.path.exists(os.path.join(output_dir, CORPUS_MARKER)):
+            raise FileExistsError(
+                f"Refusing to overwrite non-empty directory '{output_dir}' (not a generated corpus, "
+                f"no {CORPUS_MARKER}); use an empty directory or overwrite=True"
+            )
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    for p in range(papers):
+        rng = random.Random(f"{seed}-{p}")
+        writer = _PaperWriter(rng, params, p)
+        paper_id = f"9901-{p:05d}"
+        paper_dir = os.path.join(output_dir, paper_id)
+        bib_mode = ("bib", "bbl", "embedded")[p % 3]
+
+        prev_dir = None
+        for v in range(1, versions + 1):
+            ver_dir = os.path.join(paper_dir, "tex", f"v{v}")
+            _generate_version(writer, ver_dir, bib_mode, v, prev_dir)
+            prev_dir = ver_dir
+
+        _write(os.path.join(paper_dir, "metadata.json"), json.dumps({
+            "paper_id": paper_id, "title": f"Synthetic paper {p}", "versions": versions
+        }, indent=2))
+        _write(os.path.join(paper_dir, "references.json"), json.dumps({
+            ref["arxiv_id"]: {"title": ref["title"], "authors": ref["authors"], "submission_date": f"{ref['year']}-01-01"}
+            for ref in writer.refs
+        }, indent=2))
+
+    total_files = 0
+    total_bytes = 0
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            total_files += 1
+            total_bytes += os.path.getsize(os.path.join(root, name))
+    _write(os.path.join(output_dir, CORPUS_MARKER), f"generated by src.bench.corpus (seed={seed}, scale={scale})\n")
+
+    return {
+        "path": os.path.abspath(output_dir),
+        "papers": papers,
+        "versions": versions,
+        "scale": scale,
+        "seed": seed,
+        "params": params,
+        "total_files": total_files,
+        "total_bytes": total_bytes,
+    }
@@ -0,0 +1,435 @@
+"""
+Benchmark Runner
+================
+
+Đo thời gian từng stage của pipeline trên một corpus (thật hoặc sinh bởi `corpus.py`).
+
+Mỗi stage được chạy `repeat` lần trên toàn bộ corpus; kết quả (min/median/mean,
+số items, bytes xử lý, throughput) được xuất thành JSON kèm thông tin commit,
+để so sánh giữa các commit bằng `compare_results`.
+
+Example:
+    >>> from src.bench import generate_corpus, run_benchmarks
+    >>> generate_corpus("/tmp/bench_raw", papers=5)
+    >>> results = run_benchmarks("/tmp/bench_raw", repeat=3)
+    >>> print(format_results_table(results))
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from ..parser import LatexFlattener, LatexStructureBuilder, LatexContentProcessor, find_root_tex_file
+from ..utils.tex_cleaner import LatexCleaner
+from ..utils.file_cache import get_default_cache
+from ..matching import ReferenceMatcher
+
+RESULTS_SCHEMA = 1
+
+
+class BenchStage:
+    """
+    Một stage cần benchmark.
+
+    Attributes:
+        name: Tên stage (xuất hiện trong kết quả JSON)
+        run: Hàm được đo thời gian, nhận (ctx, payload) và trả về số items đã xử lý
+        setup: Hàm chuẩn bị payload cho mỗi lần lặp (không tính thời gian), mặc định None
+        size: Hàm trả về số bytes input của stage (để tính throughput), mặc định None
+    """
+
+    def __init__(self, name: str, run: Callable, setup: Optional[Callable] = None, size: Optional[Callable] = None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.size = size
+
+
+class BenchContext:
+    """
+    Dữ liệu dùng chung giữa các stage, được tính lười (lazy) và cache lại.
+    Các stage sau dùng output của stage trước làm input, nhưng phần chuẩn bị không bị tính giờ.
+    """
+
+    def __init__(self, corpus_dir: str):
+        self.corpus_dir = corpus_dir
+        self._cache = {}
+
+    def _get(self, key, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    @property
+    def version_dirs(self) -> List[tuple]:
+        """[(paper_id, version, version_dir), ...]"""
+        def factory():
+            items = []
+            for paper_id in sorted(os.listdir(self.corpus_dir)):
+                tex_dir = os.path.join(self.corpus_dir, paper_id, "tex")
+                if not os.path.isdir(tex_dir):
+                    continue
+                for ver in sorted(os.listdir(tex_dir)):
+                    ver_dir = os.path.join(tex_dir, ver)
+                    if os.path.isdir(ver_dir):
+                        items.append((paper_id, ver, ver_dir))
+            return items
+        return self._get("version_dirs", factory)
+
+    @property
+    def roots(self) -> List[tuple]:
+        """[(paper_id, version, root_file), ...]"""
+        def factory():
+            items = []
+            for paper_id, ver, ver_dir in self.version_dirs:
+                root = find_root_tex_file(ver_dir)
+                if root:
+                    items.append((paper_id, ver, root))
+            return items
+        return self._get("roots", factory)
+
+    @property
+    def flattened(self) -> List[tuple]:
+        """[(paper_id, version, flattened_content), ...]"""
+        def factory():
+            return [
+                (paper_id, ver, LatexFlattener(root, paper_id, ver, emit_markers=False).flatten()["content"])
+                for paper_id, ver, root in self.roots
+            ]
+        return self._get("flattened", factory)
+
+    @property
+    def processed_trees(self) -> List[tuple]:
+        """[(builder, tree), ...] - cây đã tách nội dung (exporter không sửa cây nên dùng chung giữa các lần lặp)"""
+        def factory():
+            items = []
+            for paper_id, ver, content in self.flattened:
+                builder = LatexStructureBuilder(content, paper_id, ver)
+                tree = builder.build_coarse_tree()
+                LatexContentProcessor(paper_id, ver).process_tree(tree)
+                items.append((builder, tree))
+            return items
+        return self._get("processed_trees", factory)
+
+    @property
+    def text_chunks(self) -> List[str]:
+        """Các đoạn văn (tách theo dòng trống) của toàn bộ nội dung đã flatten."""
+        def factory():
+            chunks = []
+            for _, _, content in self.flattened:
+                chunks.extend(c for c in content.split("\n\n") if c.strip())
+            return chunks
+        return self._get("text_chunks", factory)
+
+    @property
+    def ground_truth(self) -> Dict[str, dict]:
+        """{paper_id: references.json}"""
+        def factory():
+            data = {}
+            for paper_id in sorted(os.listdir(self.corpus_dir)):
+                path = os.path.join(self.corpus_dir, paper_id, "references.json")
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        data[paper_id] = json.load(f)
+            return data
+        return self._get("ground_truth", factory)
+
+    @property
+    def reference_queries(self) -> Dict[str, List[str]]:
+        """Query giả lập từ ground truth (xáo trộn từ, bỏ bớt tác giả) cho ReferenceMatcher."""
+        def factory():
+            rng = random.Random(0)
+            queries = {}
+            for paper_id, refs in self.ground_truth.items():
+                items = []
+                for meta in refs.values():
+                    words = (meta.get("title") or "").split()
+                    if len(words) > 3 and rng.random() < 0.5:
+                        words.pop(rng.randrange(len(words)))
+                    authors = " and ".join((meta.get("authors") or [])[:2])
+                    year = (meta.get("submission_date") or "")[:4]
+                    items.append(f"text = {{{authors}. {' '.join(words)}. {year}}}")
+                queries[paper_id] = items
+            return queries
+        return self._get("reference_queries", factory)
+
+
+# =============================================================================
+# STAGE DEFINITIONS
+# =============================================================================
+
+def _run_find_root(ctx, _):
+    for _, _, ver_dir in ctx.version_dirs:
+        find_root_tex_file(ver_dir)
+    return len(ctx.version_dirs)
+
+
+def _run_flatten(ctx, _):
+    for paper_id, ver, root in ctx.roots:
+        # Cấu hình như pipeline: không marker, kèm source map
+        LatexFlattener(root, paper_id, ver, emit_markers=False, build_source_map=True).flatten()
+    return len(ctx.roots)
+
+
+def _run_build_tree(ctx, _):
+    for paper_id, ver, content in ctx.flattened:
+        LatexStructureBuilder(content, paper_id, ver).build_coarse_tree()
+    return len(ctx.flattened)
+
+
+def _setup_coarse_trees(ctx):
+    return [
+        (paper_id, ver, LatexStructureBuilder(content, paper_id, ver).build_coarse_tree())
+        for paper_id, ver, content in ctx.flattened
+    ]
+
+
+def _run_process_tree(ctx, trees):
+    for paper_id, ver, tree in trees:
+        LatexContentProcessor(paper_id, ver).process_tree(tree)
+    return len(trees)
+
+
+def _setup_processed_trees(ctx):
+    return ctx.processed_trees
+
+
+def _run_exporters(ctx, trees):
+    # Markdown / HTML / LaTeX đã clean ghi thẳng vào file (streaming, không dựng chuỗi trong bộ nhớ)
+    with open(os.devnull, "w", encoding="utf-8") as sink:
+        for builder, tree in trees:
+            builder.export_to_markdown(tree, sink)
+            builder.export_to_html(tree, sink)
+            builder.export_cleaned_paper(tree, sink)
+    return len(trees)
+
+
+def _run_cleaner(ctx, _):
+    for chunk in ctx.text_chunks:
+        LatexCleaner.clean_latex(chunk)
+    return len(ctx.text_chunks)
+
+
+def _run_matcher(ctx, _):
+    count = 0
+    for paper_id, gt in ctx.ground_truth.items():
+        matcher = ReferenceMatcher()
+        matcher.fit(gt)
+        for query in ctx.reference_queries.get(paper_id, []):
+            matcher.match(query)
+            count += 1
+    return count
+
+
+def _setup_feature_frame(ctx):
+    import pandas as pd
+
+    rows = []
+    for paper_id, gt in ctx.ground_truth.items():
+        entries = list(gt.items())
+        for i, (arxiv_id, meta) in enumerate(entries):
+            # 1 cặp đúng + 1 cặp sai cho mỗi reference
+            for cand_id, cand in (entries[i], entries[(i + 1) % len(entries)]):
+                rows.append({
+                    "bib_title": meta.get("title", ""), "bib_authors": meta.get("authors", []),
+                    "bib_id": arxiv_id, "bib_year": meta.get("submission_date", "")[:4],
+                    "cand_title": cand.get("title", ""), "cand_authors": cand.get("authors", []),
+                    "cand_id": cand_id, "cand_year": cand.get("submission_date", "")[:4],
+                })
+    return pd.DataFrame(rows)
+
+
+def _run_features(ctx, df):
+    from ..ml.features import extract_features_batch
+
+    # extract_features_batch in progress bar (tqdm) -> tắt output để không làm nhiễu kết quả
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        extract_features_batch(df)
+    return len(df)
+
+
+def _size_version_dirs(ctx):
+    total = 0
+    for _, _, ver_dir in ctx.version_dirs:
+        for root, _, files in os.walk(ver_dir):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files if f.lower().endswith(".tex"))
+    return total
+
+
+def _size_flattened(ctx):
+    return sum(len(content.encode("utf-8")) for _, _, content in ctx.flattened)
+
+
+def _size_chunks(ctx):
+    return sum(len(chunk.encode("utf-8")) for chunk in ctx.text_chunks)
+
+
+STAGES = OrderedDict((stage.name, stage) for stage in (
+    BenchStage("find_root_tex_file", _run_find_root, size=_size_version_dirs),
+    BenchStage("LatexFlattener", _run_flatten, size=_size_flattened),
+    BenchStage("LatexStructureBuilder", _run_build_tree, size=_size_flattened),
+    BenchStage("LatexContentProcessor", _run_process_tree, setup=_setup_coarse_trees, size=_size_flattened),
+    BenchStage("exporters", _run_exporters, setup=_setup_processed_trees, size=_size_flattened),
+    BenchStage("LatexCleaner", _run_cleaner, size=_size_chunks),
+    BenchStage("ReferenceMatcher", _run_matcher),
+    BenchStage("extract_features_batch", _run_features, setup=_setup_feature_frame),
+))
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def _git_commit() -> Optional[str]:
+    """Commit hiện tại của repo (None nếu không lấy được)."""
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_stage(ctx: BenchContext, stage: BenchStage, repeat: int = 3) -> dict:
+    """
+    Chạy một stage `repeat` lần và thống kê thời gian.
+    Cache file nguồn được xóa trước mỗi lần chạy để các lần đo đều là cold read (so sánh được với nhau).
+    """
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        payload = stage.setup(ctx) if stage.setup else None
+        get_default_cache().clear()
+        start = time.perf_counter()
+        items = stage.run(ctx, payload)
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        "status": "ok",
+        "repeat": repeat,
+        "items": items,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "timings": timings,
+    }
+    if stage.size:
+        size = stage.size(ctx)
+        result["bytes"] = size
+        result["mb_per_s"] = (size / 1e6) / result["min"] if result["min"] > 0 else None
+    return result
+
+
+def run_benchmarks(corpus_dir: str, repeat: int = 3, stages: Optional[List[str]] = None,
+                   corpus_info: Optional[dict] = None, verbose: bool = False) -> dict:
+    """
+    Benchmark các stage trên corpus.
+
+    Args:
+        corpus_dir: Thư mục corpus (cấu trúc data_raw)
+        repeat: Số lần lặp mỗi stage
+        stages: Danh sách tên stage cần chạy (None = tất cả)
+        corpus_info: Thông tin corpus (từ generate_corpus) để lưu kèm kết quả
+        verbose: In tiến trình ra console
+
+    Returns:
+        dict: {"schema", "meta": {...}, "stages": {name: {...}}}
+    """
+    selected = stages or list(STAGES)
+    unknown = [s for s in selected if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark stages: {unknown}. Available: {list(STAGES)}")
+
+    ctx = BenchContext(corpus_dir)
+    results = OrderedDict()
+    for name in selected:
+        if verbose:
+            print(f"⏱️  {name} ...", flush=True)
+        try:
+            results[name] = run_stage(ctx, STAGES[name], repeat=repeat)
+        except ImportError as e:
+            # Stage cần dependency tùy chọn (vd: fuzzywuzzy cho features)
+            results[name] = {"status": "skipped", "reason": str(e)}
+        except Exception as e:
+            results[name] = {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+
+    return {
+        "schema": RESULTS_SCHEMA,
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "corpus_dir": os.path.abspath(corpus_dir),
+            "corpus": corpus_info,
+        },
+        "stages": results,
+    }
+
+
+def save_results(results: dict, path: str):
+    """Lưu kết quả benchmark ra file JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def load_results(path: str) -> dict:
+    """Đọc kết quả benchmark đã lưu."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_results(current: dict, baseline: dict, threshold: float = 0.10) -> Dict[str, dict]:
+    """
+    So sánh median của từng stage với một lần chạy trước.
+
+    Returns:
+        dict: {stage: {"baseline": s, "current": s, "ratio": current/baseline, "regression": bool}}
+    """
+    report = OrderedDict()
+    for name, cur in current.get("stages", {}).items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or cur.get("status") != "ok" or base.get("status") != "ok":
+            continue
+        ratio = cur["median"] / base["median"] if base["median"] > 0 else None
+        report[name] = {
+            "baseline": base["median"],
+            "current": cur["median"],
+            "ratio": ratio,
+            "regression": ratio is not None and ratio > 1.0 + threshold,
+        }
+    return report
+
+
+def format_results_table(results: dict, comparison: Optional[Dict[str, dict]] = None) -> str:
+    """Định dạng kết quả benchmark thành bảng text."""
+    meta = results.get("meta", {})
+    lines = [
+        f"Commit: {meta.get('commit')} | Python {meta.get('python')} | repeat={meta.get('repeat')}",
+        f"{'Stage':<26}{'Items':>8}{'Min (s)':>11}{'Median (s)':>12}{'MB/s':>9}{'vs base':>10}",
+        "-" * 76,
+    ]
+    for name, st in results.get("stages", {}).items():
+        if st.get("status") != "ok":
+            lines.append(f"{name:<26}{st.get('status')}: {st.get('reason', '')}"[:160])
+            continue
+        mbps = f"{st['mb_per_s']:.2f}" if st.get("mb_per_s") else "-"
+        delta = "-"
+        if comparison and name in comparison and comparison[name]["ratio"] is not None:
+            delta = f"{comparison[name]['ratio']:.2f}x" + (" ⚠️" if comparison[name]["regression"] else "")
+        lines.append(f"{name:<26}{st['items']:>8}{st['min']:>11.4f}{st['median']:>12.4f}{mbps:>9}{delta:>10}")
+    return "\n".join(lines)
@@ -30,6 +30,17 @@ class PipelineConfig:
         dataset_final: Thư mục chứa dataset cuối cùng
         parallel: Có sử dụng xử lý song song không
         max_workers: Số luồng tối đa (None = auto)
+        executor: Loại executor khi chạy song song ("thread" hoặc "process")
+        chunk_size: Số papers tối đa mỗi task gửi vào executor (None = auto)
+        resume: Bỏ qua papers không đổi (dựa trên manifest.json của lần chạy trước)
+        compact_json: Ghi hierarchy.json dạng compact (không indent)
+        paper_timeout: Thời gian tối đa (giây) cho một paper, vượt quá -> quarantine (None = không giới hạn)
+        max_rss_mb: RSS tối đa (MB) của worker khi xử lý một paper (None = không giới hạn)
+        max_tasks_per_child: Thay worker process mới sau N tasks (None = không thay)
+        version_workers: Số workers xử lý song song các versions trong một paper (None = tuần tự)
+        file_cache_mb: Giới hạn (MB) cache nội dung file nguồn mỗi process (None = mặc định, 0 = tắt)
+        root_cache: Lưu / dùng lại quyết định root file theo fingerprint của version folder
+        flatten_cache: Lưu kết quả phân tích từng file của flatten theo hash nội dung giữa các lần chạy
         matching_threshold: Ngưỡng score cho matching (0.0 - 1.0)
         log_file: Tên file log
     
@@ -55,6 +66,17 @@ class PipelineConfig:
     # Processing
     parallel: bool = True
     max_workers: Optional[int] = None
+    executor: str = "thread"
+    chunk_size: Optional[int] = None
+    resume: bool = True
+    compact_json: bool = False
+    paper_timeout: Optional[float] = None
+    max_rss_mb: Optional[int] = None
+    max_tasks_per_child: Optional[int] = None
+    version_workers: Optional[int] = None
+    file_cache_mb: Optional[float] = None
+    root_cache: bool = True
+    flatten_cache: bool = False
     
     # Matching
     matching_threshold: float = 0.55
@@ -73,6 +95,14 @@ class PipelineConfig:
             self.dataset_final = os.path.join(self.project_root, "dataset_final")
         if self.max_workers is None:
             self.max_workers = os.cpu_count() or 4
+        if self.executor not in ("thread", "process"):
+            raise ValueError(f"executor must be 'thread' or 'process', got: {self.executor}")
+        for name in ("paper_timeout", "max_rss_mb", "max_tasks_per_child", "version_workers"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive, got: {value}")
+        if self.file_cache_mb is not None and self.file_cache_mb < 0:
+            raise ValueError(f"file_cache_mb must be >= 0, got: {self.file_cache_mb}")
     
     def get_paper_raw_path(self, paper_id: str) -> str:
         """Lấy đường dẫn tới folder paper trong data_raw."""
@@ -114,6 +144,17 @@ class PipelineConfig:
             "dataset_final": self.dataset_final,
             "parallel": self.parallel,
             "max_workers": self.max_workers,
+            "executor": self.executor,
+            "chunk_size": self.chunk_size,
+            "resume": self.resume,
+            "compact_json": self.compact_json,
+            "paper_timeout": self.paper_timeout,
+            "max_rss_mb": self.max_rss_mb,
+            "max_tasks_per_child": self.max_tasks_per_child,
+            "version_workers": self.version_workers,
+            "file_cache_mb": self.file_cache_mb,
+            "root_cache": self.root_cache,
+            "flatten_cache": self.flatten_cache,
             "matching_threshold": self.matching_threshold,
             "log_file": self.log_file,
             "log_level": self.log_level
@@ -127,6 +168,11 @@ class PipelineConfig:
   Dataset Final:   {self.dataset_final}
   Parallel:        {self.parallel}
   Max Workers:     {self.max_workers}
+  Executor:        {self.executor}
+  Resume:          {self.resume}
+  Compact JSON:    {self.compact_json}
+  Paper Timeout:   {self.paper_timeout}
+  Max RSS (MB):    {self.max_rss_mb}
   Match Threshold: {self.matching_threshold}
 """
 
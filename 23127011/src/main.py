@@ -14,11 +14,29 @@ Chạy pipeline từ command line:
     # Chạy song song với 8 threads
     python -m src.main --raw ./data_raw --output ./data_output --parallel --workers 8
 
+    # Chạy song song với 16 processes (tận dụng nhiều core, tránh GIL)
+    python -m src.main --raw ./data_raw --output ./data_output --parallel --workers 16 --executor process
+
+    # Xử lý lại toàn bộ (mặc định chỉ xử lý papers mới/thay đổi/lỗi)
+    python -m src.main --raw ./data_raw --output ./data_output --force
+
+    # Ghi hierarchy.json dạng compact (không indent, file nhỏ hơn)
+    python -m src.main --raw ./data_raw --output ./data_output --compact-json
+
+    # Giới hạn 300s & 4GB RSS mỗi paper, thay worker sau 50 tasks (paper vi phạm -> quarantine.json)
+    python -m src.main --raw ./data_raw --output ./data_output --parallel --paper-timeout 300 --max-rss-mb 4096 --max-tasks-per-child 50
+
+    # Xử lý song song các versions trong từng paper (paper nhiều versions không còn chạy trên 1 core)
+    python -m src.main --raw ./data_raw --output ./data_output --version-workers 4
+
     # Chỉ chạy matching (đã có data processed)
     python -m src.main --output ./data_output --matching-only
 
     # Merge labels thành dataset
     python -m src.main --merge --yymm 2403 --limit 50
+
+    # Benchmark các stage trên corpus giả lập, lưu kết quả JSON để so sánh giữa các commit
+    python -m src.main bench --papers 20 --scale medium --json bench.json --compare bench_old.json
 """
 
 import argparse
@@ -44,18 +62,33 @@ def get_project_paths():
 def cmd_process(args):
     """Chạy Phase 1: Pre-processing & Parsing."""
     from .pipeline import run_processing_pipeline
+    from .utils.metrics import format_latency
     
     print(f"📂 Input:  {args.raw}")
     print(f"📂 Output: {args.output}")
-    print(f"⚙️  Parallel: {args.parallel} | Workers: {args.workers or 'auto'}")
+    print(f"⚙️  Parallel: {args.parallel} | Workers: {args.workers or 'auto'} | Executor: {args.executor}")
     print()
     
-    run_processing_pipeline(
+    result = run_processing_pipeline(
         data_raw_path=args.raw,
         data_output_path=args.output,
         parallel=args.parallel,
-        max_workers=args.workers
+        max_workers=args.workers,
+        executor=args.executor,
+        chunk_size=args.chunk_size,
+        resume=not args.force,
+        compact_json=args.compact_json,
+        paper_timeout=args.paper_timeout,
+        max_rss_mb=args.max_rss_mb,
+        max_tasks_per_child=args.max_tasks_per_child,
+        version_workers=args.version_workers,
+        file_cache_mb=args.file_cache_mb,
+        root_cache=not args.no_root_cache,
+        flatten_cache=args.flatten_cache
     )
+    if result["quarantined"]:
+        print(f"   ☣️  {len(result['quarantined'])} papers quarantined (xem quarantine.json)")
+    print(f"   {format_latency(result['latency'])}")
     print("✅ Phase 1 Complete!")
 
 
@@ -79,6 +112,17 @@ def cmd_full(args):
         data_output=args.output,
         parallel=args.parallel,
         max_workers=args.workers,
+        executor=args.executor,
+        chunk_size=args.chunk_size,
+        resume=not args.force,
+        compact_json=args.compact_json,
+        paper_timeout=args.paper_timeout,
+        max_rss_mb=args.max_rss_mb,
+        max_tasks_per_child=args.max_tasks_per_child,
+        version_workers=args.version_workers,
+        file_cache_mb=args.file_cache_mb,
+        root_cache=not args.no_root_cache,
+        flatten_cache=args.flatten_cache,
         run_matching=not args.no_matching,
         verbose=True
     )
@@ -120,7 +164,99 @@ def cmd_merge(args):
     print()
 
 
+def cmd_bench(args):
+    """Chạy benchmark các stage trên corpus giả lập (hoặc corpus có sẵn)."""
+    import shutil
+    import tempfile
+    from .bench import (generate_corpus, run_benchmarks, save_results, load_results,
+                        compare_results, format_results_table)
+
+    corpus_info = None
+    cleanup_dir = None
+    if args.corpus:
+        corpus_dir = args.corpus
+        print(f"📂 Corpus: {corpus_dir}")
+    else:
+        corpus_dir = args.workdir or tempfile.mkdtemp(prefix="latex_bench_")
+        if not args.workdir and not args.keep:
+            cleanup_dir = corpus_dir
+        try:
+            # Thư mục tạm do mkdtemp tạo -> luôn ghi đè được; --workdir của người dùng chỉ khi rỗng,
+            # là corpus bench trước đó (có CORPUS_MARKER), hoặc có --overwrite
+            corpus_info = generate_corpus(
+                corpus_dir, papers=args.papers, versions=args.versions, scale=args.scale, seed=args.seed,
+                overwrite=not args.workdir or args.overwrite
+            )
+        except FileExistsError as e:
+            print(f"❌ {e}. Chọn --workdir khác hoặc thêm --overwrite.")
+            return 1
+        print(f"🧪 Generated corpus: {corpus_info['papers']} papers x {corpus_info['versions']} versions "
+              f"({corpus_info['total_files']} files, {corpus_info['total_bytes'] / 1e6:.2f} MB) -> {corpus_dir}")
+
+    try:
+        results = run_benchmarks(corpus_dir, repeat=args.repeat, stages=args.stages,
+                                 corpus_info=corpus_info, verbose=True)
+    finally:
+        if cleanup_dir:
+            shutil.rmtree(cleanup_dir, ignore_errors=True)
+
+    comparison = None
+    if args.compare:
+        baseline = load_results(args.compare)
+        comparison = compare_results(results, baseline, threshold=args.threshold)
+        if baseline.get("meta", {}).get("corpus") != results["meta"]["corpus"]:
+            print("⚠️  Baseline được chạy trên corpus khác (tham số khác) -> so sánh có thể không chính xác")
+
+    print()
+    print(format_results_table(results, comparison))
+
+    if args.json:
+        save_results(results, args.json)
+        print(f"\n💾 Results saved to: {args.json}")
+
+    if comparison and any(c["regression"] for c in comparison.values()):
+        print(f"\n⚠️  Regression > {args.threshold:.0%} detected (so với {args.compare})")
+        return 2
+    return 0
+
+
+def build_bench_parser():
+    """Parser cho subcommand `bench`."""
+    from .bench import SCALE_PRESETS, STAGES
+
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main bench",
+        description="Benchmark các stage của pipeline trên corpus arXiv giả lập"
+    )
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="Dùng corpus có sẵn (cấu trúc data_raw) thay vì sinh corpus giả lập")
+    parser.add_argument("--workdir", type=str, default=None,
+                        help="Thư mục sinh corpus (default: thư mục tạm, tự xóa sau khi chạy). "
+                             "Thư mục không rỗng chỉ bị ghi đè nếu là corpus bench trước đó hoặc có --overwrite")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Cho phép xóa --workdir không rỗng (không phải corpus bench) trước khi sinh corpus")
+    parser.add_argument("--keep", action="store_true", help="Giữ lại corpus tạm sau khi chạy")
+    parser.add_argument("--papers", type=int, default=10, help="Số papers giả lập (default: 10)")
+    parser.add_argument("--versions", type=int, default=2, help="Số versions mỗi paper (default: 2)")
+    parser.add_argument("--scale", type=str, choices=list(SCALE_PRESETS), default="small",
+                        help="Kích thước mỗi paper (default: small)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed sinh corpus (default: 42)")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần lặp mỗi stage (default: 3)")
+    parser.add_argument("--stages", type=str, nargs="+", choices=list(STAGES), default=None,
+                        help="Chỉ chạy các stage này (default: tất cả)")
+    parser.add_argument("--json", type=str, default=None, help="Lưu kết quả ra file JSON")
+    parser.add_argument("--compare", type=str, default=None, help="So sánh với file kết quả JSON trước đó")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Ngưỡng chậm hơn bị coi là regression (default: 0.10 = 10%%)")
+    return parser
+
+
 def main():
+    # Subcommand `bench` có bộ tham số riêng
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        args = build_bench_parser().parse_args(sys.argv[2:])
+        sys.exit(cmd_bench(args))
+
     parser = argparse.ArgumentParser(
         description="LaTeX Paper Processing Pipeline",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -132,11 +268,17 @@ Examples:
   # Processing only (no matching)
   python -m src.main --raw ./data_raw --output ./data_output --no-matching
   
+  # Process-based parallelism (scales with CPU cores)
+  python -m src.main --raw ./data_raw --output ./data_output --parallel --executor process
+  
   # Matching only (data already processed)
   python -m src.main --output ./data_output --matching-only
   
   # Merge labels into dataset
   python -m src.main --merge --yymm 2403 --limit 50
+  
+  # Benchmark stages on a synthetic corpus (see: python -m src.main bench --help)
+  python -m src.main bench --papers 20 --scale medium --json bench.json
         """
     )
     
@@ -181,6 +323,69 @@ Examples:
         default=None,
         help="Số workers cho parallel processing (default: số CPU)"
     )
+    parser.add_argument(
+        "--executor", "-e",
+        type=str,
+        choices=["thread", "process"],
+        default="thread",
+        help="Loại executor khi chạy song song: thread hoặc process (default: thread)"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Số papers tối đa mỗi task; chỉ papers nhỏ được gom, papers lớn chạy riêng & submit trước (default: auto)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Xử lý lại toàn bộ papers, bỏ qua manifest của lần chạy trước"
+    )
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help="Ghi hierarchy.json dạng compact (không indent)"
+    )
+    parser.add_argument(
+        "--paper-timeout",
+        type=float,
+        default=None,
+        help="Thời gian tối đa (giây) cho một paper; vượt quá -> kill worker & quarantine (default: không giới hạn)"
+    )
+    parser.add_argument(
+        "--max-rss-mb",
+        type=int,
+        default=None,
+        help="RSS tối đa (MB) của worker khi xử lý một paper; vượt quá -> kill & quarantine (default: không giới hạn)"
+    )
+    parser.add_argument(
+        "--max-tasks-per-child",
+        type=int,
+        default=None,
+        help="Thay worker process mới sau N tasks (default: không thay)"
+    )
+    parser.add_argument(
+        "--version-workers",
+        type=int,
+        default=None,
+        help="Số workers xử lý song song các versions trong một paper (default: tuần tự)"
+    )
+    parser.add_argument(
+        "--file-cache-mb",
+        type=float,
+        default=None,
+        help="Giới hạn (MB) cache nội dung file nguồn mỗi process, 0 = tắt (default: 64)"
+    )
+    parser.add_argument(
+        "--no-root-cache",
+        action="store_true",
+        help="Không dùng/ghi cache quyết định root file (data_output/.root_cache), luôn chấm điểm lại"
+    )
+    parser.add_argument(
+        "--flatten-cache",
+        action="store_true",
+        help="Lưu kết quả phân tích từng file của flatten theo hash nội dung (data_output/.flatten_cache) giữa các lần chạy"
+    )
     parser.add_argument(
         "--no-matching",
         action="store_true",
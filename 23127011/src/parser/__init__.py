@@ -1,2 +1,11 @@
-from .file_loader import find_root_tex_file, build_dependency_map
+from .file_loader import find_root_tex_file, decide_root_tex_file, build_dependency_map
+from .file_index import VersionFileIndex
+from .root_cache import RootDecisionCache, ROOT_CACHE_DIRNAME
+from .source_archive import SourceArchive, list_version_sources, is_source_archive
+from .flatten_cache import FlattenSegmentStore, FLATTEN_CACHE_DIRNAME, split_flatten_segments
+from .source_map import SourceMap
+from .hierarchy_node import HierarchyNode
+from .node_ids import NodeIdFactory
+from .tex_tokenizer import TexTokens, tokenize
 from .tex_parser import LatexFlattener, LatexStructureBuilder, LatexContentProcessor
+from .tex_parser import ContentProcessingVisitor, MarkdownExportVisitor, HtmlExportVisitor, CleanedLatexVisitor
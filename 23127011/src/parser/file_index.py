@@ -0,0 +1,282 @@
+"""
+Version File Index
+==================
+
+Index các file nguồn của một version, dựng bằng một lần `os.scandir` duy nhất
+(hoặc một lượt đọc streaming nếu version là archive .tar/.tar.gz/.zip, xem `SourceArchive`).
+
+Root detection, `LatexFlattener` và `ReferenceProcessor` đều đọc file qua index này,
+nên mỗi file nguồn chỉ được mở đúng một lần cho mỗi version:
+    - content: nội dung file (utf-8, bỏ qua byte lỗi), đọc lazily rồi cache
+    - stripped: nội dung đã xóa comment (% không đi sau \\)
+    - include targets: các file được gọi bằng \\input / \\include / \\subfile
+
+Nội dung được đọc qua `SourceFileCache` (dùng chung giữa các versions): file giống hệt nhau
+ở các versions khác nhau chỉ giữ một bản, stripped / include targets chỉ tính một lần.
+
+Đây là lớp file ảo của Phase 1: mọi thao tác đọc / kiểm tra tồn tại / kích thước đi qua index,
+nên root detection, flatten và references không phân biệt thư mục hay archive.
+
+Example:
+    >>> index = VersionFileIndex("data_raw/2403-00530/tex/v1")   # hoặc ".../tex/v1.tar.gz"
+    >>> root = find_root_tex_file(index.root, file_index=index)
+    >>> LatexFlattener(root, pid, "v1", file_index=index).flatten()
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+from ..utils.file_cache import SourceFileCache, get_default_cache
+from .source_archive import SourceArchive, is_source_archive
+
+# Các thư mục không cần quét để tối ưu tốc độ
+BLOCKLIST_DIRS = {'.git', 'images', 'figures', '__pycache__', 'node_modules', 'media'}
+
+REGEX_COMMENT = re.compile(r'(?<!\\)%.*')
+REGEX_INCLUDE_TARGET = re.compile(r'\\(?:input|include|subfile)(?:\[.*?\])?\{([^}]+)\}')
+
+# Kích thước mỗi lần đọc khi quét streaming file lớn (ký tự)
+STREAM_CHUNK_CHARS = 1 << 20
+
+
+def _strip_comments(text: str) -> str:
+    return REGEX_COMMENT.sub('', text)
+
+
+class VersionFileIndex:
+    """
+    Danh sách file của một version folder kèm cache nội dung.
+
+    Attributes:
+        root: Đường dẫn tuyệt đối tới version folder (hoặc archive; file bên trong có đường dẫn ảo root/member)
+        archive: SourceArchive nếu version là archive, ngược lại None
+        tex_files: Các file .tex (đường dẫn tuyệt đối) theo thứ tự duyệt top-down như os.walk
+        file_names: Tên (basename) của mọi file trong cây (dùng cho dấu hiệu .bbl/.bib/.log)
+        top_level_files: [(name, path, size)] các file nằm ngay trong root (theo thứ tự scandir)
+        file_entries: DirEntry của mọi file trong cây (stat lazily, dùng cho listing())
+    """
+
+    def __init__(self, version_dir: str, cache: Optional[SourceFileCache] = None):
+        self.root = os.path.abspath(version_dir)
+        self.cache = cache or get_default_cache()
+        self.archive = SourceArchive(self.root, skip_dirs=BLOCKLIST_DIRS) if is_source_archive(self.root) else None
+        self.tex_files: List[str] = []
+        self.file_names = set()
+        self.top_level_files = []
+        self.file_entries = []
+        self._sizes: Dict[str, int] = {}
+        self._content: Dict[str, Optional[str]] = {}
+        self._stripped: Dict[str, str] = {}
+        self._heads: Dict[str, str] = {}
+        self._includes: Dict[str, List[str]] = {}
+        self._dependency_map = None
+        self._name_to_path = None
+        if self.archive is not None:
+            self._scan_archive()
+        else:
+            self._scan()
+
+    def _scan(self):
+        """Một lượt scandir top-down (cùng thứ tự với os.walk), bỏ qua BLOCKLIST_DIRS."""
+        stack = [self.root]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+
+            subdirs = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    if entry.name not in BLOCKLIST_DIRS:
+                        subdirs.append(entry.path)
+                    continue
+
+                path = entry.path
+                self.file_names.add(entry.name)
+                self.file_entries.append(entry)
+                if entry.name.lower().endswith('.tex'):
+                    self.tex_files.append(path)
+                if current == self.root:
+                    try:
+                        size = entry.stat().st_size
+                    except OSError:
+                        continue
+                    self._sizes[path] = size
+                    self.top_level_files.append((entry.name, path, size))
+
+            # Duyệt các thư mục con theo đúng thứ tự scandir
+            stack.extend(reversed(subdirs))
+
+    def _scan_archive(self):
+        """Liệt kê members của archive theo cùng thứ tự top-down như _scan."""
+        for rel_path in self.archive.walk():
+            path = os.path.join(self.root, *rel_path.split('/'))
+            name = rel_path.rpartition('/')[2]
+            self.file_names.add(name)
+            if name.lower().endswith('.tex'):
+                self.tex_files.append(path)
+            if '/' not in rel_path:
+                size = self.archive.size(rel_path)
+                self._sizes[path] = size
+                self.top_level_files.append((name, path, size))
+
+    def _member(self, path: str) -> str:
+        """relpath của path (đã abspath) bên trong archive."""
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def listing(self) -> List[tuple]:
+        """
+        [(relpath, size, mtime_ns)] của mọi file trong cây (sắp xếp theo relpath).
+        Chỉ stat, không đọc nội dung -> dùng làm fingerprint cho version folder.
+        """
+        if self.archive is not None:
+            return sorted((rel_path, member.size, member.mtime_ns)
+                          for rel_path, member in self.archive.members.items())
+        items = []
+        for entry in self.file_entries:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            rel_path = os.path.relpath(entry.path, self.root).replace(os.sep, '/')
+            items.append((rel_path, st.st_size, st.st_mtime_ns))
+        items.sort()
+        return items
+
+    def read(self, path: str) -> Optional[str]:
+        """Nội dung file (cache); None nếu không tồn tại / không đọc được."""
+        path = os.path.abspath(path)
+        if path not in self._content:
+            if self.archive is not None:
+                data = self.archive.read(self._member(path))
+                self._content[path] = None if data is None else self.cache.read_text(path, data=data)
+            else:
+                self._content[path] = self.cache.read_text(path)
+        return self._content[path]
+
+    def head(self, path: str, limit: int) -> Optional[str]:
+        """
+        `limit` ký tự đầu của file, kèm include targets của cả file trong cùng một lượt đọc.
+
+        File nhỏ (<= limit), đã có trong cache, hoặc nằm trong archive -> đọc cả file qua read().
+        File lớn hơn: phần đầu được giữ lại, phần còn lại chỉ được quét streaming để lấy include targets
+        (không cache) -> file dữ liệu / hình vẽ lớn không bị giữ trong bộ nhớ.
+        """
+        path = os.path.abspath(path)
+        size = None if path in self._content or self.archive is not None else self.size(path)
+        if size is None or size <= limit:
+            content = self.read(path)
+            return content[:limit] if content is not None else None
+        if path in self._heads:
+            return self._heads[path]
+
+        targets = []
+        try:
+            # Cùng cách decode với SourceFileCache (bỏ byte lỗi, chuẩn hóa xuống dòng)
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                head = f.read(limit)
+                # Cắt tại xuống dòng cuối cùng: include target không nằm vắt qua hai dòng
+                carry = head
+                while True:
+                    chunk = f.read(STREAM_CHUNK_CHARS)
+                    text = carry + chunk
+                    if not chunk:
+                        targets.extend(REGEX_INCLUDE_TARGET.findall(text))
+                        break
+                    cut = text.rfind('\n') + 1
+                    targets.extend(REGEX_INCLUDE_TARGET.findall(text, 0, cut))
+                    carry = text[cut:]
+        except OSError:
+            return None
+        self._heads[path] = head
+        self._includes.setdefault(path, targets)
+        return head
+
+    def _data(self, path: str) -> Optional[bytes]:
+        """Nội dung có sẵn trong bộ nhớ (member của archive) để truyền cho cache; None với thư mục."""
+        return self.archive.read(self._member(path)) if self.archive is not None else None
+
+    def derive(self, path: str, name: str, func):
+        """Giá trị dẫn xuất func(content) của file, cache theo hash nội dung (None nếu không đọc được)."""
+        path = os.path.abspath(path)
+        if self.read(path) is None:
+            return None
+        return self.cache.derive(path, name, func, data=self._data(path))
+
+    def stripped(self, path: str) -> Optional[str]:
+        """Nội dung đã xóa comment LaTeX (cache)."""
+        path = os.path.abspath(path)
+        if path not in self._stripped:
+            if self.read(path) is None:
+                return None
+            self._stripped[path] = self.cache.derive(path, "stripped", _strip_comments, data=self._data(path))
+        return self._stripped[path]
+
+    def include_targets(self, path: str) -> List[str]:
+        """Tên các file được gọi bằng \\input / \\include / \\subfile (quét trên nội dung gốc)."""
+        path = os.path.abspath(path)
+        if path not in self._includes:
+            if self.read(path) is None:
+                self._includes[path] = []
+            else:
+                self._includes[path] = self.cache.derive(path, "includes", REGEX_INCLUDE_TARGET.findall,
+                                                         data=self._data(path))
+        return self._includes[path]
+
+    def included_files(self, path: str) -> List[str]:
+        """Các file .tex trong version được `path` gọi (theo basename, như bản đồ phụ thuộc)."""
+        if self._name_to_path is None:
+            self._name_to_path = {os.path.basename(p): p for p in self.tex_files}
+        children = []
+        for match in self.include_targets(path):
+            child_name = os.path.basename(match.strip())
+            if not child_name.lower().endswith('.tex'):
+                child_name += '.tex'
+            child_path = self._name_to_path.get(child_name)
+            if child_path:
+                children.append(child_path)
+        return children
+
+    def dependency_map(self, parents: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """
+        Bản đồ phụ thuộc: { 'child_full_path': ['parent_full_path', ...] } (cache).
+        parents: chỉ quét include của các file này (mặc định: mọi file .tex, không cache khi có parents).
+        """
+        if parents is None and self._dependency_map is not None:
+            return self._dependency_map
+
+        dependency_map = {}
+        for parent_path in (self.tex_files if parents is None else parents):
+            for child_path in self.included_files(parent_path):
+                dependency_map.setdefault(child_path, []).append(parent_path)
+
+        if parents is None:
+            self._dependency_map = dependency_map
+        return dependency_map
+
+    def exists(self, path: str) -> bool:
+        """File có tồn tại không (trong archive hoặc trên đĩa)."""
+        path = os.path.abspath(path)
+        if self.archive is not None:
+            return self.archive.exists(self._member(path))
+        return os.path.exists(path)
+
+    def size(self, path: str) -> Optional[int]:
+        """Kích thước file (bytes); stat lazily nếu file không nằm ở top-level."""
+        path = os.path.abspath(path)
+        if path not in self._sizes:
+            if self.archive is not None:
+                return self.archive.size(self._member(path))
+            try:
+                self._sizes[path] = os.path.getsize(path)
+            except OSError:
+                return None
+        return self._sizes[path]
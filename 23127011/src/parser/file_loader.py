@@ -1,180 +1,264 @@
 import os
 import re
 
-# Các thư mục không cần quét để tối ưu tốc độ
-BLOCKLIST_DIRS = {'.git', 'images', 'figures', '__pycache__', 'node_modules', 'media'}
+from .file_index import VersionFileIndex, BLOCKLIST_DIRS, REGEX_COMMENT
 
-def build_dependency_map(folder_path):
+# Tên file gốc chuẩn (điểm cộng & tie-breaker)
+PRIO_NAMES = ['main.tex', 'ms.tex', 'paper.tex', 'article.tex']
+
+# Tổng điểm nội dung tối đa của get_score: documentclass, begin{document}, bibliography,
+# maketitle, abstract, inputs (tối đa 30)
+CONTENT_MAX_SCORE = 20 + 20 + 15 + 10 + 10 + 30
+
+# Chênh lệch điểm dưới mức này được coi là hòa (tie-breaker) -> dừng sớm cần hơn ít nhất mức này
+EARLY_EXIT_MARGIN = 5
+
+# Chỉ đọc phần đầu file để kiểm tra \documentclass (gatekeeper)
+SCORE_PREFIX_CHARS = 16 * 1024
+
+# Ngân sách quét mỗi version: thư mục chứa hàng nghìn file .tex dữ liệu / hình vẽ
+SCAN_MAX_FILES = 2000
+SCAN_MAX_BYTES = 64 * 1024 * 1024
+
+def build_dependency_map(folder_path, file_index=None):
     """
     Xây dựng bản đồ phụ thuộc: File nào bị file nào gọi?
     Trả về dict: { 'child_full_path': ['parent_full_path'] }
+
+    file_index: VersionFileIndex của folder (dùng lại nội dung đã đọc); None -> tự tạo
+    """
+    index = file_index or VersionFileIndex(folder_path)
+    return index.dependency_map()
+
+def get_score(file_path, content, context_files, dependency_map, clean_content=None, breakdown=None):
+    """
+    Hàm chấm điểm logic LaTeX chuẩn
+
+    breakdown: dict (tùy chọn) để ghi lại từng khoản điểm dạng {lý do: điểm}
     """
-    dependency_map = {}
-    name_to_path = {}
-    
-    # 1. Map toàn bộ file .tex trong folder này để tra cứu nhanh
-    for root, dirs, files in os.walk(folder_path):
-        dirs[:] = [d for d in dirs if d not in BLOCKLIST_DIRS]
-        for f in files:
-            if f.lower().endswith('.tex'):
-                full_path = os.path.join(root, f)
-                name_to_path[f] = full_path
-
-    # 2. Quét nội dung để tìm quan hệ cha-con
-    for root, dirs, files in os.walk(folder_path):
-        dirs[:] = [d for d in dirs if d not in BLOCKLIST_DIRS]
-        for file in files:
-            if not file.lower().endswith('.tex'): continue
-            
-            parent_path = os.path.join(root, file)
-            try:
-                with open(parent_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    # Tìm lệnh \input, \include, \subfile
-                    # Regex bắt: \input{filename}
-                    matches = re.findall(r'\\(?:input|include|subfile)(?:\[.*?\])?\{([^}]+)\}', content)
-                    
-                    for match in matches:
-                        child_name = os.path.basename(match.strip())
-                        if not child_name.lower().endswith('.tex'): 
-                            child_name += '.tex'
-                        
-                        # Nếu file con tồn tại trong danh sách file của folder
-                        if child_name in name_to_path:
-                            child_path = name_to_path[child_name]
-                            
-                            # Ghi nhận: child_path bị gọi bởi parent_path
-                            if child_path not in dependency_map:
-                                dependency_map[child_path] = []
-                            dependency_map[child_path].append(parent_path)
-            except:
-                pass
-                
-    return dependency_map
-
-def get_score(file_path, content, context_files, dependency_map):
-    """Hàm chấm điểm logic LaTeX chuẩn"""
     filename = os.path.basename(file_path)
     base_name = os.path.splitext(filename)[0]
-    clean_content = re.sub(r'%.*', '', content) # Xóa comment
+    if clean_content is None:
+        clean_content = REGEX_COMMENT.sub('', content) # Xóa comment
     
     score = 0
+
+    def add(reason, points):
+        nonlocal score
+        score += points
+        if breakdown is not None:
+            breakdown[reason] = points
     
     # --- 1. CẤU TRÚC BẮT BUỘC (GATEKEEPER) ---
     # Nếu không có documentclass -> Loại ngay (Theo yêu cầu bỏ Plain TeX)
     if r'\documentclass' not in clean_content:
+        if breakdown is not None:
+            breakdown["no \\documentclass"] = -1000
         return -1000 
     
     # Có documentclass là đạt yêu cầu cơ bản
-    score += 20
+    add("\\documentclass", 20)
     
     if r'\begin{document}' in clean_content:
-        score += 20
+        add("\\begin{document}", 20)
         
     # --- 2. DEPENDENCY CHECK (QUAN TRỌNG) ---
     # Nếu file này bị file khác gọi -> Nó là file con -> Trừ điểm cực nặng
     if file_path in dependency_map:
         # Trừ 50 điểm cho mỗi lần bị gọi
-        score -= 50 * len(dependency_map[file_path])
+        add("included by other files", -50 * len(dependency_map[file_path]))
 
     # --- 3. DẤU HIỆU "VỆ TINH" (FORENSICS) ---
     # File .bbl sinh ra trùng tên file gốc -> Dấu hiệu mạnh nhất
-    if f"{base_name}.bbl" in context_files: score += 60
-    if f"{base_name}.bib" in context_files: score += 20
-    if f"{base_name}.log" in context_files: score += 30
+    if f"{base_name}.bbl" in context_files: add(f"{base_name}.bbl", 60)
+    if f"{base_name}.bib" in context_files: add(f"{base_name}.bib", 20)
+    if f"{base_name}.log" in context_files: add(f"{base_name}.log", 30)
     
     # --- 4. NỘI DUNG ---
-    if r'\bibliography' in clean_content or r'\begin{thebibliography}' in clean_content: score += 15
-    if r'\maketitle' in clean_content: score += 10
-    if r'\begin{abstract}' in clean_content: score += 10
+    if r'\bibliography' in clean_content or r'\begin{thebibliography}' in clean_content: add("bibliography", 15)
+    if r'\maketitle' in clean_content: add("\\maketitle", 10)
+    if r'\begin{abstract}' in clean_content: add("abstract", 10)
     
     # Đếm số lượng file con mà nó gọi (Nhạc trưởng thường gọi nhiều nhạc công)
     input_count = len(re.findall(r'\\(input|include|subfile)\{', clean_content))
-    score += min(input_count * 3, 30) # Max cộng 30 điểm
+    if input_count:
+        add(f"{input_count} inputs", min(input_count * 3, 30)) # Max cộng 30 điểm
 
     # --- 5. HEURISTIC TÊN FILE ---
     lower_name = filename.lower()
     
     # Điểm cộng tên chuẩn
-    if lower_name in ['main.tex', 'ms.tex', 'paper.tex', 'article.tex']: 
-        score += 10
+    if lower_name in PRIO_NAMES: 
+        add("standard name", 10)
     
     # Điểm trừ tên file rác/template
     if any(x in lower_name for x in ['template', 'sample', 'example']) and score < 60:
-        score -= 10
+        add("template name", -10)
     if 'response' in lower_name or 'reply' in lower_name or 'letter' in lower_name:
-        score -= 50
+        add("response/letter name", -50)
         
     # Trừ điểm file slide, standalone
-    if r'\documentclass{beamer}' in clean_content: score -= 50
-    if r'\documentclass{standalone}' in clean_content: score -= 20
-    if r'\documentclass{letter}' in clean_content: score -= 50
+    if r'\documentclass{beamer}' in clean_content: add("beamer", -50)
+    if r'\documentclass{standalone}' in clean_content: add("standalone", -20)
+    if r'\documentclass{letter}' in clean_content: add("letter class", -50)
 
     return score
 
-def find_root_tex_file(version_folder_path):
+def score_upper_bound(file_path, context_files):
     """
-    Hàm chính: Tìm file LaTeX gốc trong thư mục version.
+    Điểm tối đa file có thể đạt mà không cần đọc nội dung:
+    dấu hiệu từ tên file & file vệ tinh + toàn bộ điểm nội dung (CONTENT_MAX_SCORE).
+    """
+    filename = os.path.basename(file_path)
+    base_name = os.path.splitext(filename)[0]
+    lower_name = filename.lower()
+
+    bound = CONTENT_MAX_SCORE
+    if f"{base_name}.bbl" in context_files: bound += 60
+    if f"{base_name}.bib" in context_files: bound += 20
+    if f"{base_name}.log" in context_files: bound += 30
+    if lower_name in PRIO_NAMES: bound += 10
+    # Điểm trừ template phụ thuộc điểm hiện tại -> bỏ qua (vẫn là cận trên hợp lệ)
+    if 'response' in lower_name or 'reply' in lower_name or 'letter' in lower_name: bound -= 50
+    return bound
+
+def decide_root_tex_file(version_folder_path, file_index=None, prefix_chars=SCORE_PREFIX_CHARS,
+                         max_files=SCAN_MAX_FILES, max_bytes=SCAN_MAX_BYTES):
+    """
+    Chấm điểm các file .tex và chọn file gốc, kèm lý do.
     Input: Đường dẫn tới folder chứa code (vd: .../tex/version1)
-    Output: Đường dẫn tuyệt đối tới file main.tex (hoặc None nếu không tìm thấy)
+           file_index: VersionFileIndex của folder (None -> tự tạo); mỗi file chỉ được đọc một lần
+           prefix_chars: Chỉ giữ phần đầu này để kiểm tra \\documentclass; phần còn lại chỉ quét streaming
+                         lấy include targets, file không có \\documentclass không bao giờ được đọc toàn bộ
+           max_files / max_bytes: Ngân sách quét mỗi version (số file .tex / tổng bytes)
+    Output: dict {
+                'root': đường dẫn tương đối (so với folder) của file gốc hoặc None,
+                'reason': 'top_score' | 'tie_standard_name' | 'tie_larger_file' | 'no_tex_files' | 'no_candidates',
+                'candidates': [{'file', 'score', 'len', 'breakdown'}] theo thứ tự xếp hạng,
+                'scanned': số file .tex đã quét, 'scored': số file đã chấm điểm đầy đủ,
+                'early_exit': bool, 'budget_exhausted': bool
+            }
+
+    Các ứng viên được chấm theo thứ tự cận trên điểm (score_upper_bound + điểm trừ phụ thuộc) giảm dần;
+    dừng sớm khi ứng viên dẫn đầu hơn cận trên của mọi file còn lại ít nhất EARLY_EXIT_MARGIN điểm
+    (không file nào còn có thể thắng hoặc rơi vào tie-breaker) -> kết quả giống hệt khi chấm toàn bộ,
+    trừ khi vượt ngân sách quét.
     """
-    # 1. Xây dựng bản đồ phụ thuộc trước
-    dep_map = build_dependency_map(version_folder_path)
+    index = file_index or VersionFileIndex(version_folder_path)
+    decision = {'root': None, 'reason': 'no_tex_files', 'candidates': [],
+                'scanned': 0, 'scored': 0, 'early_exit': False, 'budget_exhausted': False}
     
-    # 2. Lấy danh sách toàn bộ file để check vệ tinh (.bbl, .bib)
-    all_files = set()
-    tex_files = []
-    
-    for root, dirs, files in os.walk(version_folder_path):
-        dirs[:] = [d for d in dirs if d not in BLOCKLIST_DIRS]
-        for f in files:
-            all_files.add(f)
-            if f.lower().endswith('.tex'):
-                tex_files.append(os.path.join(root, f))
+    # 1. Danh sách toàn bộ file để check vệ tinh (.bbl, .bib)
+    all_files = index.file_names
+    tex_files = index.tex_files
     
     if not tex_files:
-        return None
+        return decision
+
+    # 2. Quét phần đầu + include targets (streaming), ưu tiên file có cận trên cao, trong ngân sách
+    bounds = {path: score_upper_bound(path, all_files) for path in tex_files}
+    heads = {}
+    bytes_read = 0
+    for path in sorted(tex_files, key=lambda p: -bounds[p]):
+        if len(heads) >= max_files or bytes_read >= max_bytes:
+            decision['budget_exhausted'] = True
+            break
+        head = index.head(path, prefix_chars)
+        if head is not None:
+            heads[path] = head
+            bytes_read += index.size(path) or len(head)
+    decision['scanned'] = len(heads)
 
-    # 3. Chấm điểm từng ứng viên
+    # 3. Xây dựng bản đồ phụ thuộc từ các file đã quét
+    scanned = [path for path in tex_files if path in heads]
+    dep_map = index.dependency_map(parents=scanned)
+
+    # Gatekeeper trên phần đầu file: không có \\documentclass -> không thể là root, không đọc phần còn lại
+    queue = [path for path in scanned if r'\documentclass' in REGEX_COMMENT.sub('', heads[path])]
+    for path in queue:
+        bounds[path] -= 50 * len(dep_map.get(path, []))
+    queue.sort(key=lambda p: -bounds[p])
+
+    # 4. Chấm điểm từng ứng viên, dừng sớm khi không file nào còn lại có thể bắt kịp
+    order = {path: i for i, path in enumerate(tex_files)}
     candidates = []
-    for path in tex_files:
-        try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                score = get_score(path, content, all_files, dep_map)
-                
-                # Chỉ lấy ứng viên có điểm dương hoặc ít nhất không bị loại (-1000)
-                if score > -100:
-                    candidates.append({
-                        'path': path, 
-                        'name': os.path.basename(path),
-                        'score': score, 
-                        'len': len(content)
-                    })
-        except:
-            pass
+    for path in queue:
+        if candidates and max(c['score'] for c in candidates) - bounds[path] >= EARLY_EXIT_MARGIN:
+            decision['early_exit'] = True
+            break
+        content = index.read(path)
+        if content is None:
+            continue
+        breakdown = {}
+        score = get_score(path, content, all_files, dep_map, clean_content=index.stripped(path),
+                          breakdown=breakdown)
+        decision['scored'] += 1
+        
+        # Chỉ lấy ứng viên có điểm dương hoặc ít nhất không bị loại (-1000)
+        if score > -100:
+            candidates.append({
+                'path': path, 
+                'name': os.path.basename(path),
+                'score': score, 
+                'len': len(content),
+                'breakdown': breakdown
+            })
 
     if not candidates:
-        return None
+        decision['reason'] = 'no_candidates'
+        return decision
     
-    # 4. Sắp xếp: Ưu tiên Điểm cao -> Sau đó đến độ dài nội dung
+    # 5. Sắp xếp: Ưu tiên Điểm cao -> Sau đó đến độ dài nội dung (bằng nhau -> theo thứ tự duyệt)
+    candidates.sort(key=lambda x: order[x['path']])
     candidates.sort(key=lambda x: (x['score'], x['len']), reverse=True)
+    winner, reason = candidates[0], 'top_score'
     
-    # 5. Xử lý Tie-breaker (nếu Top 1 và Top 2 điểm bằng nhau)
+    # 6. Xử lý Tie-breaker (nếu Top 1 và Top 2 điểm bằng nhau)
     if len(candidates) >= 2:
         top1 = candidates[0]
         top2 = candidates[1]
         
         # Nếu điểm chênh lệch không đáng kể (< 5)
-        if (top1['score'] - top2['score']) < 5:
+        if (top1['score'] - top2['score']) < EARLY_EXIT_MARGIN:
             # Ưu tiên file có tên chuẩn
-            prio_names = ['main.tex', 'ms.tex', 'paper.tex', 'article.tex']
-            if top1['name'].lower() not in prio_names and top2['name'].lower() in prio_names:
-                return top2['path']
+            if top1['name'].lower() not in PRIO_NAMES and top2['name'].lower() in PRIO_NAMES:
+                winner, reason = top2, 'tie_standard_name'
             
             # Nếu tên cũng không giúp ích, lấy file NẶNG HƠN ĐÁNG KỂ
-            if top2['len'] > top1['len'] * 1.5: 
-                return top2['path']
+            elif top2['len'] > top1['len'] * 1.5: 
+                winner, reason = top2, 'tie_larger_file'
+
+    def rel(path):
+        return os.path.relpath(path, index.root).replace(os.sep, '/')
 
-    # Trả về đường dẫn của ứng viên số 1
-    return candidates[0]['path']
+    decision['root'] = rel(winner['path'])
+    decision['reason'] = reason
+    decision['candidates'] = [
+        {'file': rel(c['path']), 'score': c['score'], 'len': c['len'], 'breakdown': c['breakdown']}
+        for c in candidates
+    ]
+    return decision
+
+def find_root_tex_file(version_folder_path, file_index=None, root_cache=None):
+    """
+    Hàm chính: Tìm file LaTeX gốc trong thư mục version.
+    Input: Đường dẫn tới folder chứa code (vd: .../tex/version1)
+           file_index: VersionFileIndex của folder (None -> tự tạo); mỗi file chỉ được đọc một lần
+           root_cache: RootDecisionCache (tùy chọn); folder không đổi -> dùng lại quyết định cũ, không chấm điểm lại
+    Output: Đường dẫn tuyệt đối tới file main.tex (hoặc None nếu không tìm thấy)
+    """
+    index = file_index or VersionFileIndex(version_folder_path)
+
+    decision = root_cache.lookup(index) if root_cache is not None else None
+    if decision is None:
+        decision = decide_root_tex_file(version_folder_path, file_index=index)
+        if root_cache is not None:
+            try:
+                root_cache.store(index, decision)
+            except OSError:
+                pass  # Không ghi được cache (vd: read-only) -> vẫn trả kết quả vừa tính
+
+    if decision['root'] is None:
+        return None
+    # Trả về đường dẫn của ứng viên được chọn
+    return os.path.join(index.root, *decision['root'].split('/'))
@@ -0,0 +1,147 @@
+"""
+Flatten Cache
+=============
+
+Kết quả phân tích từng file của `LatexFlattener` (xóa comment + tách các lệnh \\input/\\include/\\subfile),
+memo theo hash nội dung.
+
+Một file được biểu diễn bằng segments: (text_0, include_1, text_1, include_2, text_2, ...)
+- text_i: đoạn LaTeX (đã xóa comment) giữa các lệnh include
+- include_i: tên file con đã chuẩn hóa (thêm '.tex'), được resolve & flatten đệ quy lúc ghép
+
+Segments chỉ phụ thuộc nội dung file nên:
+- Trong một process: cache qua `SourceFileCache.derive` -> file giống hệt nhau giữa các versions
+  (hoặc giữa các papers) chỉ xóa comment & chạy regex include một lần
+- Giữa các lần chạy (tùy chọn): `FlattenSegmentStore` lưu segments xuống đĩa theo hash nội dung,
+  lần sau chỉ file mới / thay đổi mới phải phân tích lại
+
+Example:
+    >>> split_flatten_segments("A \\\\input{intro} B % note")
+    ('A ', 'intro.tex', ' B ')
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Optional
+
+REGEX_COMMENT = re.compile(r'(?<!\\)%.*')
+
+# Regex hỗ trợ: \input{file}, \include{file}, \subfile{file}, \input file
+REGEX_FLATTEN_INCLUDE = re.compile(r'\\(?:input|include|subfile)(?:(?:\s*\{([^}]+)\})|(?:\s+([^\s%]+)))')
+
+FLATTEN_CACHE_DIRNAME = ".flatten_cache"
+
+# Đổi regex -> key đổi -> segments cũ trên đĩa tự động bị bỏ qua
+_STORE_SALT = f"{REGEX_COMMENT.pattern}\n{REGEX_FLATTEN_INCLUDE.pattern}\n".encode()
+
+
+def split_flatten_segments(text: str) -> tuple:
+    """
+    Xóa comment rồi tách text theo các lệnh include.
+
+    Returns:
+        tuple: (text_0, include_1, text_1, ...) - độ dài luôn lẻ; include = '' nếu lệnh không có tên file
+    """
+    content = REGEX_COMMENT.sub('', text)
+    segments = []
+    last = 0
+    for match in REGEX_FLATTEN_INCLUDE.finditer(content):
+        segments.append(content[last:match.start()])
+        fname = match.group(1) or match.group(2)
+        if fname:
+            fname = fname.strip()
+            if not fname.lower().endswith('.tex'):
+                fname += '.tex'
+        segments.append(fname or '')
+        last = match.end()
+    segments.append(content[last:])
+    return tuple(segments)
+
+
+def flatten_segment_lines(text: str, segments: Optional[tuple] = None) -> tuple:
+    """
+    Dòng bắt đầu (1-based, trong file gốc) của từng đoạn text trong `split_flatten_segments(text)`.
+    Xóa comment giữ nguyên '\\n' nên chỉ cần đếm '\\n' của đoạn text và của lệnh include ở giữa.
+
+    Args:
+        text: Nội dung file gốc
+        segments: Segments đã có của text (tùy chọn) - nếu không lệnh include nào xuống dòng
+            (trường hợp thường gặp) thì đếm trên segments, không chạy lại regex
+
+    Returns:
+        tuple: (line_0, line_1, ...) - một phần tử cho mỗi đoạn text (segments[0], segments[2], ...)
+    """
+    if segments is not None:
+        lines = [1]
+        line = 1
+        for k in range(0, len(segments) - 1, 2):
+            line += segments[k].count('\n')
+            lines.append(line)
+        if line - 1 + segments[-1].count('\n') == text.count('\n'):
+            return tuple(lines)
+
+    content = REGEX_COMMENT.sub('', text)
+    lines = [1]
+    line = 1
+    last = 0
+    for match in REGEX_FLATTEN_INCLUDE.finditer(content):
+        line += content.count('\n', last, match.end())
+        lines.append(line)
+        last = match.end()
+    return tuple(lines)
+
+
+class FlattenSegmentStore:
+    """
+    Lưu segments của từng nội dung file xuống đĩa: `<cache_dir>/<key[:2]>/<key>.json`, ghi atomic.
+
+    Args:
+        cache_dir: Thư mục cache (tạo khi cần)
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load(self, key: str) -> Optional[tuple]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                segments = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(segments, list) or len(segments) % 2 != 1:
+            return None
+        return tuple(segments)
+
+    def _save(self, key: str, segments: tuple):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(segments), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # Không ghi được cache -> chỉ mất phần tăng tốc
+
+    def segments(self, text: str) -> tuple:
+        """Segments của text: đọc từ đĩa nếu đã có, ngược lại phân tích rồi lưu lại."""
+        key = hashlib.sha1(_STORE_SALT + text.encode('utf-8', errors='surrogatepass')).hexdigest()
+        segments = self._load(key)
+        with self._lock:
+            if segments is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if segments is None:
+            segments = split_flatten_segments(text)
+            self._save(key, segments)
+        return segments
@@ -0,0 +1,249 @@
+"""
+Hierarchy Node
+==============
+
+Node của cây cấu trúc (coarse tree từ `LatexStructureBuilder` và các node chi tiết từ
+`LatexContentProcessor`): object `__slots__` thay cho dict.
+
+- Các trường chung (id, type, title, level, raw_content, children) nằm trong slots -> không có
+  hash table riêng cho mỗi node (~3 lần nhỏ hơn dict cùng số key)
+- Trường hiếm (is_starred, origin, content, parent, raw_spans...) nằm trong dict `_extra`, chỉ
+  tạo khi có
+- Dùng được như dict (`node['children']`, `node.get(...)`, `del node['raw_content']`, `in`,
+  `keys()`...) nên các exporter / deduplicator hiện có không cần sửa; code nóng có thể đọc
+  thẳng thuộc tính (`node.children`)
+- Nội dung lazy: node có thể giữ một hàm tách nội dung đang chờ (key `pending_content`, do
+  `LatexContentProcessor(lazy=True)` gắn); hàm chạy khi `node['children']` / `node.get('children')`
+  được đọc lần đầu, hoặc khi gọi `expand()` / `materialize()`. Thuộc tính `node.children` và
+  `outline()` không kích hoạt tách nội dung
+
+Example:
+    >>> node = HierarchyNode(id="p-v1-section-1", type="section", title="Intro", level=3,
+    ...                      raw_content="", is_starred=False)
+    >>> node['title'], node.get('is_starred'), 'origin' in node
+    ('Intro', False, False)
+    >>> node.to_dict()['children']
+    []
+"""
+
+from collections.abc import MutableMapping
+
+FIELDS = ('id', 'type', 'title', 'level', 'raw_content', 'children')
+_FIELD_SET = frozenset(FIELDS)
+# Key (trong _extra) của hàm tách nội dung đang chờ: pending(node) -> gắn các node nội dung vào node
+PENDING_KEY = 'pending_content'
+# Loại node header (cây cấu trúc thô) - những node outline() giữ lại
+HEADER_TYPES = frozenset((
+    'document', 'part', 'chapter', 'section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph'
+))
+_MISSING = object()
+
+
+class HierarchyNode(MutableMapping):
+    """
+    Node cây cấu trúc với giao diện dict.
+
+    Args:
+        id, type, title, level: Như các key cùng tên của node dict cũ
+        children: Danh sách node con (mặc định rỗng)
+        **fields: raw_content và các key khác (is_starred, origin, content...)
+    """
+
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, id, type, title, level, children=None, **fields):
+        self.id = id
+        self.type = type
+        self.title = title
+        self.level = level
+        self.children = [] if children is None else children
+        self._extra = None
+        if 'raw_content' in fields:
+            self.raw_content = fields.pop('raw_content')
+        if fields:
+            self._extra = fields
+
+    # --- Giao diện dict ---
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            if key == 'children' and self._extra is not None:
+                self.expand()
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for key in FIELDS if hasattr(self, key)) + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    # get / pop viết lại (thay bản mặc định của MutableMapping) vì nằm trên đường nóng của các lượt duyệt cây
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            if key == 'children' and self._extra is not None:
+                self.expand()
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def pop(self, key, default=_MISSING):
+        if key in _FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                delattr(self, key)
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra.pop(key)
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def __reduce__(self):
+        # Pickle cả cây con dưới dạng một list phẳng (pre-order), dựng lại bằng vòng lặp:
+        # ít object tạm hơn pickle từng node (không tạo tuple args / state cho mỗi node) và không đệ quy
+        return _restore_tree, (_flatten_tree(self),)
+
+    def __repr__(self):
+        return f"HierarchyNode({dict(self)!r})"
+
+    # --- Nội dung lazy ---
+
+    def is_pending(self) -> bool:
+        """Node còn nội dung chưa tách (lazy)?"""
+        return self._extra is not None and PENDING_KEY in self._extra
+
+    def expand(self) -> 'HierarchyNode':
+        """Tách nội dung đang chờ của riêng node này (nếu có); các node con header vẫn giữ lazy."""
+        if self._extra is not None:
+            pending = self._extra.pop(PENDING_KEY, None)
+            if pending is not None:
+                pending(self)
+        return self
+
+    def materialize(self) -> 'HierarchyNode':
+        """Tách toàn bộ nội dung đang chờ trong cây con (vd trước khi export đầy đủ)."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if type(node) is HierarchyNode:
+                node.expand()
+                stack.extend(node.children)
+        return self
+
+    def outline(self) -> dict:
+        """
+        Cây header (document / part / section...) của cây con, không tách nội dung đang chờ.
+
+        Returns:
+            dict: {'id', 'type', 'title', 'level', 'children': [outline của các header con]}
+        """
+        return {
+            'id': self.id,
+            'type': self.type,
+            'title': self.title,
+            'level': self.level,
+            'children': [
+                child.outline() for child in self.children
+                if type(child) is HierarchyNode and child.type in HEADER_TYPES
+            ],
+        }
+
+    def to_dict(self) -> dict:
+        """Bản dict thuần (đệ quy cả children, tách nội dung đang chờ), vd để json.dump."""
+        self.expand()
+        data = dict(self)
+        data['children'] = [
+            child.to_dict() if isinstance(child, HierarchyNode) else child for child in self.children
+        ]
+        return data
+
+
+class _Missing:
+    """Đánh dấu node không có raw_content khi pickle (class -> pickle theo tên, giữ nguyên identity)."""
+
+
+# Số phần tử mỗi node trong list phẳng: id, type, title, level, raw_content, _extra, số con
+_FLAT_WIDTH = 7
+
+
+def _flatten_tree(root: HierarchyNode) -> list:
+    """List phẳng pre-order của cây con; con không phải HierarchyNode (vd dict) được giữ nguyên object."""
+    flat = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if type(node) is not HierarchyNode:
+            flat.extend((node, _Missing, None, None, None, None, 0))
+            continue
+        flat.extend((node.id, node.type, node.title, node.level,
+                     getattr(node, 'raw_content', _Missing), node._extra, len(node.children)))
+        stack.extend(reversed(node.children))
+    return flat
+
+
+def _restore_tree(flat: list) -> HierarchyNode:
+    """Dựng lại cây từ list phẳng của `_flatten_tree`."""
+    new = HierarchyNode.__new__
+    root = None
+    # Các node đang chờ con: [children list, số con còn thiếu]
+    pending = []
+    for i in range(0, len(flat), _FLAT_WIDTH):
+        if flat[i + 1] is _Missing:
+            node = flat[i]
+        else:
+            node = new(HierarchyNode)
+            node.id = flat[i]
+            node.type = flat[i + 1]
+            node.title = flat[i + 2]
+            node.level = flat[i + 3]
+            if flat[i + 4] is not _Missing:
+                node.raw_content = flat[i + 4]
+            node._extra = flat[i + 5]
+            node.children = []
+        if pending:
+            top = pending[-1]
+            top[0].append(node)
+            top[1] -= 1
+            if not top[1]:
+                pending.pop()
+        else:
+            root = node
+        count = flat[i + 6]
+        if count:
+            pending.append([node.children, count])
+    return root
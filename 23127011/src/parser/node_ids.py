@@ -0,0 +1,71 @@
+"""
+Node IDs
+========
+
+ID xác định (deterministic) cho node của cây cấu trúc, thay cho `uuid4()`:
+cùng input -> cùng ID -> `hierarchy.json` giống hệt từng byte giữa các lần chạy, cache / diff
+phía sau có thể dùng ID làm key.
+
+Định dạng: `{paper_id}-{version}-{type}-{digest}`
+    - digest: 16 ký tự hex blake2b của key (nội dung đã clean, title của header...)
+    - Key lặp lại trong cùng (version, type, scope) -> thêm hậu tố thứ tự: `...-{digest}-2`, `-3`...
+    - scope (tùy chọn): ID của node đang được tách nội dung; digest tính trên (scope, key) nên hậu tố
+      chỉ phụ thuộc thứ tự trong node đó -> tách nội dung theo thứ tự nào (eager / lazy) cũng cùng ID
+    - Không có key -> bộ đếm theo type: `{paper_id}-{version}-{type}-n{k}`
+
+ID không đổi khi nội dung node không đổi và thứ tự các node trùng nội dung không đổi
+(thêm / sửa đoạn khác không làm đổi ID của node này).
+
+Example:
+    >>> ids = NodeIdFactory("2301-00001", "v1")
+    >>> ids.make("sentence", "A sentence.")
+    '2301-00001-v1-sentence-d8aab7200709479f'
+    >>> ids.make("sentence", "A sentence.")     # nội dung trùng trong cùng version
+    '2301-00001-v1-sentence-d8aab7200709479f-2'
+"""
+
+import hashlib
+from typing import Optional
+
+DIGEST_SIZE = 8
+
+
+class NodeIdFactory:
+    """
+    Sinh ID node cho một (paper, version).
+
+    Args:
+        paper_id: ID paper
+        version: Tên version (vd "v1")
+    """
+
+    def __init__(self, paper_id, version):
+        self.prefix = f"{paper_id}-{version}-"
+        self._seen = {}
+        self._counters = {}
+
+    def make(self, type_name: str, key: Optional[str] = None, scope: str = '') -> str:
+        """
+        ID cho node loại type_name với key (nội dung / title); key None -> bộ đếm.
+        scope: ID node cha đang được tách nội dung ('' = không giới hạn).
+
+        Returns:
+            str: ID duy nhất trong (paper, version)
+        """
+        if key is None:
+            return self.next(type_name)
+        if scope:
+            key = f"{scope}\x00{key}"
+        digest = hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=DIGEST_SIZE).hexdigest()
+        node_id = f"{self.prefix}{type_name}-{digest}"
+        count = self._seen.get(node_id, 0) + 1
+        self._seen[node_id] = count
+        if count > 1:
+            return f"{node_id}-{count}"
+        return node_id
+
+    def next(self, type_name: str) -> str:
+        """ID theo bộ đếm của type_name (không cần key)."""
+        count = self._counters.get(type_name, 0) + 1
+        self._counters[type_name] = count
+        return f"{self.prefix}{type_name}-n{count}"
@@ -0,0 +1,104 @@
+"""
+Root Decision Cache
+===================
+
+Lưu quyết định của `find_root_tex_file` (kèm bảng điểm từng ứng viên) xuống đĩa.
+
+- Key: fingerprint của version folder = hash danh sách (relpath, size, mtime) mọi file
+  + hash mã nguồn của bộ chấm điểm -> folder hoặc luật chấm điểm đổi thì tự động chấm lại
+- Mỗi quyết định là một file JSON `<cache_dir>/<fingerprint>.json`, ghi atomic
+  (an toàn khi nhiều thread / process cùng ghi)
+- Đường dẫn root được lưu tương đối so với version folder, nên các tool khác
+  có thể đọc trực tiếp để biết root file & lý do mà không cần quét lại
+
+Example:
+    >>> cache = RootDecisionCache("data_output/.root_cache")
+    >>> root = find_root_tex_file(ver_path, file_index=index, root_cache=cache)
+    >>> cache.lookup(index)
+    {'root': 'main.tex', 'reason': 'top_score', 'candidates': [{'file': 'main.tex', 'score': 135, ...}]}
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+ROOT_CACHE_DIRNAME = ".root_cache"
+ROOT_CACHE_SCHEMA = 1
+
+# Mã nguồn quyết định kết quả chấm điểm: đổi code -> fingerprint đổi
+_SCORER_SOURCES = ("file_loader.py", "file_index.py")
+_scorer_version = None
+
+
+def get_scorer_version() -> str:
+    """Hash mã nguồn bộ chấm điểm root file (tính một lần mỗi process)."""
+    global _scorer_version
+    if _scorer_version is None:
+        hasher = hashlib.sha1()
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in _SCORER_SOURCES:
+            with open(os.path.join(base_dir, name), 'rb') as f:
+                hasher.update(f.read())
+        _scorer_version = hasher.hexdigest()[:12]
+    return _scorer_version
+
+
+def folder_fingerprint(file_index) -> str:
+    """Fingerprint của version folder từ listing (tên, size, mtime); không đọc nội dung file."""
+    hasher = hashlib.sha1(f"{ROOT_CACHE_SCHEMA}:{get_scorer_version()}\n".encode())
+    for rel_path, size, mtime_ns in file_index.listing():
+        hasher.update(f"{rel_path}\0{size}\0{mtime_ns}\n".encode('utf-8', errors='surrogateescape'))
+    return hasher.hexdigest()
+
+
+class RootDecisionCache:
+    """
+    Cache quyết định root file trên đĩa.
+
+    Args:
+        cache_dir: Thư mục chứa các file quyết định (tạo khi cần)
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{fingerprint}.json")
+
+    def lookup(self, file_index) -> Optional[dict]:
+        """Quyết định đã lưu cho folder (None nếu chưa có / folder đã đổi / file cache hỏng)."""
+        fingerprint = folder_fingerprint(file_index)
+        try:
+            with open(self._path(fingerprint), 'r', encoding='utf-8') as f:
+                decision = json.load(f)
+        except (OSError, ValueError):
+            decision = None
+        if decision is not None and decision.get("fingerprint") != fingerprint:
+            decision = None
+
+        with self._lock:
+            if decision is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return decision
+
+    def store(self, file_index, decision: dict) -> str:
+        """Ghi quyết định (atomic). Trả về đường dẫn file cache."""
+        fingerprint = folder_fingerprint(file_index)
+        record = dict(decision)
+        record["fingerprint"] = fingerprint
+        record["folder"] = file_index.root
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(fingerprint)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
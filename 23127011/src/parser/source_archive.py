@@ -0,0 +1,191 @@
+"""
+Source Archive
+==============
+
+Đọc source của một version trực tiếp từ archive (.tar, .tar.gz/.tgz, .zip, hoặc .gz một file)
+mà không cần giải nén ra `data_raw/<paper>/tex/<ver>/`.
+
+Toàn bộ members được đọc vào bộ nhớ trong MỘT lượt streaming (tar mở ở chế độ `r|*`,
+không seek), trừ các thư mục bị bỏ qua và file nhị phân (hình ảnh, pdf...) - những file này
+chỉ giữ tên & kích thước (đủ cho root detection).
+
+`VersionFileIndex` dùng lớp này khi version là một archive, nên `find_root_tex_file`,
+`LatexFlattener` và `ReferenceProcessor` chạy được trên archive y như trên thư mục.
+Đường dẫn của member là đường dẫn ảo `<archive_path>/<member>`.
+
+Example:
+    >>> versions = list_version_sources("data_raw/2403-00530/tex")
+    [('v1', '.../tex/v1.tar.gz'), ('v2', '.../tex/v2')]
+    >>> archive = SourceArchive(".../tex/v1.tar.gz")
+    >>> archive.read("main.tex")
+    b'\\documentclass{article}...'
+"""
+
+import calendar
+import gzip
+import os
+import tarfile
+import zipfile
+from typing import List, Optional, Tuple
+
+# Thứ tự quan trọng: '.tar.gz' phải được kiểm tra trước '.gz'
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar', '.zip', '.gz')
+
+# Chỉ giữ tên & kích thước, không đọc nội dung vào bộ nhớ
+BINARY_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.pdf', '.eps', '.ps', '.svg', '.tif', '.tiff',
+                   '.bmp', '.zip', '.gz', '.tar', '.tgz', '.mp4', '.avi', '.mov', '.pyc', '.xlsx', '.docx')
+
+
+def archive_suffix(path: str) -> Optional[str]:
+    """Đuôi archive của path (vd: '.tar.gz'), None nếu không phải archive."""
+    lower = path.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return None
+
+
+def is_source_archive(path: str) -> bool:
+    """path là file archive mà SourceArchive đọc được."""
+    return archive_suffix(path) is not None and os.path.isfile(path)
+
+
+def list_version_sources(tex_path: str) -> List[Tuple[str, str]]:
+    """
+    Các versions trong folder `tex/` của một paper: thư mục hoặc archive.
+
+    Returns:
+        [(version_name, path)] sắp xếp theo version_name; 'v1.tar.gz' -> 'v1'.
+        Nếu có cả thư mục 'v1' và archive 'v1.tar.gz', thư mục (đã giải nén) được ưu tiên.
+    """
+    sources = {}
+    for name in sorted(os.listdir(tex_path)):
+        path = os.path.join(tex_path, name)
+        if os.path.isdir(path):
+            sources[name] = path
+        elif is_source_archive(path):
+            version = name[:-len(archive_suffix(name))]
+            if version and version not in sources:
+                sources[version] = path
+    return sorted(sources.items())
+
+
+class _Member:
+    __slots__ = ("size", "mtime_ns", "data")
+
+    def __init__(self, size: int, mtime_ns: int, data: Optional[bytes]):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.data = data
+
+
+class SourceArchive:
+    """
+    Nội dung một archive, đọc vào bộ nhớ trong một lượt.
+
+    Args:
+        path: Đường dẫn archive
+        skip_dirs: Tên thư mục bị bỏ qua hoàn toàn (không liệt kê, không đọc)
+
+    Attributes:
+        path: Đường dẫn tuyệt đối của archive
+        members: {relpath: _Member} theo thứ tự trong archive (relpath dùng '/')
+
+    Raises:
+        ValueError: Archive hỏng / không đọc được
+    """
+
+    def __init__(self, path: str, skip_dirs=()):
+        self.path = os.path.abspath(path)
+        self.skip_dirs = set(skip_dirs)
+        self.members = {}
+        try:
+            self._load()
+        except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile) as e:
+            raise ValueError(f"Cannot read archive {self.path}: {e}") from e
+        self._strip_common_dir()
+
+    def _normalize(self, name: str) -> Optional[str]:
+        """Chuẩn hóa tên member; None nếu nằm ngoài archive (tuyệt đối, '..') hoặc trong skip_dirs."""
+        parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+        if not parts or '..' in parts or name.startswith('/'):
+            return None
+        if any(p in self.skip_dirs for p in parts[:-1]):
+            return None
+        return '/'.join(parts)
+
+    def _add(self, name: str, size: int, mtime_ns: int, read):
+        rel_path = self._normalize(name)
+        if rel_path is None:
+            return
+        data = None if rel_path.lower().endswith(BINARY_SUFFIXES) else read()
+        self.members[rel_path] = _Member(size, mtime_ns, data)
+
+    def _load(self):
+        suffix = archive_suffix(self.path)
+        if suffix == '.zip':
+            with zipfile.ZipFile(self.path) as zf:
+                for info in zf.infolist():
+                    if info.is_dir():
+                        continue
+                    mtime_ns = calendar.timegm(info.date_time + (0, 0, -1)) * 10**9
+                    self._add(info.filename, info.file_size, mtime_ns, lambda: zf.read(info))
+            return
+
+        try:
+            # Streaming: đọc tuần tự từng member, không seek lại
+            with tarfile.open(self.path, mode='r|*') as tf:
+                for info in tf:
+                    if not info.isfile():
+                        continue
+                    self._add(info.name, info.size, int(info.mtime) * 10**9,
+                              lambda: tf.extractfile(info).read())
+        except tarfile.ReadError:
+            if suffix != '.gz':
+                raise
+            # arXiv: submission một file -> .gz của chính file .tex (không phải tar)
+            with gzip.open(self.path, 'rb') as f:
+                data = f.read()
+            name = os.path.basename(self.path)[:-len(suffix)] + '.tex'
+            self.members = {}
+            self.members[name] = _Member(len(data), os.stat(self.path).st_mtime_ns, data)
+
+    def _strip_common_dir(self):
+        """Archive bọc mọi thứ trong một thư mục duy nhất (vd: 'v1/main.tex') -> coi thư mục đó là root."""
+        prefixes = {rel_path.partition('/')[0] if '/' in rel_path else None for rel_path in self.members}
+        if len(prefixes) != 1 or None in prefixes:
+            return
+        cut = len(prefixes.pop()) + 1
+        self.members = {rel_path[cut:]: member for rel_path, member in self.members.items()}
+
+    def walk(self) -> List[str]:
+        """relpath các members theo thứ tự top-down như os.walk (file của thư mục trước, rồi thư mục con)."""
+        tree = {}   # dir -> ([files], {subdir: None}) theo thứ tự xuất hiện
+        for rel_path in self.members:
+            parent, _, _ = rel_path.rpartition('/')
+            tree.setdefault(parent, ([], {}))[0].append(rel_path)
+            while parent:
+                grand, _, _ = parent.rpartition('/')
+                tree.setdefault(grand, ([], {}))[1].setdefault(parent, None)
+                parent = grand
+
+        ordered = []
+        stack = ['']
+        while stack:
+            current = stack.pop()
+            files, subdirs = tree.get(current, ([], {}))
+            ordered.extend(files)
+            stack.extend(reversed(list(subdirs)))
+        return ordered
+
+    def exists(self, rel_path: str) -> bool:
+        return rel_path in self.members
+
+    def size(self, rel_path: str) -> Optional[int]:
+        member = self.members.get(rel_path)
+        return member.size if member else None
+
+    def read(self, rel_path: str) -> Optional[bytes]:
+        """Nội dung (bytes) của member; None nếu không có hoặc là file nhị phân không được nạp."""
+        member = self.members.get(rel_path)
+        return member.data if member else None
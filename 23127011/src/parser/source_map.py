@@ -0,0 +1,165 @@
+"""
+Source Map
+==========
+
+Bảng span ánh xạ offset trong text đã flatten -> (file nguồn, dòng), thay cho các marker
+`% <BEGIN_FILE: ...>` nhúng trong text.
+
+Mỗi span là một đoạn liên tục của text đến từ cùng một file, lưu trong 3 array song song:
+    - starts[i]: offset bắt đầu span trong text (tăng dần)
+    - file_ids[i]: id của file nguồn (index trong `files`), -1 = text sinh ra (marker, cảnh báo)
+    - lines[i]: dòng (1-based) của ký tự đầu span trong file nguồn
+
+Tra cứu một offset = bisect trên `starts` + đếm '\\n' từ đầu span (không cần quét lại text).
+Text bị sửa sau khi flatten (xóa bibliography, thay citation keys...) thì dùng `sub` /
+`apply_edits` để có SourceMap mới khớp với text mới.
+
+Example:
+    >>> result = LatexFlattener(root, pid, "v1", emit_markers=False, build_source_map=True).flatten()
+    >>> smap = result["source_map"]
+    >>> smap.locate(result["content"].index("\\\\section{Method}"))
+    ('sections/method.tex', 1)
+"""
+
+import bisect
+from array import array
+from typing import List, Optional, Tuple
+
+GENERATED = -1
+
+
+class SourceMap:
+    """
+    Span table của một text.
+
+    Args:
+        text: Text được ánh xạ (thường là nội dung đã flatten)
+        files: Danh sách relpath file nguồn (file id = index)
+
+    Attributes:
+        text: Text được ánh xạ
+        files: [relpath]
+        starts, file_ids, lines: Các array song song mô tả spans
+    """
+
+    def __init__(self, text: str = "", files: Optional[List[str]] = None):
+        self.text = text
+        self.files = list(files) if files else []
+        self.starts = array('q')
+        self.file_ids = array('l')
+        self.lines = array('l')
+        self._file_index = {name: i for i, name in enumerate(self.files)}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_file_index"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._file_index = {name: i for i, name in enumerate(self.files)}
+
+    def file_id(self, rel_path: str) -> int:
+        """Id của file (thêm vào `files` nếu chưa có)."""
+        fid = self._file_index.get(rel_path)
+        if fid is None:
+            fid = self._file_index[rel_path] = len(self.files)
+            self.files.append(rel_path)
+        return fid
+
+    def add_span(self, start: int, file_id: int, line: int):
+        """Thêm span bắt đầu tại offset start; span rỗng trước đó (cùng start) bị thay thế."""
+        if self.starts and self.starts[-1] == start:
+            self.file_ids[-1] = file_id
+            self.lines[-1] = line
+            return
+        self.starts.append(start)
+        self.file_ids.append(file_id)
+        self.lines.append(line)
+
+    def _origin(self, offset: int, hint=None) -> Tuple[int, int, int]:
+        """(span index, file id, line) của offset. hint: kết quả lần gọi trước ở offset nhỏ hơn."""
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if i < 0:
+            return -1, GENERATED, 0
+        fid = self.file_ids[i]
+        if fid == GENERATED:
+            return i, fid, 0
+        if hint is not None and hint[0] == i and hint[3] <= offset:
+            return i, fid, hint[2] + self.text.count('\n', hint[3], offset)
+        return i, fid, self.lines[i] + self.text.count('\n', self.starts[i], offset)
+
+    def locate(self, offset: int) -> Optional[Tuple[str, int]]:
+        """(relpath, dòng) của ký tự tại offset; None nếu là text sinh ra hoặc ngoài bảng."""
+        _, fid, line = self._origin(offset)
+        if fid == GENERATED:
+            return None
+        return self.files[fid], line
+
+    def apply_edits(self, edits) -> "SourceMap":
+        """
+        Áp dụng các thay thế lên text, trả về SourceMap mới (text mới + spans đã dịch offset).
+
+        Args:
+            edits: [(start, end, replacement)] theo thứ tự tăng dần, không chồng lấn.
+                Text thay thế được gán nguồn của vị trí start; phần sau end giữ nguồn cũ.
+
+        Returns:
+            SourceMap: Map của text sau khi sửa (chính self nếu không có edit nào)
+        """
+        if not edits:
+            return self
+        result = SourceMap(files=self.files)
+        text = self.text
+        pieces = []
+        pos = 0     # offset trong text cũ đã xử lý xong
+        delta = 0   # offset mới - offset cũ
+        j = 0       # span cũ kế tiếp chưa được chép
+        hint = None
+        for start, end, replacement in edits:
+            # 1. Chép các span cũ bắt đầu trong [pos, start)
+            while j < len(self.starts) and self.starts[j] < start:
+                result.add_span(self.starts[j] + delta, self.file_ids[j], self.lines[j])
+                j += 1
+            pieces.append(text[pos:start])
+
+            # 2. Text thay thế mang nguồn của vị trí start
+            if replacement:
+                i, fid, line = self._origin(start, hint)
+                hint = (i, fid, line, start)
+                result.add_span(start + delta, fid, line)
+                pieces.append(replacement)
+            delta += len(replacement) - (end - start)
+
+            # 3. Phần sau end tiếp tục nguồn cũ (span cũ bắt đầu trong (start, end] bị nuốt)
+            while j < len(self.starts) and self.starts[j] <= end:
+                j += 1
+            if end < len(text):
+                i, fid, line = self._origin(end, hint)
+                hint = (i, fid, line, end)
+                result.add_span(end + delta, fid, line)
+            pos = end
+
+        while j < len(self.starts):
+            result.add_span(self.starts[j] + delta, self.file_ids[j], self.lines[j])
+            j += 1
+        pieces.append(text[pos:])
+        result.text = "".join(pieces)
+        return result
+
+    def sub(self, pattern, repl) -> "SourceMap":
+        """
+        Tương đương `pattern.sub(repl, text)` nhưng trả về SourceMap của text mới.
+
+        Args:
+            pattern: Regex đã compile
+            repl: Chuỗi thay thế (hỗ trợ backreference như re.sub) hoặc hàm nhận match
+        """
+        if callable(repl):
+            edits = [(m.start(), m.end(), repl(m)) for m in pattern.finditer(self.text)]
+        else:
+            edits = [(m.start(), m.end(), m.expand(repl)) for m in pattern.finditer(self.text)]
+        return self.apply_edits(edits)
@@ -1,8 +1,25 @@
+import bisect
+import functools
 import os
 import re
-import uuid
 import json
 from src.utils.tex_cleaner import LatexCleaner
+from src.utils.brace_index import BraceIndex
+from src.utils.file_cache import get_default_cache
+from src.utils.tree_walk import SKIP, TreeVisitor, iter_tree, run_visitors, walk_tree
+from src.parser.flatten_cache import REGEX_COMMENT, flatten_segment_lines, split_flatten_segments
+from src.parser.source_map import GENERATED, SourceMap
+from src.parser.hierarchy_node import PENDING_KEY, HierarchyNode
+from src.parser.node_ids import NodeIdFactory
+from src.parser import tex_tokenizer
+from src.parser.tex_tokenizer import tokenize
+
+# Độ sâu tối đa của cây \input/\include (root = 0); file sâu hơn bị bỏ qua kèm marker cảnh báo
+MAX_INCLUDE_DEPTH = 256
+
+# Ký tự không phải khoảng trắng (search(text, start, end) thay cho text[start:end].strip())
+REGEX_NON_SPACE = re.compile(r'\S')
+
 class LatexFlattener:
     """
     A class to flatten LaTeX documents by recursively merging all included files into a single structure.
@@ -17,6 +34,20 @@ class LatexFlattener:
         remove_references (bool): Flag to control whether to remove bibliography sections.
         merged_files (list): List of relative paths of files successfully merged.
         missing_files (list): List of relative paths of files that could not be found.
+        file_index (VersionFileIndex): Optional index used to read files (content & comment-stripped
+            text are cached and shared with root detection / reference extraction).
+        segment_store (FlattenSegmentStore): Optional on-disk store of per-file flatten segments
+            (comment-stripped text split at include commands), keyed by content hash.
+            Segments are always memoized in memory by content hash, so files shared between
+            versions are parsed once.
+        max_depth (int): Maximum include depth (root = 0). Deeper files are skipped with a warning marker.
+        max_chars (int): Optional budget on the total characters of merged source files. Files that
+            would exceed it are skipped with a warning marker.
+        skipped_files (list): List of relative paths of files skipped because of max_depth / max_chars.
+        emit_markers (bool): Whether to embed `% <BEGIN_FILE: ...>` / `% <END_FILE: ...>` and warning
+            comment markers in the flattened text. Use build_source_map to keep file origins without them.
+        build_source_map (bool): Build a SourceMap (flattened offset -> file, line) of `content`
+            alongside the text, returned as result["source_map"].
     Methods:
         flatten():
             Main method that processes the root file and returns a dictionary containing
@@ -27,7 +58,9 @@ class LatexFlattener:
                     - version: Version of the paper
                     - root_file_path: Absolute path to root file
                     - metadata: Dictionary containing processing statistics
-                    - content: Flattened LaTeX content as string
+                    - content: Flattened LaTeX content as string (bibliography removed if remove_references)
+                    - content_with_references: Flattened LaTeX content with bibliography kept
+                    - source_map: SourceMap of `content` (None unless build_source_map)
         _read_file(path):
             Reads content from a file with UTF-8 encoding.
             Args:
@@ -42,15 +75,16 @@ class LatexFlattener:
                 str: Content with comments removed.
         _remove_bibliography(text):
             Removes bibliography-related commands and environments from LaTeX content.
+            Applied once on the whole flattened text, so both views come from a single flatten pass.
             Args:
                 text (str): LaTeX content to process.
             Returns:
                 str: Content with bibliography sections removed.
-        _process_file(current_path, visited=None):
-            Recursively processes a LaTeX file and all its dependencies.
+        _process_file(current_path):
+            Processes a LaTeX file and all its dependencies with an explicit stack (no recursion,
+            so deep include chains cannot raise RecursionError).
             Args:
-                current_path (str): Path to the current file being processed.
-                visited (set, optional): Set of already visited file paths to detect circular dependencies.
+                current_path (str): Path to the root file being processed.
             Returns:
                 str: Flattened content with markers indicating file boundaries.
     Example:
@@ -58,23 +92,48 @@ class LatexFlattener:
         >>> result = flattener.flatten()
         >>> print(result['metadata']['merged_count'])
     """
-    def __init__(self, root_file_path, paper_id, version, remove_references=True):
+    # Compile một lần cho cả class (không compile lại mỗi file / mỗi lần flatten)
+    COMMENT_PATTERN = REGEX_COMMENT
+    BIBLIOGRAPHY_PATTERN = re.compile(r'\\bibliography\{[^}]+\}')
+    PRINTBIBLIOGRAPHY_PATTERN = re.compile(r'\\printbibliography')
+    THEBIBLIOGRAPHY_PATTERN = re.compile(r'\\begin\{thebibliography\}.*?\\end\{thebibliography\}', re.DOTALL)
+
+    def __init__(self, root_file_path, paper_id, version, remove_references=True, file_index=None,
+                 segment_store=None, max_depth=MAX_INCLUDE_DEPTH, max_chars=None, emit_markers=True,
+                 build_source_map=False):
         self.root_path = os.path.abspath(root_file_path)
         self.root_dir = os.path.dirname(self.root_path)
         self.paper_id = paper_id
         self.version = version
         self.remove_references = remove_references
+        self.file_index = file_index
+        self.segment_store = segment_store
+        self.max_depth = max_depth
+        self.max_chars = max_chars
+        self.emit_markers = emit_markers
+        self.build_source_map = build_source_map
         # print(f"📝 Khởi tạo LatexFlattener cho Paper: {self.paper_id}, Version: {self.version}")
         # print(f"   Remove references: {'Yes' if self.remove_references else 'No'}")
         self.merged_files = [] # Danh sách các file đã gộp thành công
         self.missing_files = [] # Danh sách các file bị thiếu
+        self.skipped_files = [] # Danh sách các file bị bỏ qua do vượt max_depth / max_chars
 
     def flatten(self):
         """
         Hàm chính: Thực hiện gộp và trả về cấu trúc Dictionary (JSON object)
         """
-        # Bắt đầu đệ quy từ root
-        full_content = self._process_file(self.root_path)
+        # Duyệt cây include từ root (chỉ đọc & regex mỗi file một lần)
+        content_with_refs = self._process_file(self.root_path)
+        
+        # View không có references được suy ra từ cùng một lần flatten
+        source_map = None
+        if self._source_map is not None:
+            # Xóa bib qua source map để spans khớp với text đã xóa
+            self._source_map.text = content_with_refs
+            source_map = self._remove_bibliography_spans(self._source_map)
+            full_content = source_map.text
+        else:
+            full_content = self._remove_bibliography(content_with_refs)
         
         # Tạo object kết quả
         result_object = {
@@ -86,89 +145,195 @@ class LatexFlattener:
                 "merged_count": len(self.merged_files),
                 "merged_files": self.merged_files,
                 "missing_files": self.missing_files,
+                "skipped_files": self.skipped_files,
                 "remove_references": self.remove_references
             },
-            "content": full_content
+            "content": full_content,
+            "content_with_references": content_with_refs,
+            "source_map": source_map
         }
         return result_object
 
     def _read_file(self, path):
-        if not os.path.exists(path): return None
-        try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-        except: return None
+        if self.file_index is not None:
+            return self.file_index.read(path)
+        # Đọc qua cache dùng chung (None nếu file không tồn tại / không đọc được)
+        return get_default_cache().read_text(path)
+
+    def _flatten_segments(self, path):
+        # Xóa comment + tách include, memo theo hash nội dung (file giống nhau giữa các versions chỉ làm một lần)
+        build = split_flatten_segments if self.segment_store is None else self.segment_store.segments
+        if self.file_index is not None:
+            return self.file_index.derive(path, "flatten_segments", build)
+        return get_default_cache().derive(path, "flatten_segments", build)
+
+    def _segment_lines(self, path, segments):
+        # Dòng bắt đầu của từng đoạn text trong segments (chỉ cần khi build source map)
+        build = functools.partial(flatten_segment_lines, segments=segments)
+        if self.file_index is not None:
+            return self.file_index.derive(path, "flatten_segment_lines", build)
+        return get_default_cache().derive(path, "flatten_segment_lines", build)
+
+    def _exists(self, path):
+        # Qua file_index để dùng được cả với version là archive (đường dẫn ảo)
+        if self.file_index is not None:
+            return self.file_index.exists(path)
+        return os.path.exists(path)
 
     def _remove_comments(self, text):
         """Xóa comment gốc của tác giả để giảm nhiễu, nhưng giữ lại marker của mình sau này"""
         # Regex: Tìm ký tự % không đi sau dấu \
-        return re.sub(r'(?<!\\)%.*', '', text)
+        return self.COMMENT_PATTERN.sub('', text)
 
     def _remove_bibliography(self, text):
         """Loại bỏ phần tài liệu tham khảo theo yêu cầu"""
         if not self.remove_references:
             return text
         
-        text = re.sub(r'\\bibliography\{[^}]+\}', '', text)
-        text = re.sub(r'\\printbibliography', '', text)
-        text = re.sub(r'\\begin\{thebibliography\}.*?\\end\{thebibliography\}', '', text, flags=re.DOTALL)
+        text = self.BIBLIOGRAPHY_PATTERN.sub('', text)
+        text = self.PRINTBIBLIOGRAPHY_PATTERN.sub('', text)
+        text = self.THEBIBLIOGRAPHY_PATTERN.sub('', text)
         return text
 
-    def _process_file(self, current_path, visited=None):
-        if visited is None: visited = set()
-        
+    def _remove_bibliography_spans(self, source_map):
+        """Như _remove_bibliography nhưng trên SourceMap (trả về map của text đã xóa)"""
+        if not self.remove_references:
+            return source_map
+        for pattern in (self.BIBLIOGRAPHY_PATTERN, self.PRINTBIBLIOGRAPHY_PATTERN, self.THEBIBLIOGRAPHY_PATTERN):
+            source_map = source_map.sub(pattern, '')
+        return source_map
+
+    def _emit(self, text, file_id=GENERATED, line=0):
+        """Ghi một chunk vào output (kèm span nguồn nếu build source map)"""
+        if not text:
+            return
+        if self._source_map is not None:
+            self._source_map.add_span(self._length, file_id, line)
+            self._length += len(text)
+        self._chunks.append(text)
+
+    def _emit_marker(self, text):
+        """Marker / cảnh báo dạng comment; bỏ qua khi emit_markers=False (nguồn gốc nằm trong source map)"""
+        if self.emit_markers:
+            self._emit(text)
+
+    def _close_include(self, end):
+        """Xong một file con: marker kết thúc rồi phần text còn lại của file cha sau lệnh include"""
+        if end is None:
+            return
+        fname, tail, file_id, line = end
+        self._emit_marker(f"\n% <END_FILE: {fname}>\n")
+        self._emit(tail, file_id, line)
+
+    def _open_file(self, current_path, depth, end):
+        """
+        Bắt đầu gộp một file: ghi phần text đầu tiên và trả về frame để duyệt tiếp các include.
+        Trả về None nếu file không được gộp (vòng lặp / vượt giới hạn / thiếu file) - khi đó
+        marker cảnh báo và phần kết thúc của lệnh include (end) được ghi luôn.
+        """
         abs_path = os.path.abspath(current_path)
         rel_path = os.path.relpath(abs_path, self.root_dir).replace('\\', '/') # Chuẩn hóa đường dẫn
-        
+
         # 1. Check vòng lặp
-        if abs_path in visited:
-            return f"\n% <WARNING: Circular dependency detected for {rel_path}>\n"
-        visited.add(abs_path)
+        if abs_path in self._visited:
+            self._emit_marker(f"\n% <WARNING: Circular dependency detected for {rel_path}>\n")
+            self._close_include(end)
+            return None
 
-        # 2. Đọc nội dung
+        # 2. Giới hạn độ sâu include (chuỗi \input sinh tự động / lỗi)
+        if depth > self.max_depth:
+            self.skipped_files.append(rel_path)
+            self._emit_marker(f"\n% <WARNING: Include depth limit ({self.max_depth}) exceeded: {rel_path}>\n")
+            self._close_include(end)
+            return None
+        self._visited.add(abs_path)
+
+        # 3. Đọc nội dung
         raw_content = self._read_file(abs_path)
         if raw_content is None:
             self.missing_files.append(rel_path)
-            return f"\n% <WARNING: File not found: {rel_path}>\n"
-        
+            self._emit_marker(f"\n% <WARNING: File not found: {rel_path}>\n")
+            self._close_include(end)
+            return None
+
+        # 4. Giới hạn tổng dung lượng nguồn được gộp
+        if self.max_chars is not None and self._merged_chars + len(raw_content) > self.max_chars:
+            self.skipped_files.append(rel_path)
+            self._emit_marker(f"\n% <WARNING: Size limit ({self.max_chars} chars) exceeded: {rel_path}>\n")
+            self._close_include(end)
+            return None
+        self._merged_chars += len(raw_content)
+
         self.merged_files.append(rel_path)
 
-        # 3. Làm sạch sơ bộ (Xóa comment gốc + Xóa Bib nếu cờ bật)
-        content = self._remove_comments(raw_content)
-        content = self._remove_bibliography(content)
+        # 5. Làm sạch sơ bộ (Xóa comment gốc) & tách theo lệnh include. Bib được xóa một lần trong flatten()
+        segments = self._flatten_segments(abs_path)
+        file_id, lines = GENERATED, None
+        if self._source_map is not None:
+            file_id = self._source_map.file_id(rel_path)
+            lines = self._segment_lines(abs_path, segments)
+        self._emit(segments[0], file_id, 1)
+        # Frame: [segments, vị trí include kế tiếp, thư mục của file, độ sâu, file id, dòng của từng đoạn,
+        #         phần kết thúc ghi khi xong file]
+        return [segments, 1, os.path.dirname(abs_path), depth, file_id, lines, end]
 
-        # 4. Tìm và thay thế đệ quy các file con
-        # Regex hỗ trợ: \input{file}, \include{file}, \subfile{file}, \input file
-        pattern = re.compile(r'\\(?:input|include|subfile)(?:(?:\s*\{([^}]+)\})|(?:\s+([^\s%]+)))')
+    def _process_file(self, current_path):
+        """
+        Gộp file và toàn bộ file con bằng stack tường minh (không đệ quy -> không RecursionError
+        với cây include sâu). Kết quả được ghép một lần từ danh sách chunks.
+        """
+        self._visited = set()
+        self._merged_chars = 0
+        self._chunks = []
+        self._length = 0
+        self._source_map = SourceMap() if self.build_source_map else None
+        stack = []
+        frame = self._open_file(current_path, 0, None)
+        if frame is not None:
+            stack.append(frame)
+
+        while stack:
+            frame = stack[-1]
+            segments, i, parent_dir, depth, file_id, lines, end = frame
+            if i >= len(segments):
+                stack.pop()
+                self._close_include(end)
+                continue
+            frame[1] = i + 2
+            fname, tail = segments[i], segments[i + 1]
+            tail_line = lines[(i + 1) // 2] if lines is not None else 0
+            if not fname:
+                self._emit(tail, file_id, tail_line)
+                continue
 
-        def replace_match(match):
-            fname = match.group(1) or match.group(2)
-            if not fname: return ""
-            fname = fname.strip()
-            if not fname.lower().endswith('.tex'): fname += '.tex'
-            
             # Resolve path
             child_path = os.path.join(self.root_dir, fname)
-            if not os.path.exists(child_path):
-                child_path = os.path.join(os.path.dirname(abs_path), fname)
-            
-            # Đệ quy
-            child_content = self._process_file(child_path, visited)
-            
-            # QUAN TRỌNG: Kẹp nội dung giữa 2 Marker
-            return (f"\n% <BEGIN_FILE: {fname}>\n"
-                    f"{child_content}"
-                    f"\n% <END_FILE: {fname}>\n")
+            if not self._exists(child_path):
+                child_path = os.path.join(parent_dir, fname)
 
-        flattened_content = pattern.sub(replace_match, content)
-        
-        return flattened_content
+            # QUAN TRỌNG: Kẹp nội dung giữa 2 Marker; text sau lệnh include được ghi khi xong file con
+            self._emit_marker(f"\n% <BEGIN_FILE: {fname}>\n")
+            child = self._open_file(child_path, depth + 1, (fname, tail, file_id, tail_line))
+            if child is not None:
+                stack.append(child)
+
+        content = "".join(self._chunks)
+        self._chunks = None
+        return content
 
 class LatexStructureBuilder:
-    def __init__(self, flattened_content, paper_id, version):
+    def __init__(self, flattened_content, paper_id, version, source_map=None, tokens=None):
         self.content = flattened_content
         self.paper_id = paper_id
         self.version = version
+        # SourceMap của flattened_content (tùy chọn): node nào có thì gắn 'origin' = (file, dòng) của header
+        self.source_map = source_map
+        # Bảng token của flattened_content (tokenize một lần cho cả version nếu không truyền vào)
+        self.tokens = tokens
+        # Chỉ mục cặp ngoặc {} của flattened_content (tạo khi lấy title đầu tiên)
+        self.braces = None
+        # ID node xác định: document / header theo title (thay uuid4)
+        self.ids = NodeIdFactory(paper_id, version)
         # Định nghĩa thứ tự cấp bậc (nhỏ hơn là cấp cao hơn/cha)
         self.HIERARCHY_LEVELS = {
             'document': 0,      # Root
@@ -184,6 +349,7 @@ class LatexStructureBuilder:
         # Group 1: command (section, chapter...)
         # Group 2: * (nếu có)
         # Group 3: Title
+        # (build_coarse_tree lấy header từ token SECTION của tex_tokenizer - cùng ngữ nghĩa với regex này)
         self.SECTION_START_REGEX = re.compile(
             r'\\(part|chapter|section|subsection|subsubsection|paragraph|subparagraph)(\*?)\s*\{', 
             re.IGNORECASE
@@ -195,53 +361,51 @@ class LatexStructureBuilder:
         start_idx: Vị trí ngay sau dấu '{' mở đầu.
         Returns: (title_content, end_idx)
         """
-        depth = 1
-        current_idx = start_idx
-        max_len = len(self.content)
-        
-        while current_idx < max_len and depth > 0:
-            char = self.content[current_idx]
-            if char == '{':
-                depth += 1
-            elif char == '}':
-                depth -= 1
-            
-            if depth > 0:
-                current_idx += 1
-        
+        # Tra '}' khớp trong BraceIndex (O(1)) thay vì đếm ngoặc từng ký tự
+        if self.braces is None:
+            self.braces = BraceIndex(self.content)
+        current_idx = self.braces.match(start_idx - 1)
+        if current_idx < 0:
+            # Không có '}' đóng: lấy tới hết text (như khi đếm ngoặc chạy hết content)
+            current_idx = len(self.content)
+
         # current_idx lúc này đang ở dấu '}' đóng cuối cùng
         title = self.content[start_idx:current_idx]
         return title, current_idx + 1  # +1 để nhảy qua dấu '}'
 
     def build_coarse_tree(self):
-        root = {
-            'id': f'{self.paper_id}-{self.version}-document-{uuid.uuid4()}',
-            'type': 'document',
-            'title': 'Root Document',
-            'level': 0,
-            'raw_content': "",
-            'children': []
-        }
+        root = HierarchyNode(
+            id=self.ids.make('document', ''),
+            type='document',
+            title='Root Document',
+            level=0,
+            raw_content="",
+        )
+        # Content của các node là spans (start, end) trong buffer dùng chung này (không copy text);
+        # LatexContentProcessor.process_tree cắt text từ buffer khi cần và bỏ key này đi
+        root['raw_buffer'] = self.content
+        if self.source_map is not None:
+            root['origin'] = self.source_map.locate(0)
         stack = [root]
         
         cleaner = LatexCleaner()
         # SỬA 2: Logic lặp thay đổi để kết hợp Regex + Manual Counting
         cursor = 0
         
-        # Tìm tất cả các điểm bắt đầu
-        # Lưu ý: finditer sẽ tìm các match.
-        matches = list(self.SECTION_START_REGEX.finditer(self.content))
+        # Tìm tất cả các điểm bắt đầu: token SECTION của bảng token (tokenize một lần cho cả version)
+        if self.tokens is None:
+            self.tokens = tokenize(self.content)
         
-        for match in matches:
-            match_start = match.start()
-            match_end = match.end() # Vị trí ngay sau dấu '{'
+        for kind, match_start, match_end, command in self.tokens:
+            if kind != tex_tokenizer.SECTION and kind != tex_tokenizer.SECTION_STAR:
+                continue
+            # match_end: Vị trí ngay sau dấu '{'
             
             # Nếu match nằm trước cursor (đã bị xử lý bởi logic lồng nhau nào đó - hiếm gặp nhưng cứ check), bỏ qua
             if match_start < cursor: 
                 continue
 
-            command = match.group(1)
-            is_starred = match.group(2) == '*'
+            is_starred = kind == tex_tokenizer.SECTION_STAR
             
             # SỬA 3: Dùng hàm đếm ngoặc để lấy title chính xác
             # title_raw sẽ chứa: "\textbf{Spiral-type galaxies}" (bao gồm cả command bên trong)
@@ -257,10 +421,7 @@ class LatexStructureBuilder:
             current_level = self.HIERARCHY_LEVELS.get(command, 100)
             
             # Lấy text đoạn trước header này gán cho node trước đó
-            text_segment = self.content[cursor:match_start]
-            if text_segment.strip():
-                if 'raw_content' not in stack[-1]: stack[-1]['raw_content'] = ""
-                stack[-1]['raw_content'] += text_segment
+            self._append_raw_content(stack[-1], cursor, match_start)
 
             # Adjust Stack
             while len(stack) > 1 and stack[-1]['level'] >= current_level:
@@ -275,15 +436,16 @@ class LatexStructureBuilder:
                 # hoặc tạo một node riêng. Ở đây ta pass để xử lý tiếp content
                 # pass 
             
-            new_node = {
-                'id': f'{self.paper_id}-{self.version}-{command}-{uuid.uuid4()}',
-                'type': command,
-                'title': title_clean.strip(), # Title đã sạch
-                'level': current_level,
-                'is_starred': is_starred,
-                'raw_content': "", 
-                'children': []
-            }
+            new_node = HierarchyNode(
+                id=self.ids.make(command, title_clean.strip()),
+                type=command,
+                title=title_clean.strip(), # Title đã sạch
+                level=current_level,
+                is_starred=is_starred,
+                raw_content="",
+            )
+            if self.source_map is not None:
+                new_node['origin'] = self.source_map.locate(match_start)
 
             parent['children'].append(new_node)
             stack.append(new_node)
@@ -292,22 +454,40 @@ class LatexStructureBuilder:
             cursor = end_idx
 
         # Xử lý phần dư cuối cùng
-        remaining_text = self.content[cursor:]
-        if remaining_text.strip():
-            if 'raw_content' not in stack[-1]: stack[-1]['raw_content'] = ""
-            stack[-1]['raw_content'] += remaining_text
+        self._append_raw_content(stack[-1], cursor, len(self.content))
 
         return root
 
+    def _append_raw_content(self, node, start, end):
+        """
+        Gán content[start:end] cho node dưới dạng span ('raw_spans': [(start, end)]), không cắt text.
+        Node nhận đúng một đoạn thì giữ kèm window của bảng token ('raw_tokens') để
+        LatexContentProcessor tách block không cần quét lại text.
+        """
+        # Đoạn chỉ có khoảng trắng thì bỏ qua (tương đương content[start:end].strip() rỗng, không copy)
+        if not REGEX_NON_SPACE.search(self.content, start, end):
+            return
+        if node.get('raw_spans'):
+            node.pop('raw_tokens', None)
+            node['raw_spans'].append((start, end))
+        else:
+            node['raw_tokens'] = self.tokens.window(start, end)
+            node['raw_spans'] = [(start, end)]
+
+    def get_raw_content(self, node):
+        """Text thô của node trong cây thô (ghép từ 'raw_spans'; node khác thì lấy 'raw_content')."""
+        if node.get('raw_spans'):
+            return "".join(self.content[start:end] for start, end in node['raw_spans'])
+        return node.get('raw_content', '')
+
     def print_tree(self, node, indent=0):
         """Hàm helper để in cây ra console kiểm tra"""
-        prefix = "  " * indent
-        preview = (node.get('raw_content', '')[:50] + '...') if node.get('raw_content') else "[Empty]"
-        print(f"{prefix}- [{node['type'].upper()}] {node['title']} (ID: {node['id'][:8]})")
-        print(f"{prefix}  Content Preview: {preview}")
-        
-        for child in node['children']:
-            self.print_tree(child, indent + 1)
+        for _, current, depth in iter_tree(node):
+            prefix = "  " * (indent + depth)
+            raw_content = self.get_raw_content(current)
+            preview = (raw_content[:50] + '...') if raw_content else "[Empty]"
+            print(f"{prefix}- [{current['type'].upper()}] {current['title']} (ID: {current['id'][:8]})")
+            print(f"{prefix}  Content Preview: {preview}")
     
     def print_tree_to_file(self, root_node, output_path):
         """
@@ -321,7 +501,7 @@ class LatexStructureBuilder:
         {
             "nodes": [
                 {
-                    "id": "uuid",
+                    "id": "paper-v1-section-<digest>",
                     "type": "section",
                     "title": "Section Title",
                     "level": 3,
@@ -339,14 +519,14 @@ class LatexStructureBuilder:
         nodes = []
         edges = []
         
-        def traverse(node, parent_id=None):
+        def visit(node, parent_id):
             # Thêm node hiện tại vào danh sách
             node_data = {
                 "id": node['id'],
                 "type": node['type'],
                 "title": node['title'],
                 "level": node['level'],
-                "content": node.get('raw_content', '')
+                "content": self.get_raw_content(node)
             }
             nodes.append(node_data)
             
@@ -356,13 +536,11 @@ class LatexStructureBuilder:
                     "from": parent_id,
                     "to": node['id']
                 })
-            
-            # Đệ quy cho các children
-            for child in node.get('children', []):
-                traverse(child, node['id'])
+            # parent_id của các children
+            return node['id']
         
-        # Bắt đầu traverse từ root
-        traverse(root_node)
+        # Duyệt từ root (không đệ quy)
+        walk_tree(root_node, visit)
         
         # Tạo cấu trúc dữ liệu cuối cùng
         output_data = {
@@ -382,146 +560,231 @@ class LatexStructureBuilder:
         print(f"   - Tổng số nodes: {len(nodes)}")
         print(f"   - Tổng số edges: {len(edges)}")
 
-    def export_to_markdown(self, root_node):
+    def export_to_markdown(self, root_node, out=None):
         """
         Export the parsed tree to Markdown format.
         
         Args:
             root_node: The root node of the parsed tree.
+            out: Optional text sink with write() (e.g. a file opened in text mode).
+                Output is streamed chunk by chunk instead of being built in memory.
             
         Returns:
-            str: The content in Markdown format.
+            str: The content in Markdown format (None when written to out).
         """
-        def traverse_and_build(node, depth=0):
-            md = ""
-            
-            # --- HANDLE METADATA NODES ---
-            if node['type'] == 'title':
-                return f"# {node['title']}\n\n"
-            
-            if node['type'] == 'author':
-                # Lấy nội dung author (có thể lưu ở title hoặc content/raw_content)
-                val = node.get('content', node.get('raw_content', node['title']))
-                return f"**Authors:** {val}\n\n"
-
-            if node['type'] == 'abstract':
-                md += "## Abstract\n\n"
-                # Abstract children are sentences, handled by recursion
-            
-            # 1. Add Header with appropriate Markdown level
-            # Skip header for metadata nodes handled above
-            elif node['level'] > 0 and node['level'] < 99:
-                # Map LaTeX levels to Markdown headers
-                md_level = min(node['level'], 6)
-                md += f"\n{'#' * md_level} {node['title']}\n\n"
-            
-            # 2. Add Content based on type
-            raw_content = node.get('raw_content', '').strip()
-            
-            if node['type'] == 'equation':
-                md += f"$$\n{raw_content}\n$$\n\n"
-            
-            elif node['type'] == 'figure':
-                md += f"> **[{node['title']}]**\n> {raw_content}\n\n"
-            
-            elif node['type'] == 'list':
-                md += "\n"  # Lists handled by children
-            
-            elif node['type'] == 'list_item':
-                indent = "  " * depth
-                md += f"{indent}- {raw_content}\n"
-            
-            elif node['type'] == 'sentence':
-                md += f"{raw_content}\n\n"
-            
-            elif node['type'] not in ['abstract'] and raw_content:
-                # For other types, just add raw content if exists
-                md += f"{raw_content}\n\n"
-            
-            # 3. Recurse Children
-            for child in node.get('children', []):
-                # Increase depth for list items
-                child_depth = depth + 1 if node['type'] == 'list' else depth
-                md += traverse_and_build(child, child_depth)
-            
-            return md
-        
-        markdown_content = traverse_and_build(root_node)
-        return markdown_content.strip()
+        return run_visitors(root_node, MarkdownExportVisitor(out))[0]
 
-    def export_to_html(self, root_node):
+    def export_to_html(self, root_node, out=None):
         """
         Export the parsed tree to HTML format.
         
         Args:
             root_node: The root node of the parsed tree.
+            out: Optional text sink with write() (e.g. a file opened in text mode).
+                Output is streamed chunk by chunk instead of being built in memory.
             
         Returns:
-            str: The content in HTML format.
+            str: The content in HTML format (None when written to out).
         """
-        def traverse_and_build(node):
-            html = ""
-            
-            # --- HANDLE METADATA NODES ---
-            if node['type'] == 'title':
-                return f"<h1 class='paper-title'>{node['title']}</h1>\n"
-            
-            if node['type'] == 'author':
-                 val = node.get('content', node.get('raw_content', node['title']))
-                 return f"<div class='authors'><strong>Authors:</strong> {val}</div>\n"
-            
-            if node['type'] == 'abstract':
-                html += "<section class='abstract'>\n<h2>Abstract</h2>\n"
-                for child in node.get('children', []):
-                    html += traverse_and_build(child)
-                html += "</section>\n"
-                return html
-
-            # 1. Add Header with appropriate HTML tag
-            if node['level'] > 0 and node['level'] < 99:
-                html_level = min(node['level'], 6)
-                html += f"<h{html_level}>{node['title']}</h{html_level}>\n"
-            
-            # 2. Add Content based on type
-            raw_content = node.get('raw_content', '').strip()
-            
-            if node['type'] == 'equation':
-                # Use MathJax/KaTeX compatible format
-                html += f'<div class="equation">\n$$\n{raw_content}\n$$\n</div>\n'
-            
-            elif node['type'] == 'figure':
-                html += f'<figure>\n<figcaption>{node["title"]}</figcaption>\n<blockquote>{raw_content}</blockquote>\n</figure>\n'
-            
-            elif node['type'] == 'list':
-                # Determine list type
-                list_tag = "ol" if "enumerate" in node.get('title', '').lower() else "ul"
-                html += f"<{list_tag}>\n"
-                
-                # Process children
-                for child in node.get('children', []):
-                    html += traverse_and_build(child)
-                
-                html += f"</{list_tag}>\n"
-                return html  # Return early to avoid duplicate child processing
-            
-            elif node['type'] == 'list_item':
-                html += f"<li>{raw_content}</li>\n"
-            
-            elif node['type'] == 'sentence':
-                html += f"<p>{raw_content}</p>\n"
-            
-            elif raw_content:
-                # For other types, wrap in div or paragraph
-                html += f"<div>{raw_content}</div>\n"
-            
-            # 3. Recurse Children (skip if already handled like in list or abstract)
-            if node['type'] != 'list' and node['type'] != 'abstract':
-                for child in node.get('children', []):
-                    html += traverse_and_build(child)
+        return run_visitors(root_node, HtmlExportVisitor(self.paper_id, self.version, out))[0]
+
+    def export_cleaned_paper(self, root_node, out=None):
+        """
+        Reconstruct the cleaned LaTeX content from the tree.
+        This allows checking if the parsing logic preserved the content integrity.
+        
+        Args:
+            root_node: The root node of the parsed tree.
+            out: Optional text sink with write() (e.g. a file opened in text mode).
+                Output is streamed chunk by chunk instead of being built in memory.
             
-            return html
+        Returns:
+            str: The reconstructed LaTeX string (None when written to out).
+        """
+        return run_visitors(root_node, CleanedLatexVisitor(out))[0]
+
+class _StrippedWriter:
+    """
+    Ghi các chunk vào sink sao cho kết quả bằng "".join(chunks).strip(): bỏ khoảng trắng đầu,
+    giữ khoảng trắng cuối lại cho tới khi có chunk có nội dung tiếp theo (cuối cùng thì bỏ).
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.started = False
+        self.pending = ""
+
+    def write(self, chunk):
+        if not self.started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return
+            self.started = True
+        body = chunk.rstrip()
+        if not body:
+            self.pending += chunk
+            return
+        if self.pending:
+            self.out.write(self.pending)
+        self.out.write(body)
+        self.pending = chunk[len(body):]
+
+class _ExportVisitor(TreeVisitor):
+    """
+    Visitor export ra text theo từng chunk: vào list (finish() ghép một lần) hoặc ghi thẳng vào
+    sink `out` (có write(), vd file / io.TextIOBase) - tổng thời gian tuyến tính theo kích thước output.
+    """
+
+    # Kết quả cuối có .strip() không
+    strip = True
+
+    def __init__(self, out=None):
+        self.out = out
+        self.parts = []
+        if out is None:
+            self.write = self.parts.append
+        elif self.strip:
+            self.write = _StrippedWriter(out).write
+        else:
+            self.write = out.write
+
+    def finish(self):
+        """Chuỗi kết quả; None nếu đã ghi vào out."""
+        if self.out is not None:
+            return None
+        text = "".join(self.parts)
+        return text.strip() if self.strip else text
+
+class MarkdownExportVisitor(_ExportVisitor):
+    """Export Markdown (context: độ sâu của list item). finish() -> chuỗi Markdown."""
+
+    context = 0
+
+    def enter(self, node, depth):
+        md = self.write
         
-        html_content = f"""<!DOCTYPE html>
+        # --- HANDLE METADATA NODES ---
+        if node['type'] == 'title':
+            md(f"# {node['title']}\n\n")
+            return SKIP
+        
+        if node['type'] == 'author':
+            # Lấy nội dung author (có thể lưu ở title hoặc content/raw_content)
+            val = node.get('content', node.get('raw_content', node['title']))
+            md(f"**Authors:** {val}\n\n")
+            return SKIP
+
+        if node['type'] == 'abstract':
+            md("## Abstract\n\n")
+            # Abstract children are sentences, handled by the walk
+        
+        # 1. Add Header with appropriate Markdown level
+        # Skip header for metadata nodes handled above
+        elif node['level'] > 0 and node['level'] < 99:
+            # Map LaTeX levels to Markdown headers
+            md_level = min(node['level'], 6)
+            md(f"\n{'#' * md_level} {node['title']}\n\n")
+        
+        # 2. Add Content based on type
+        raw_content = node.get('raw_content', '').strip()
+        
+        if node['type'] == 'equation':
+            md(f"$$\n{raw_content}\n$$\n\n")
+        
+        elif node['type'] == 'figure':
+            md(f"> **[{node['title']}]**\n> {raw_content}\n\n")
+        
+        elif node['type'] == 'list':
+            md("\n")  # Lists handled by children
+            # Increase depth for list items
+            return depth + 1
+        
+        elif node['type'] == 'list_item':
+            indent = "  " * depth
+            md(f"{indent}- {raw_content}\n")
+        
+        elif node['type'] == 'sentence':
+            md(f"{raw_content}\n\n")
+        
+        elif node['type'] not in ['abstract'] and raw_content:
+            # For other types, just add raw content if exists
+            md(f"{raw_content}\n\n")
+        
+        # 3. Children: cùng depth
+        return depth
+
+class HtmlExportVisitor(_ExportVisitor):
+    """Export HTML (phần <head> được ghi ngay khi tạo visitor). finish() -> trang HTML đầy đủ."""
+
+    strip = False
+
+    def __init__(self, paper_id, version, out=None):
+        super().__init__(out)
+        self.paper_id = paper_id
+        self.version = version
+        self.write(self._head())
+
+    def enter(self, node, context):
+        html = self.write
+        
+        # --- HANDLE METADATA NODES ---
+        if node['type'] == 'title':
+            html(f"<h1 class='paper-title'>{node['title']}</h1>\n")
+            return SKIP
+        
+        if node['type'] == 'author':
+             val = node.get('content', node.get('raw_content', node['title']))
+             html(f"<div class='authors'><strong>Authors:</strong> {val}</div>\n")
+             return SKIP
+        
+        if node['type'] == 'abstract':
+            # Đóng </section> trong leave
+            html("<section class='abstract'>\n<h2>Abstract</h2>\n")
+            return context
+
+        # 1. Add Header with appropriate HTML tag
+        if node['level'] > 0 and node['level'] < 99:
+            html_level = min(node['level'], 6)
+            html(f"<h{html_level}>{node['title']}</h{html_level}>\n")
+        
+        # 2. Add Content based on type
+        raw_content = node.get('raw_content', '').strip()
+        
+        if node['type'] == 'equation':
+            # Use MathJax/KaTeX compatible format
+            html(f'<div class="equation">\n$$\n{raw_content}\n$$\n</div>\n')
+        
+        elif node['type'] == 'figure':
+            html(f'<figure>\n<figcaption>{node["title"]}</figcaption>\n<blockquote>{raw_content}</blockquote>\n</figure>\n')
+        
+        elif node['type'] == 'list':
+            # Determine list type (thẻ đóng trong leave)
+            html(f"<{self._list_tag(node)}>\n")
+        
+        elif node['type'] == 'list_item':
+            html(f"<li>{raw_content}</li>\n")
+        
+        elif node['type'] == 'sentence':
+            html(f"<p>{raw_content}</p>\n")
+        
+        elif raw_content:
+            # For other types, wrap in div or paragraph
+            html(f"<div>{raw_content}</div>\n")
+        
+        return context
+
+    def leave(self, node, context):
+        if node['type'] == 'abstract':
+            self.write("</section>\n")
+        elif node['type'] == 'list':
+            self.write(f"</{self._list_tag(node)}>\n")
+
+    @staticmethod
+    def _list_tag(node):
+        return "ol" if "enumerate" in node.get('title', '').lower() else "ul"
+
+    def _head(self):
+        return f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -543,67 +806,111 @@ class LatexStructureBuilder:
     </style>
 </head>
 <body>
-{traverse_and_build(root_node)}
-</body>
-</html>"""
-        
-        return html_content
+"""
 
-    def export_cleaned_paper(self, root_node):
-        """
-        Reconstruct the cleaned LaTeX content from the tree.
-        This allows checking if the parsing logic preserved the content integrity.
+    def finish(self):
+        self.write("\n</body>\n</html>")
+        return super().finish()
+
+class CleanedLatexVisitor(_ExportVisitor):
+    """Dựng lại LaTeX đã clean từ cây. finish() -> chuỗi LaTeX."""
+
+    LATEX_SECTIONS = {'part', 'chapter', 'section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph'}
+
+    def enter(self, node, context):
+        text = self.write
         
-        Args:
-            root_node: The root node of the parsed tree.
-            
-        Returns:
-            str: The reconstructed LaTeX string.
-        """
-        def traverse_and_build(node):
-            text = ""
-            
-            # 1. Reconstruct Header (if not Document root)
-            if node['level'] > 0 and node['level'] < 99:
-                lat_sections = {'part', 'chapter', 'section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph'}
-                if node['type'] in lat_sections:
-                    star = "*" if node.get('is_starred') else ""
-                    text += f"\n\\{node['type']}{star}{{{node['title']}}}\n\n"
-            
-            # 2. Add Content based on type
-            raw_content = node.get('raw_content', '').strip()
-            
-            if node['type'] == 'equation':
-                text += f"\n{raw_content}\n\n"
-            elif node['type'] == 'figure':
-                text += f"\n{raw_content}\n\n"
-            elif node['type'] == 'list_item':
-                text += f"\\item {raw_content}\n"
-            elif node['type'] == 'list':
-                list_type = "itemize"
-                if "enumerate" in node.get('title', '').lower():
-                    list_type = "enumerate"
-                text += f"\n\\begin{{{list_type}}}\n"
-                for child in node.get('children', []):
-                    text += traverse_and_build(child)
-                text += f"\\end{{{list_type}}}\n\n"
-                return text  # Return early to avoid duplicate processing
-            elif raw_content:
-                text += f"{raw_content}\n\n"
-            
-            # 3. Recurse Children
-            if node['type'] != 'list':
-                for child in node.get('children', []):
-                    text += traverse_and_build(child)
-                
-            return text
+        # 1. Reconstruct Header (if not Document root)
+        if node['level'] > 0 and node['level'] < 99:
+            if node['type'] in self.LATEX_SECTIONS:
+                star = "*" if node.get('is_starred') else ""
+                text(f"\n\\{node['type']}{star}{{{node['title']}}}\n\n")
+        
+        # 2. Add Content based on type
+        raw_content = node.get('raw_content', '').strip()
+        
+        if node['type'] == 'equation':
+            text(f"\n{raw_content}\n\n")
+        elif node['type'] == 'figure':
+            text(f"\n{raw_content}\n\n")
+        elif node['type'] == 'list_item':
+            text(f"\\item {raw_content}\n")
+        elif node['type'] == 'list':
+            # \end{...} trong leave
+            text(f"\n\\begin{{{self._list_type(node)}}}\n")
+        elif raw_content:
+            text(f"{raw_content}\n\n")
+        
+        # 3. Children
+        return context
+
+    def leave(self, node, context):
+        if node['type'] == 'list':
+            self.write(f"\\end{{{self._list_type(node)}}}\n\n")
+
+    @staticmethod
+    def _list_type(node):
+        return "enumerate" if "enumerate" in node.get('title', '').lower() else "itemize"
+
+class PendingContent:
+    """Nội dung chưa tách của một node (lazy): gọi pending(node) để tách và gắn vào node."""
+
+    __slots__ = ('processor', 'text', 'span', 'tokens')
+
+    def __init__(self, processor, text, span, tokens):
+        self.processor = processor
+        self.text = text
+        self.span = span
+        self.tokens = tokens
+
+    def __call__(self, node):
+        self.processor.expand_content(node, self.text, self.span, self.tokens)
+
+# Node lá của nội dung: không chứa nội dung cần tách
+CONTENT_LEAF_TYPES = frozenset(('sentence', 'equation', 'figure', 'list_item'))
 
-        return traverse_and_build(root_node).strip()
+def _structural_children(node):
+    """Các con có thể chứa content cần tách (part, chapter, section..., list), bỏ sentence/equation (node lá)."""
+    return [child for child in node['children'] if child['type'] not in CONTENT_LEAF_TYPES]
+
+def _header_children(node):
+    """Các con hiện có của node (lazy: đều là header của cây thô), đọc không kích hoạt tách nội dung."""
+    return node.children if isinstance(node, HierarchyNode) else node['children']
+
+class ContentProcessingVisitor(TreeVisitor):
+    """
+    Lượt tách nội dung của LatexContentProcessor dạng visitor (context: buffer dùng chung).
+    Các con mới tạo của node có ngay sau enter, nên visitor đứng sau (dedup, export) trong cùng
+    run_visitors thấy cây đã tách.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def enter(self, node, buffer):
+        # Chỉ tách nội dung ở node cấu trúc (part, chapter, section...) hoặc list, không ở sentence/equation (node lá)
+        if node['type'] in CONTENT_LEAF_TYPES:
+            return SKIP
+        if buffer is None:
+            buffer = node.pop('raw_buffer', None)
+        # Xử lý raw_content của node hiện tại (nếu có)
+        content = self.processor._take_content(node, buffer)
+        if content is not None:
+            if self.processor.lazy and isinstance(node, HierarchyNode):
+                node[PENDING_KEY] = PendingContent(self.processor, *content)
+            else:
+                self.processor.expand_content(node, *content)
+        return buffer
 
 class LatexContentProcessor:
-    def __init__(self, paper_id, version):
+    def __init__(self, paper_id, version, lazy=False):
         self.paper_id = paper_id
         self.version = version
+        # ID node xác định theo nội dung (thay uuid4), trong phạm vi node đang được tách
+        self.ids = NodeIdFactory(paper_id, version)
+        self._id_scope = ''
+        # lazy: process_tree chỉ duyệt header, nội dung tách khi cần (outline / thống kê section không phải chờ)
+        self.lazy = lazy
         
         # --- REGEX PATTERNS ---
         
@@ -641,60 +948,83 @@ class LatexContentProcessor:
                     r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s+(?=[A-Z\(])'
                 )
 
-    def process_tree(self, node):
+    def process_tree(self, node, buffer=None):
+        """
+        Duyệt cây cấu trúc thô (không đệ quy) để "mổ xẻ" raw_content thành các elements.
+        buffer: Text dùng chung mà 'raw_spans' của các node trỏ vào (lấy từ 'raw_buffer' của root).
+
+        Lazy (self.lazy): chỉ duyệt các node header, nội dung mỗi node được giữ nguyên dạng span và
+        gắn thành PendingContent; tách khi node['children'] được đọc lần đầu hoặc khi gọi
+        node.expand() / node.materialize().
+
+        Để gộp với các lượt khác (dedup, export) trong một lượt duyệt: dùng
+        run_visitors(root, ContentProcessingVisitor(processor), ...).
+        """
+        visitor = ContentProcessingVisitor(self)
+        children = _header_children if self.lazy else _structural_children
+        walk_tree(node, visitor.enter, context=buffer, children=children)
+
+    def _take_content(self, node, buffer):
         """
-        Duyệt đệ quy cây cấu trúc thô để "mổ xẻ" raw_content thành các elements.
+        Lấy (và bỏ khỏi node) nội dung thô của node.
+        Returns: (text, span, tokens) - nội dung là text[span[0]:span[1]] (span None -> cả text); None nếu không có
         """
-        # 1. Xử lý raw_content của node hiện tại (nếu có)
+        raw_tokens = node.pop('raw_tokens', None)
+        raw_spans = node.pop('raw_spans', None)
+        if raw_spans and buffer is not None:
+            if len(raw_spans) == 1:
+                return buffer, raw_spans[0], raw_tokens
+            # Node nhận nhiều đoạn (hiếm): ghép lại thành text riêng
+            return "".join(buffer[start:end] for start, end in raw_spans), None, None
         if node.get('raw_content') and node['raw_content'].strip():
-            # Tách nội dung thành các node con chi tiết (câu, hình, công thức...)
+            return node['raw_content'], None, None
+        return None
 
+    def expand_content(self, node, text, span=None, tokens=None):
+        """
+        Tách nội dung text[span] của node thành các node con chi tiết (câu, hình, công thức...)
+        và chèn vào đầu children. ID của các node mới tính trong phạm vi ID của node
+        (không phụ thuộc thứ tự các node được tách).
+        """
+        outer_scope, self._id_scope = self._id_scope, node['id']
+        try:
             if node.get('level') == 0 and node['type'] == 'document':
                 # Với document root, ta có thể muốn xử lý preamble riêng
                 # Giả sử ta có hàm _process_preamble để trích xuất title, author, abstract
-                preamble_nodes = self._process_preamble(node['raw_content'])
-                
-                # Chèn các node preamble vào đầu danh sách children
-                node['children'] = preamble_nodes + node['children']
-                
-                # Xóa raw_content để giải phóng bộ nhớ và đánh dấu là đã xử lý
-                del node['raw_content']
+                preamble_text = text[span[0]:span[1]] if span else text
+                new_nodes = self._process_preamble(preamble_text)
             else:
-                fine_grained_nodes = self.parse_content_blocks(node['raw_content'])
-                # print(fine_grained_nodes)
-                # QUAN TRỌNG: Chèn các node nội dung vào ĐẦU danh sách children
-                # Lý do: Trong LaTeX, text của Section luôn nằm trước Subsection con.
-                node['children'] = fine_grained_nodes + node['children']
-                
-                # Xóa raw_content để giải phóng bộ nhớ và đánh dấu là đã xử lý
-                del node['raw_content']
-
-        # 2. Đệ quy xử lý các con (bao gồm cả các Subsection cũ và các List mới tạo)
-        # Lưu ý: Ta chỉ đệ quy vào các node cấu trúc (part, chapter, section...) 
-        # hoặc list, không cần đệ quy vào sentence/equation (node lá).
-        for child in node['children']:
-            # Chỉ đệ quy nếu node con đó có thể chứa content con (ví dụ List hoặc Section con)
-            if child['type'] not in ['sentence', 'equation', 'figure', 'list_item']:
-                self.process_tree(child)
-
-    def parse_content_blocks(self, text):
+                # Span -> tách block trực tiếp trên buffer, chỉ cắt text của từng block / đoạn văn
+                new_nodes = self.parse_content_blocks(text, tokens, span)
+        finally:
+            self._id_scope = outer_scope
+
+        # QUAN TRỌNG: Chèn các node nội dung vào ĐẦU danh sách children
+        # Lý do: Trong LaTeX, text của Section luôn nằm trước Subsection con.
+        # (node.children: không kích hoạt lại tách nội dung lazy)
+        if isinstance(node, HierarchyNode):
+            node.children = new_nodes + node.children
+        else:
+            node['children'] = new_nodes + node['children']
+
+        # Xóa raw_content để giải phóng bộ nhớ và đánh dấu là đã xử lý
+        node.pop('raw_content', None)
+
+    def parse_content_blocks(self, text, tokens=None, span=None):
         """
         Cắt chuỗi text hỗn hợp thành danh sách các Node Elements
+        tokens: Bảng token của text (window từ LatexStructureBuilder); None -> tokenize text
+        span: (start, end) -> chỉ xử lý text[start:end] (tokens là window của đúng span này)
         """
         elements = []
         
-        # Pattern tổng hợp để split: Math OR Figure OR List
-
-        combined_pattern_str = f"({self.REGEX_MATH_BLOCK.pattern}|{self.REGEX_FIGURE.pattern}|{self.REGEX_LIST.pattern})"
-
-        pattern = re.compile(combined_pattern_str, re.DOTALL | re.IGNORECASE)
-        # pattern = re.compile(
-        #     f"({self.REGEX_MATH_BLOCK.pattern}|{self.REGEX_FIGURE.pattern}|{self.REGEX_LIST.pattern})",
-        #     re.DOTALL | re.IGNORECASE
-        # )
-        # print(text)
-        # Split text, giữ lại delimiter (chính là nội dung block)
-        parts = pattern.split(text)
+        # Split text theo block Math OR Figure OR List, giữ lại delimiter (chính là nội dung block).
+        # Block được ghép từ token (không chạy regex tổng hợp trên text)
+        if tokens is None:
+            if span is not None:
+                text, span = text[span[0]:span[1]], None
+            tokens = tokenize(text)
+        parts = self._split_blocks(text, tokens, span)
         cleaner = LatexCleaner()
 
 
@@ -739,6 +1069,64 @@ class LatexContentProcessor:
                     
         return elements
     
+    # Loại block theo tên môi trường (không phân biệt hoa thường như pattern tổng hợp cũ)
+    _BLOCK_ENVS = {
+        'equation': 'equation', 'equation*': 'equation',
+        'figure': 'figure', 'figure*': 'figure', 'table': 'figure', 'table*': 'figure',
+        'itemize': 'list', 'enumerate': 'list',
+    }
+
+    def _split_blocks(self, text, tokens, span=None):
+        """
+        Tương đương `re.split` với pattern tổng hợp (REGEX_MATH_BLOCK | REGEX_FIGURE | REGEX_LIST):
+        mở block ở token mở đầu tiên, đóng ở token đóng cùng loại gần nhất (non-greedy).
+        Giữ nguyên kết quả cũ với list: split trả thêm các group con (list, tên môi trường mở/đóng).
+        span: (start, end) -> tách text[start:end]; offset token tính từ start, chỉ cắt từng phần.
+        """
+        base, stop = span if span is not None else (0, len(text))
+        toks = list(tokens)
+        # Vị trí (index token) các token đóng của từng loại block -> tìm token đóng gần nhất bằng bisect
+        closers = {}
+        for j, (kind, _, _, name) in enumerate(toks):
+            if kind == tex_tokenizer.END:
+                block = self._BLOCK_ENVS.get(name.lower())
+            elif kind == tex_tokenizer.DISPLAY_CLOSE:
+                block = tex_tokenizer.DISPLAY_OPEN
+            elif kind == tex_tokenizer.DOLLARS:
+                block = tex_tokenizer.DOLLARS
+            else:
+                block = None
+            if block is not None:
+                closers.setdefault(block, []).append(j)
+
+        parts = []
+        last = 0
+        k = 0
+        while k < len(toks):
+            kind, start, _, name = toks[k]
+            if kind == tex_tokenizer.BEGIN:
+                block = self._BLOCK_ENVS.get(name.lower())
+            elif kind == tex_tokenizer.DISPLAY_OPEN or kind == tex_tokenizer.DOLLARS:
+                block = kind
+            else:
+                block = None
+            candidates = closers.get(block) if block is not None else None
+            pos = bisect.bisect_right(candidates, k) if candidates else 0
+            if not candidates or pos == len(candidates):
+                k += 1
+                continue
+            close = candidates[pos]
+
+            end = toks[close][2]
+            parts.append(text[base + last:base + start])
+            parts.append(text[base + start:base + end])
+            if block == 'list':
+                parts.extend((parts[-1], name, toks[close][3]))
+            last = end
+            k = close + 1
+        parts.append(text[base + last:stop])
+        return parts
+
     def _process_preamble(self, preamble_text):
         """
         Input: Text vùng preamble.
@@ -746,46 +1134,55 @@ class LatexContentProcessor:
         """
         nodes = []
         cleaner = LatexCleaner()
+        # Đối số của \title / \author / \abstract lấy theo cặp ngoặc khớp (lồng sâu tùy ý)
+        braces = BraceIndex(preamble_text)
+
+        def command_arguments(command):
+            pattern = r'\\' + command + r'(?:\s*\[.*?\])?\s*\{'
+            for match in re.finditer(pattern, preamble_text, re.DOTALL | re.IGNORECASE):
+                argument = braces.argument(match.end() - 1)
+                if argument is not None:
+                    yield argument
+
         # 1. Trích xuất Title (Leaf Node)
-        title_match = re.search(r'\\title(?:\s*\[.*?\])?\s*\{((?:[^{}]|{[^{}]*})*)\}', preamble_text, re.DOTALL | re.IGNORECASE)
-        if title_match:
-            clean_title = cleaner.clean_latex(title_match.group(1))
-            nodes.append({
-                "id": f"{self.paper_id}-{self.version}-title-{uuid.uuid4()}",
-                "title": clean_title,
-                "content": clean_title,
-                "type": "title",
-                "level": 99,
-                "children": [] # Title là lá
-            })
+        title_raw = next(command_arguments('title'), None)
+        if title_raw is not None:
+            clean_title = cleaner.clean_latex(title_raw)
+            nodes.append(HierarchyNode(
+                id=self.ids.make('title', clean_title, self._id_scope),
+                title=clean_title,
+                content=clean_title,
+                type="title",
+                level=99,
+                children=[] # Title là lá
+            ))
 
         # 2. Trích xuất Authors (Leaf Node)
         # Gom tất cả author thành 1 chuỗi hoặc tạo list
         authors = []
-        for match in re.finditer(r'\\author(?:\s*\[.*?\])?\s*\{((?:[^{}]|{[^{}]*})*)\}', preamble_text, re.DOTALL | re.IGNORECASE):
-            clean_auth = cleaner.clean_latex(match.group(1))
+        for author_raw in command_arguments('author'):
+            clean_auth = cleaner.clean_latex(author_raw)
             if clean_auth:
                 authors.append(clean_auth)
         
         if authors:
-            nodes.append({
-                "id": f"{self.paper_id}-{self.version}-authors-{uuid.uuid4()}",
-                "title": ", ".join(authors), # Nối lại hoặc để array tùy cấu trúc của bạn
-                "content": ", ".join(authors),
-                "type": "author",
-                "level": 99,
-                "children": []
-            })
+            nodes.append(HierarchyNode(
+                id=self.ids.make('authors', ", ".join(authors), self._id_scope),
+                title=", ".join(authors), # Nối lại hoặc để array tùy cấu trúc của bạn
+                content=", ".join(authors),
+                type="author",
+                level=99,
+            ))
 
         # 3. Trích xuất Abstract (Component Node - Có con là sentences) co level cung voi paragraph
         # Tìm abstract environment
         abs_match = re.search(r'\\begin\s*\{abstract\}(.*?)\\end\s*\{abstract\}', preamble_text, re.DOTALL | re.IGNORECASE)
-        if not abs_match:
+        raw_abstract = abs_match.group(1) if abs_match else None
+        if raw_abstract is None:
              # Fallback tìm lệnh \abstract{}
-             abs_match = re.search(r'\\abstract\s*\{((?:[^{}]|{[^{}]*})*)\}', preamble_text, re.DOTALL | re.IGNORECASE)
+             raw_abstract = next(command_arguments('abstract'), None)
 
-        if abs_match:
-            raw_abstract = abs_match.group(1)
+        if raw_abstract is not None:
             
             # QUAN TRỌNG: Dùng LatexContentProcessor để tách câu cho Abstract
             # Cắt chuỗi text hỗn hợp thành danh sách các Node Elements
@@ -795,14 +1192,14 @@ class LatexContentProcessor:
             for sent in abstract_sentences:
                 sent['parent'] = "abstract"
 
-            nodes.append({
-                "id": f"{self.paper_id}-{self.version}-abstract-{uuid.uuid4()}",
-                "title": "Abstract",
-                "content": "Abstract",
-                "type": "abstract", # Đánh dấu nó là 1 section đặc biệt
-                "level": 2,
-                "children": abstract_sentences
-            })
+            nodes.append(HierarchyNode(
+                id=self.ids.make('abstract', raw_abstract, self._id_scope),
+                title="Abstract",
+                content="Abstract",
+                type="abstract", # Đánh dấu nó là 1 section đặc biệt
+                level=2,
+                children=abstract_sentences
+            ))
 
         return nodes
 
@@ -816,7 +1213,8 @@ class LatexContentProcessor:
         list_node = self._create_node(
             type_name='list',
             title=f'List ({list_type})',
-            raw_content="" 
+            raw_content="",
+            key=list_content # List không có content riêng -> ID theo block gốc
         )
         
         # 2. Bóc vỏ (Unwrap) an toàn
@@ -851,16 +1249,15 @@ class LatexContentProcessor:
         return list_node
     
 
-    def _create_node(self, type_name, title, raw_content):
-        """Helper tạo node chuẩn theo format ID của bạn"""
-        return {
-            'id': f'{self.paper_id}-{self.version}-{type_name}-{uuid.uuid4()}',
-            'type': type_name,
-            'title': title,
-            'level': 99, # Level thấp nhất (lá)
-            'raw_content': raw_content,
-            'children': []
-        }
+    def _create_node(self, type_name, title, raw_content, key=None):
+        """Helper tạo node chuẩn theo format ID của bạn (ID theo key, mặc định là raw_content)"""
+        return HierarchyNode(
+            id=self.ids.make(type_name, raw_content if key is None else key, self._id_scope),
+            type=type_name,
+            title=title,
+            level=99, # Level thấp nhất (lá)
+            raw_content=raw_content,
+        )
 
     def _split_sentences(self, text):
         """Tách câu"""
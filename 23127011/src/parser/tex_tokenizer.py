@@ -0,0 +1,142 @@
+"""
+TeX Tokenizer
+=============
+
+Quét text LaTeX MỘT lần (tốc độ C) thành bảng token cấu trúc, dùng chung
+cho các bước sau thay vì mỗi bước tự chạy regex riêng trên toàn bộ text:
+
+    - BEGIN / END:    \\begin{env} / \\end{env}        (name = tên môi trường)
+    - SECTION:        \\section{ , \\subsection*{ ...  (name = lệnh, token kết thúc ngay sau '{')
+    - DOLLARS:        $$
+    - DISPLAY_OPEN:   \\[
+    - DISPLAY_CLOSE:  \\]
+
+Chỉ các token cấu trúc được ghi lại (không ghi từng ký tự / từng ngoặc, không ghi lệnh inline,
+math inline hay comment), nên phần xử lý Python tỉ lệ với số header / môi trường / công thức chứ
+không với độ dài text. Token không bao giờ che nhau: token nằm trong comment vẫn được ghi (giống các
+regex cũ chạy trên cùng text) - text đã flatten không còn comment.
+
+`LatexStructureBuilder` tokenize nội dung đã flatten một lần cho mỗi version, lấy header từ
+token SECTION và gắn cho mỗi node một `window` của bảng token; `LatexContentProcessor` tách
+block (công thức, hình/bảng, list) từ window đó mà không quét lại text.
+
+Ngoài phạm vi bảng token:
+    - `LatexFlattener` chạy trên từng file nguồn, trước khi có text của version; kết quả tách
+      (xóa comment + include) đã được memo theo hash nội dung và lưu đĩa (`flatten_cache`)
+    - `LatexCleaner` làm sạch từng câu / caption sau khi tách block: một lượt quét tên lệnh để
+      bỏ qua các bước không cần, chỉ quét lại khi xóa lệnh có thể ghép ra lệnh mới
+
+Example:
+    >>> tokens = tokenize("\\\\section{Intro} $$x$$ \\\\begin{itemize} \\\\item a \\\\end{itemize}")
+    >>> [(kind_name(k), s, e, name) for k, s, e, name in tokens][:2]
+    [('SECTION', 0, 9, 'section'), ('DOLLARS', 16, 18, None)]
+"""
+
+import bisect
+import re
+from array import array
+
+BEGIN = 2
+END = 3
+SECTION = 4
+SECTION_STAR = 5
+DOLLARS = 6
+DISPLAY_OPEN = 7
+DISPLAY_CLOSE = 8
+
+_KIND_NAMES = {
+    BEGIN: "BEGIN", END: "END", SECTION: "SECTION", SECTION_STAR: "SECTION_STAR",
+    DOLLARS: "DOLLARS", DISPLAY_OPEN: "DISPLAY_OPEN", DISPLAY_CLOSE: "DISPLAY_CLOSE",
+}
+
+# Mỗi pattern giữ đúng ngữ nghĩa regex cũ tương ứng (SECTION_START_REGEX, các block pattern).
+# Tên môi trường không chứa '\\' / '$' -> token BEGIN / END không thể che '\\]' hay '$$'
+# (không môi trường block nào có tên như vậy).
+# Tách theo ký tự đầu ('\\', '$') thay vì một regex alternation: regex bắt đầu bằng ký tự cố định
+# được engine tìm bằng quét literal (nhanh hơn ~10-20 lần so với thử mọi nhánh ở mỗi vị trí).
+BACKSLASH_PATTERN = re.compile(
+    r'\\(?:(begin|end)\{([^{}\\$]*)\}'
+    r'|((?i:part|chapter|section|subsection|subsubsection|paragraph|subparagraph))(\*?)\s*\{'
+    r'|([\[\]]))'
+)
+DOLLARS_PATTERN = re.compile(r'\$\$')
+
+
+def kind_name(kind: int) -> str:
+    """Tên của loại token (để debug / in ra)."""
+    return _KIND_NAMES.get(kind, str(kind))
+
+
+class TexTokens:
+    """
+    Bảng token (3 array song song + tên) của một text, hoặc một window [start, end) của bảng đó.
+
+    Attributes:
+        text: Text gốc đã tokenize
+        kinds: array('B') loại token
+        starts, ends: array('q') offset (tuyệt đối trong text gốc)
+        names: Tên môi trường / lệnh section (None với token khác)
+        base: Offset gốc của window (iter trả offset tương đối so với base)
+    """
+
+    def __init__(self, text, kinds, starts, ends, names, lo=0, hi=None, base=0):
+        self.text = text
+        self.kinds = kinds
+        self.starts = starts
+        self.ends = ends
+        self.names = names
+        self.lo = lo
+        self.hi = len(kinds) if hi is None else hi
+        self.base = base
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def __iter__(self):
+        """(kind, start, end, name) với offset tương đối so với base."""
+        base = self.base
+        kinds, starts, ends, names = self.kinds, self.starts, self.ends, self.names
+        for i in range(self.lo, self.hi):
+            yield kinds[i], starts[i] - base, ends[i] - base, names[i]
+
+    def window(self, start: int, end: int) -> "TexTokens":
+        """View các token nằm trọn trong [start, end) (offset tuyệt đối); không copy array."""
+        lo = bisect.bisect_left(self.starts, start, self.lo, self.hi)
+        hi = bisect.bisect_left(self.starts, end, lo, self.hi)
+        while hi > lo and self.ends[hi - 1] > end:
+            hi -= 1
+        return TexTokens(self.text, self.kinds, self.starts, self.ends, self.names, lo, hi, start)
+
+
+def tokenize(text: str) -> TexTokens:
+    """
+    Quét text một lần, trả về bảng token cấu trúc (theo thứ tự xuất hiện, không giao nhau).
+    """
+    found = []
+    for match in BACKSLASH_PATTERN.finditer(text):
+        env, env_name, section, star, display = match.groups()
+        if env is not None:
+            found.append((match.start(), match.end(), BEGIN if env == 'begin' else END, env_name))
+        elif section is not None:
+            found.append((match.start(), match.end(), SECTION_STAR if star else SECTION, section))
+        else:
+            found.append((match.start(), match.end(), DISPLAY_OPEN if display == '[' else DISPLAY_CLOSE, None))
+
+    if '$$' in text:
+        found.extend((m.start(), m.end(), DOLLARS, None) for m in DOLLARS_PATTERN.finditer(text))
+        found.sort()
+
+    kinds = array('B')
+    starts = array('q')
+    ends = array('q')
+    names = []
+    last_end = 0
+    for start, end, kind, name in found:
+        if start < last_end:
+            continue
+        kinds.append(kind)
+        starts.append(start)
+        ends.append(end)
+        names.append(name)
+        last_end = end
+    return TexTokens(text, kinds, starts, ends, names)
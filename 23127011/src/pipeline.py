@@ -1,15 +1,28 @@
 import os
 import shutil
-import json
-import uuid
 import re
 import concurrent.futures
 import logging
+import multiprocessing
+import threading
+import time
+from functools import partial
 
 from .parser import LatexFlattener, LatexStructureBuilder, LatexContentProcessor, find_root_tex_file
+from .parser import VersionFileIndex, RootDecisionCache, ROOT_CACHE_DIRNAME, list_version_sources
+from .parser import FlattenSegmentStore, FLATTEN_CACHE_DIRNAME
 from .processing import ReferenceProcessor, ReferenceDeduplicator, ContentDeduplicator, replace_citations_in_text
+from .processing import StreamingHierarchyWriter
+from .utils.manifest import load_manifest, write_manifest, build_input_manifest, is_paper_up_to_date
+from .utils.manifest import load_quarantine, write_quarantine, remove_stale_temp_files, QUARANTINE_FILENAME
+from .utils.metrics import PaperMetrics, METRICS_FILENAME, count_tree_nodes, append_metrics
+from .utils.metrics import latency_summary, format_latency
+from .utils.scheduler import estimate_paper_cost, plan_tasks
+from .utils.worker_pool import SupervisedProcessPool
+from .utils.file_cache import configure_default_cache, get_default_cache
 
-def process_single_paper(paper_id, data_raw_path, data_output_path):
+def process_single_paper(paper_id, data_raw_path, data_output_path, resume=False, compact_json=False,
+                         version_workers=None, root_cache_dir=None, flatten_cache_dir=None):
     """
     Process a single paper:
     1. Flatten & Extract Refs
@@ -18,115 +31,420 @@ def process_single_paper(paper_id, data_raw_path, data_output_path):
     4. Parse Structure & Content
     5. Dedup Content
     6. Export
-    """
-    logging.info(f"📄 Processing Paper: {paper_id}")
 
+    Args:
+        resume: Bỏ qua paper nếu manifest cho thấy input & code không đổi kể từ lần chạy thành công trước
+        compact_json: Ghi hierarchy.json dạng compact (không indent) thay vì indent=2
+        version_workers: Số workers xử lý song song các versions của paper (None/1 = tuần tự).
+            Flatten/references và build/process tree chạy song song; dedup vẫn tuần tự theo thứ tự version.
+        root_cache_dir: Thư mục RootDecisionCache (None = luôn chấm điểm lại để tìm root file)
+        flatten_cache_dir: Thư mục FlattenSegmentStore lưu kết quả phân tích từng file giữa các lần chạy
+            (None = chỉ memo trong bộ nhớ)
+
+    Returns:
+        dict: {"paper_id": str, "status": "ok" | "empty" | "failed" | "skipped", "errors": list,
+               "metrics": dict (thời gian & counters từng stage, không có nếu skipped)}
+    """
     paper_raw_path = os.path.join(data_raw_path, paper_id)
     paper_output_dir = os.path.join(data_output_path, paper_id)
+
+    # Tùy chọn ảnh hưởng tới output, được ghi vào manifest
+    output_options = {"compact_json": compact_json}
+
+    # File tạm của lần chạy trước bị kill (timeout / RSS) giữa lúc ghi (kể cả khi paper được bỏ qua)
+    remove_stale_temp_files(paper_output_dir)
+
+    if resume and is_paper_up_to_date(paper_raw_path, paper_output_dir, output_options):
+        logging.info(f"⏭️  Skipping Paper (unchanged): {paper_id}")
+        return {"paper_id": paper_id, "status": "skipped", "errors": []}
+
+    logging.info(f"📄 Processing Paper: {paper_id}")
+    metrics = PaperMetrics(paper_id)
     
     if not os.path.exists(paper_output_dir):
         os.makedirs(paper_output_dir)
 
+    # Snapshot input trước khi xử lý; manifest chỉ được ghi khi paper chạy xong
+    old_manifest = load_manifest(paper_output_dir) or {}
+    inputs = build_input_manifest(paper_raw_path, previous=old_manifest.get("inputs"))
+    errors = []
+
     # Initialize Deduplicators PER PAPER
     ref_deduplicator = ReferenceDeduplicator()
-    content_deduplicator = ContentDeduplicator()
     
     # Intermediate content for this paper
     intermediate_versions = {}
+    source_maps = {}
     
     tex_path = os.path.join(paper_raw_path, 'tex')
     if not os.path.exists(tex_path):
-        return
+        write_manifest(paper_output_dir, inputs, "empty", options=output_options)
+        return {"paper_id": paper_id, "status": "empty", "errors": [], "metrics": metrics.to_dict()}
 
-    versions = sorted(os.listdir(tex_path))
+    # Mỗi version là một thư mục hoặc một archive (.tar.gz/.zip...) đọc trực tiếp không cần giải nén
+    version_sources = list_version_sources(tex_path)
     
     # --- PHASE 1: PRE-PROCESSING (Flatten & Referencing) ---
-    for ver in versions:
-        ver_path = os.path.join(tex_path, ver)
-        if not os.path.isdir(ver_path): continue
-        
-        # 1. Flatten
-        root_file = find_root_tex_file(ver_path)
-        if not root_file:
+    # Các versions độc lập -> chạy song song (version_workers), merge tuần tự theo thứ tự version
+    prepared = _map_versions(
+        _prepare_version,
+        [(paper_id, ver, ver_path, root_cache_dir, flatten_cache_dir) for ver, ver_path in version_sources],
+        version_workers
+    )
+    for result in prepared:
+        ver = result["ver"]
+        _merge_version_metrics(metrics, ver, result)
+        if result["error"]:
+            logging.error(f"      ❌ Error in Phase 1 for {ver}: {result['error']}")
+            errors.append(f"Phase 1 ({ver}): {result['error']}")
             continue
-        
+        if result["content"] is None:
+            continue
+
         try:
-            # Step A: Flatten with references (for extraction)
-            flattener_refs = LatexFlattener(root_file, paper_id, ver, remove_references=False)
-            flat_content_refs = flattener_refs.flatten()['content']
-            
-            # 2. Extract References
-            ref_proc = ReferenceProcessor(paper_id, ver, ver_path)
-            _, refs = ref_proc.process_references(flat_content_refs)
+            refs = result["refs"]
             logging.info(f"      Found {len(refs)} references in {ver}.")
             
             # 3. Add to Dedup Pool
             ref_deduplicator.add_references(f"{paper_id}/{ver}", refs)
             
-            # Step B: Flatten without references (for cleaning/tree building)
-            flattener_clean = LatexFlattener(root_file, paper_id, ver, remove_references=True)
-            flat_content_clean = flattener_clean.flatten()['content']
-            
             # Store clean content for Phase 2
-            intermediate_versions[ver] = flat_content_clean
+            intermediate_versions[ver] = result["content"]
+            source_maps[ver] = result["source_map"]
             
         except Exception as e:
             logging.error(f"      ❌ Error in Phase 1 for {ver}: {e}")
+            errors.append(f"Phase 1 ({ver}): {e}")
 
     # --- PHASE 2: PARSING & CONTENT DEDUPLICATION ---
-    for ver, raw_content in intermediate_versions.items():
-        full_ver_key = f"{paper_id}/{ver}"
-        
-        try:
-            # 4. Get Replacements & Replace in Text
-            replacements = ref_deduplicator.get_replacements(full_ver_key)
-            if replacements:
-                raw_content = replace_citations_in_text(raw_content, replacements)
-            
-            # 5. Parse Structure
-            builder = LatexStructureBuilder(raw_content, paper_id, ver)
-            root_tree = builder.build_coarse_tree()
+    # Elements & hierarchy từng version được ghi streaming ra hierarchy.json (không giữ cả dict trong RAM)
+    hier_output_path = os.path.join(paper_output_dir, "hierarchy.json")
+    hier_writer = StreamingHierarchyWriter(hier_output_path, indent=None if compact_json else 2)
+    content_deduplicator = ContentDeduplicator(writer=hier_writer)
+
+    # Parse song song; dedup content tuần tự theo thứ tự version (ID & hierarchy xác định)
+    parsed = _map_versions(
+        _parse_version,
+        [(paper_id, ver, raw_content, ref_deduplicator.get_replacements(f"{paper_id}/{ver}"), source_maps[ver])
+         for ver, raw_content in intermediate_versions.items()],
+        version_workers
+    )
+    try:
+        for result in parsed:
+            ver = result["ver"]
+            full_ver_key = f"{paper_id}/{ver}"
+            _merge_version_metrics(metrics, ver, result)
             
-            # 6. Process Content (Clean & Split)
-            processor = LatexContentProcessor(paper_id, ver)
-            processor.process_tree(root_tree)
+            try:
+                if result["error"]:
+                    raise RuntimeError(result["error"])
+
+                # 7. Dedup Content
+                with metrics.stage("dedup", ver):
+                    content_deduplicator.process_version(full_ver_key, result["tree"])
             
-            # 7. Dedup Content
-            content_deduplicator.process_version(full_ver_key, root_tree)
-        
-        except Exception as e:
-            logging.error(f"      ❌ Error in Phase 2 for {ver}: {e}")
+            except Exception as e:
+                logging.error(f"      ❌ Error in Phase 2 for {ver}: {e}")
+                errors.append(f"Phase 2 ({ver}): {e}")
+    except Exception as e:
+        # Version pool hỏng (BrokenProcessPool...) -> các versions còn lại coi như lỗi
+        logging.error(f"      ❌ Error in Phase 2: {e}")
+        errors.append(f"Phase 2: {e}")
 
     # --- PHASE 3: EXPORT ARTIFACTS ---
     try:
-        # 8. Export refs.bib
-        refs_output_path = os.path.join(paper_output_dir, "refs.bib")
-        with open(refs_output_path, "w", encoding="utf-8") as f:
-            f.write(ref_deduplicator.export_bib_string())
-        
-        # 9. Export hierarchy.json
-        hier_output_path = os.path.join(paper_output_dir, "hierarchy.json")
-        final_json = content_deduplicator.get_final_json()
-        with open(hier_output_path, "w", encoding="utf-8") as f:
-            json.dump(final_json, f, indent=2, ensure_ascii=False)
+        with metrics.stage("export"):
+            # 8. Export refs.bib
+            refs_output_path = os.path.join(paper_output_dir, "refs.bib")
+            with open(refs_output_path, "w", encoding="utf-8") as f:
+                f.write(ref_deduplicator.export_bib_string())
             
-        # 10. Copy Metadata
-        for meta_file in ['metadata.json', 'references.json']:
-            src_meta = os.path.join(paper_raw_path, meta_file)
-            if os.path.exists(src_meta):
-                shutil.copy2(src_meta, paper_output_dir)
+            # 9. Finalize hierarchy.json (ghép hierarchy + elements đã stream)
+            hier_writer.close()
+                
+            # 10. Copy Metadata
+            for meta_file in ['metadata.json', 'references.json']:
+                src_meta = os.path.join(paper_raw_path, meta_file)
+                if os.path.exists(src_meta):
+                    shutil.copy2(src_meta, paper_output_dir)
+        metrics.count("elements", content_deduplicator.element_count)
                 
         logging.info(f"   ✅ Finished processing {paper_id}")
         
     except Exception as e:
         logging.error(f"      ❌ Error in Export Phase: {e}")
+        errors.append(f"Export: {e}")
+    finally:
+        # Lỗi giữa chừng -> xóa file tạm, giữ nguyên hierarchy.json cũ (nếu có)
+        hier_writer.abort()
+
+    # Ghi manifest sau cùng: run bị ngắt giữa chừng sẽ không có manifest -> lần sau chạy lại
+    status = "failed" if errors else "ok"
+    write_manifest(paper_output_dir, inputs, status, errors, options=output_options)
+    return {"paper_id": paper_id, "status": status, "errors": errors, "metrics": metrics.finish().to_dict()}
+
+def _prepare_version(paper_id, ver, ver_path, root_cache_dir=None, flatten_cache_dir=None):
+    """
+    Phase 1 của một version: tìm root file, flatten, trích xuất references.
+    Không phụ thuộc version khác nên có thể chạy trong thread / process riêng.
+    ver_path: thư mục version hoặc archive (.tar.gz/.zip...) được đọc thẳng vào bộ nhớ.
+    root_cache_dir: folder không đổi kể từ lần chạy trước -> dùng lại root file đã lưu, không chấm điểm lại.
+    flatten_cache_dir: file có nội dung đã gặp ở lần chạy trước -> dùng lại segments đã lưu, không phân tích lại.
 
-def run_processing_pipeline(data_raw_path, data_output_path, parallel=False, max_workers=None):
+    Returns:
+        dict: {"ver": str, "content": nội dung đã xóa bib (None nếu không có root file),
+               "source_map": SourceMap của content, "refs": list, "error": str hoặc None, "stages": dict, "counters": dict}
+    """
+    timer = PaperMetrics(paper_id)
+    result = {"ver": ver, "content": None, "source_map": None, "refs": None, "error": None}
+
+    # 1. Flatten. Index file dùng chung cho root detection, flatten và references:
+    # mỗi file nguồn chỉ được mở một lần cho mỗi version
+    with timer.stage("root_detection"):
+        try:
+            file_index = VersionFileIndex(ver_path)
+        except ValueError as e:
+            # Archive hỏng -> lỗi của riêng version này
+            result["error"] = str(e)
+            file_index = None
+        root_cache = RootDecisionCache(root_cache_dir) if root_cache_dir else None
+        root_file = None
+        if file_index is not None:
+            root_file = find_root_tex_file(ver_path, file_index=file_index, root_cache=root_cache)
+    if root_cache is not None:
+        timer.count("root_cache_hits", root_cache.hits)
+
+    if root_file:
+        try:
+            # Single flatten pass -> cả 2 view: có references (để trích xuất) và đã xóa bib (để build tree)
+            with timer.stage("flatten"):
+                segment_store = FlattenSegmentStore(flatten_cache_dir) if flatten_cache_dir else None
+                # Không nhúng marker BEGIN/END_FILE vào text: nguồn gốc (file, dòng) nằm trong source map
+                flattener = LatexFlattener(root_file, paper_id, ver, remove_references=True, file_index=file_index,
+                                           segment_store=segment_store, emit_markers=False, build_source_map=True)
+                flat_result = flattener.flatten()
+            timer.count("bytes_in", _sum_file_sizes(flattener.root_dir, flattener.merged_files, file_index))
+            timer.count("files_merged", len(flattener.merged_files))
+            if flattener.skipped_files:
+                timer.count("files_skipped", len(flattener.skipped_files))
+            if segment_store is not None:
+                timer.count("flatten_cache_hits", segment_store.hits)
+
+            # 2. Extract References
+            with timer.stage("references"):
+                ref_proc = ReferenceProcessor(paper_id, ver, ver_path, file_index=file_index)
+                _, refs = ref_proc.process_references(flat_result['content_with_references'])
+            timer.count("refs", len(refs))
+
+            result["content"] = flat_result['content']
+            result["source_map"] = flat_result['source_map']
+            result["refs"] = refs
+        except Exception as e:
+            result["error"] = str(e)
+
+    result["stages"] = timer.stages
+    result["counters"] = timer.counters
+    return result
+
+def _parse_version(paper_id, ver, raw_content, replacements, source_map=None):
+    """
+    Phase 2 (phần độc lập) của một version: thay citation keys, build tree, clean & split content.
+    source_map: SourceMap của raw_content (nếu có) -> node cấu trúc mang nguồn gốc (file, dòng) trong 'origin'.
+
+    Returns:
+        dict: {"ver": str, "tree": dict hoặc None, "error": str hoặc None, "stages": dict, "counters": dict}
+    """
+    timer = PaperMetrics(paper_id)
+    result = {"ver": ver, "tree": None, "error": None}
+
+    try:
+        # 4. Get Replacements & Replace in Text
+        if replacements:
+            if source_map is not None:
+                source_map = replace_citations_in_text(source_map, replacements)
+                raw_content = source_map.text
+            else:
+                raw_content = replace_citations_in_text(raw_content, replacements)
+
+        # 5. Parse Structure
+        with timer.stage("build_tree"):
+            builder = LatexStructureBuilder(raw_content, paper_id, ver, source_map=source_map)
+            root_tree = builder.build_coarse_tree()
+
+        # 6. Process Content (Clean & Split)
+        with timer.stage("process_tree"):
+            processor = LatexContentProcessor(paper_id, ver)
+            processor.process_tree(root_tree)
+        timer.count("nodes", count_tree_nodes(root_tree))
+
+        result["tree"] = root_tree
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["stages"] = timer.stages
+    result["counters"] = timer.counters
+    return result
+
+def _merge_version_metrics(metrics, ver, result):
+    """Cộng thời gian & counters đo trong _prepare_version / _parse_version vào metrics của paper."""
+    for name, seconds in result["stages"].items():
+        metrics.add_time(name, seconds, ver)
+    for name, value in result["counters"].items():
+        metrics.count(name, value, ver)
+
+# Pool dùng chung cho per-version parallelism, tạo lazily trong mỗi process: {workers: executor}
+_VERSION_POOLS = {}
+# Khóa tạo / đóng pool: nhiều paper chạy song song (executor="thread") có thể cùng gọi _get_version_pool
+_VERSION_POOLS_LOCK = threading.Lock()
+
+def _get_version_pool(workers):
+    """
+    Process pool khi chạy ở main thread của process chính (tận dụng nhiều core).
+    Trong worker (thread hoặc process của executor) dùng thread pool: các process worker
+    đã chiếm hết core, và process con lồng nhau sẽ bị join (treo) khi worker thoát.
+    """
+    with _VERSION_POOLS_LOCK:
+        pool = _VERSION_POOLS.get(workers)
+        if pool is None:
+            can_fork = (multiprocessing.parent_process() is None
+                        and threading.current_thread() is threading.main_thread())
+            if can_fork:
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            else:
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            _VERSION_POOLS[workers] = pool
+        return pool
+
+def _shutdown_version_pools():
+    with _VERSION_POOLS_LOCK:
+        pools = list(_VERSION_POOLS.values())
+        _VERSION_POOLS.clear()
+    for pool in pools:
+        pool.shutdown()
+
+def _map_versions(func, args_list, version_workers):
+    """
+    Chạy func cho từng version, trả về iterator kết quả theo đúng thứ tự versions.
+    Tuần tự -> generator (mỗi lúc chỉ giữ kết quả của một version trong bộ nhớ).
+    """
+    if not version_workers or version_workers <= 1 or len(args_list) <= 1:
+        return (func(*args) for args in args_list)
+    pool = _get_version_pool(version_workers)
+    return pool.map(func, *zip(*args_list))
+
+def _sum_file_sizes(root_dir, rel_paths, file_index=None):
+    """Tổng kích thước (bytes) các file nguồn đã được gộp (qua file_index nếu có, kể cả archive)."""
+    total = 0
+    for rel_path in rel_paths:
+        path = os.path.join(root_dir, rel_path)
+        if file_index is not None:
+            total += file_index.size(path) or 0
+            continue
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+EXECUTOR_CHOICES = ("thread", "process")
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def _init_worker(log_file, log_level=logging.INFO, file_cache_mb=None):
+    """
+    Initializer cho mỗi worker process.
+    Cấu hình lại logging để worker ghi tiếp (append) vào cùng file pipeline.log của process cha,
+    và giới hạn cache file nguồn của worker (file_cache_mb, None = mặc định).
+    """
+    if file_cache_mb is not None:
+        configure_default_cache(int(file_cache_mb * 1024 * 1024))
+
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    logging.basicConfig(
+        filename=log_file,
+        format=LOG_FORMAT,
+        level=log_level,
+        encoding='utf-8',
+        filemode='a'
+    )
+
+def _process_paper_chunk(paper_ids, data_raw_path, data_output_path, paper_options=None):
+    """
+    Xử lý một nhóm (chunk) papers trong cùng một task để giảm overhead của executor.
+
+    Args:
+        paper_options: kwargs truyền cho process_single_paper (resume, compact_json...)
+
+    Returns:
+        list[tuple]: [(paper_id, status, error_message hoặc None, metrics hoặc None), ...]
+        gửi ngược về process cha
+    """
+    return [_process_one_paper(paper_id, data_raw_path, data_output_path, paper_options) for paper_id in paper_ids]
+
+def _process_one_paper(paper_id, data_raw_path, data_output_path, paper_options=None):
+    """
+    Xử lý một paper, không bao giờ raise.
+
+    Returns:
+        tuple: (paper_id, status, error_message hoặc None, metrics hoặc None)
+    """
+    try:
+        result = process_single_paper(paper_id, data_raw_path, data_output_path, **(paper_options or {}))
+        error = "; ".join(result["errors"]) if result["status"] == "failed" else None
+        return (paper_id, result["status"], error, result.get("metrics"))
+    except Exception as e:
+        return (paper_id, "failed", f"{type(e).__name__}: {e}", None)
+
+def _default_max_batch(executor):
+    """
+    Số papers tối đa mỗi task: thread -> 1 paper/task (overhead submit rất nhỏ),
+    process -> gom các papers nhỏ để giảm chi phí pickle & IPC.
+    """
+    return 1 if executor == "thread" else 16
+
+def run_processing_pipeline(data_raw_path, data_output_path, parallel=False, max_workers=None,
+                            executor="thread", chunk_size=None, resume=True, compact_json=False,
+                            paper_timeout=None, max_rss_mb=None, max_tasks_per_child=None,
+                            version_workers=None, file_cache_mb=None, root_cache=True, flatten_cache=False):
     """
     Main pipeline to process all papers.
     Each paper is processed independently.
     Supports parallel processing.
+
+    Args:
+        data_raw_path: Thư mục chứa papers thô
+        data_output_path: Thư mục xuất kết quả
+        parallel: Xử lý song song
+        max_workers: Số workers (None = số CPU)
+        executor: "thread" (ThreadPoolExecutor) hoặc "process" (ProcessPoolExecutor, tránh GIL)
+        chunk_size: Số papers tối đa mỗi task gửi vào executor (None = tự động).
+            Papers được submit largest-first; chỉ các papers nhỏ mới được gom chung task.
+        resume: Bỏ qua papers không đổi kể từ lần chạy thành công trước (dựa trên manifest.json)
+        compact_json: Ghi hierarchy.json dạng compact (không indent)
+        paper_timeout: Thời gian tối đa (giây) cho một paper (None = không giới hạn)
+        max_rss_mb: RSS tối đa (MB) của worker khi xử lý một paper (None = không giới hạn)
+        max_tasks_per_child: Thay worker process mới sau N tasks (None = không thay)
+        version_workers: Số workers xử lý song song các versions trong một paper (None = tuần tự)
+        file_cache_mb: Giới hạn (MB) cache nội dung file nguồn mỗi process (None = mặc định 64MB, 0 = tắt)
+        root_cache: Lưu quyết định root file của từng version vào data_output/.root_cache
+            (key = fingerprint listing của folder) để các lần chạy sau bỏ qua bước chấm điểm
+        flatten_cache: Lưu kết quả phân tích từng file của flatten (theo hash nội dung) vào
+            data_output/.flatten_cache; lần sau chỉ file mới / thay đổi mới phải phân tích lại
+
+        Khi đặt một trong 3 giới hạn trên, papers luôn chạy trong process pool có giám sát
+        (SupervisedProcessPool, kể cả khi parallel=False -> 1 worker). Paper vượt giới hạn bị kill,
+        ghi vào quarantine.json và bị bỏ qua ở các lần chạy resume sau.
+
+    Returns:
+        dict: {"total": int, "succeeded": int, "skipped": int, "failed": {paper_id: error},
+               "quarantined": {paper_id: {"reason", "detail", "elapsed", "quarantined_at"}},
+               "metrics_path": đường dẫn metrics.jsonl,
+               "latency": {"count", "mean", "p50", "p95", "p99", "max"} (giây, không tính papers skipped)}
     """
+    if executor not in EXECUTOR_CHOICES:
+        raise ValueError(f"Unknown executor '{executor}'. Expected one of {EXECUTOR_CHOICES}")
+
     if not os.path.exists(data_output_path):
         os.makedirs(data_output_path)
     
@@ -138,33 +456,151 @@ def run_processing_pipeline(data_raw_path, data_output_path, parallel=False, max
         
     logging.basicConfig(
         filename=log_file,
-        format='%(asctime)s - %(levelname)s - %(message)s',
+        format=LOG_FORMAT,
         level=logging.INFO,
         encoding='utf-8',
         filemode='w'
     )
     
+    if file_cache_mb is not None:
+        configure_default_cache(int(file_cache_mb * 1024 * 1024))
+
     paper_folders = [f for f in os.listdir(data_raw_path) if os.path.isdir(os.path.join(data_raw_path, f))]
     logging.info(f"Found {len(paper_folders)} papers in {data_raw_path}")
+
+    failed = {}
+    skipped = 0
+    latencies = []
+    paper_options = {"resume": resume, "compact_json": compact_json, "version_workers": version_workers,
+                     "root_cache_dir": os.path.join(data_output_path, ROOT_CACHE_DIRNAME) if root_cache else None,
+                     "flatten_cache_dir": os.path.join(data_output_path, FLATTEN_CACHE_DIRNAME) if flatten_cache else None}
+
+    # Papers bị cách ly ở lần chạy trước được bỏ qua khi resume (--force -> chạy lại tất cả)
+    quarantine = load_quarantine(data_output_path) if resume else {}
+    quarantined_before = [pid for pid in paper_folders if pid in quarantine]
+    if quarantined_before:
+        logging.warning(f"Skipping {len(quarantined_before)} quarantined papers (see {QUARANTINE_FILENAME}, "
+                        f"run with --force to retry).")
+        for pid in quarantined_before:
+            failed[pid] = f"quarantined ({quarantine[pid].get('reason')}: {quarantine[pid].get('detail')})"
+    todo_papers = [pid for pid in paper_folders if pid not in quarantine]
+    if not resume and os.path.exists(os.path.join(data_output_path, QUARANTINE_FILENAME)):
+        # --force: xóa danh sách cách ly cũ, chỉ giữ các papers bị cách ly trong lần chạy này
+        write_quarantine(data_output_path, quarantine)
+
+    # Metrics từng paper được gom về process cha và ghi tuần tự (tránh ghi đồng thời từ nhiều worker)
+    metrics_path = os.path.join(data_output_path, METRICS_FILENAME)
+    open(metrics_path, 'w').close()
+
+    def handle_result(pid, status, error, paper_metrics):
+        nonlocal skipped
+        skipped += status == "skipped"
+        if paper_metrics:
+            latencies.append(paper_metrics["total_seconds"])
+            paper_metrics["status"] = status
+            append_metrics(metrics_path, paper_metrics)
+        if error:
+            failed[pid] = error
+            logging.error(f"Global Error processing {pid}: {error}")
+
+    def handle_quarantine(pid, info):
+        info["quarantined_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        quarantine[pid] = info
+        write_quarantine(data_output_path, quarantine)
+        # Worker đã bị kill giữa chừng: dọn file tạm nó để lại trong folder output của paper
+        remove_stale_temp_files(os.path.join(data_output_path, pid))
+        failed[pid] = f"quarantined ({info['reason']}: {info['detail']})"
+        logging.error(f"☣️  Quarantined {pid}: {info['reason']} ({info['detail']})")
+
+    supervised = bool(paper_timeout or max_rss_mb or max_tasks_per_child)
     
-    if parallel:
-        import concurrent.futures
-        workers = max_workers if max_workers else os.cpu_count()
-        logging.info(f"🚀 Starting parallel processing with {workers} workers...")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_paper = {executor.submit(process_single_paper, pid, data_raw_path, data_output_path): pid for pid in paper_folders}
-            for future in concurrent.futures.as_completed(future_to_paper):
-                pid = future_to_paper[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    logging.error(f"Global Error processing {pid}: {e}")
+    if parallel or supervised:
+        workers = (max_workers or os.cpu_count()) if parallel else 1
+        pool_kind = "supervised process" if supervised else executor
+        max_batch = chunk_size or _default_max_batch("process" if supervised else executor)
+
+        # Largest-first: ước lượng chi phí từng paper (chỉ stat), paper lớn submit trước
+        costs = [estimate_paper_cost(os.path.join(data_raw_path, pid)) for pid in todo_papers]
+        chunks = plan_tasks(costs, workers, max_batch=max_batch)
+        if costs:
+            largest = max(costs, key=lambda c: c["cost"])
+            logging.info(f"Largest paper: {largest['paper_id']} ({largest['bytes']:,} bytes, "
+                         f"{largest['versions']} versions)")
+        logging.info(f"🚀 Starting parallel processing with {workers} {pool_kind} workers "
+                     f"({len(chunks)} tasks, max {max_batch} papers/task)...")
+
+        if supervised:
+            # Giới hạn thời gian / RSS từng paper: worker vi phạm bị kill, phần còn lại của batch chạy lại
+            _init_worker(log_file)
+            pool = SupervisedProcessPool(
+                partial(_process_one_paper, data_raw_path=data_raw_path,
+                        data_output_path=data_output_path, paper_options=paper_options),
+                workers,
+                timeout=paper_timeout,
+                max_rss_mb=max_rss_mb,
+                max_tasks_per_child=max_tasks_per_child,
+                initializer=_init_worker,
+                initargs=(log_file, logging.INFO, file_cache_mb)
+            )
+            for kind, pid, payload in pool.run(chunks):
+                if kind == "quarantined":
+                    handle_quarantine(pid, payload)
+                elif isinstance(payload, Exception):
+                    handle_result(pid, "failed", f"{type(payload).__name__}: {payload}", None)
+                else:
+                    handle_result(*payload)
+        else:
+            if executor == "process":
+                # Process cha cũng chuyển sang append mode để không ghi đè log của các worker
+                _init_worker(log_file)
+                pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_worker,
+                    initargs=(log_file, logging.INFO, file_cache_mb)
+                )
+            else:
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+            with pool:
+                future_to_chunk = {
+                    pool.submit(_process_paper_chunk, chunk, data_raw_path, data_output_path, paper_options): chunk
+                    for chunk in chunks
+                }
+                for future in concurrent.futures.as_completed(future_to_chunk):
+                    chunk = future_to_chunk[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # Worker chết (BrokenProcessPool, lỗi pickle...) -> cả chunk coi như thất bại
+                        results = [(pid, "failed", f"{type(e).__name__}: {e}", None) for pid in chunk]
+                    for result in results:
+                        handle_result(*result)
     else:
         logging.info(f"🚀 Starting sequential processing...")
-        for paper_id in paper_folders:
-            process_single_paper(paper_id, data_raw_path, data_output_path)
+        for paper_id in todo_papers:
+            for result in _process_paper_chunk([paper_id], data_raw_path, data_output_path, paper_options):
+                handle_result(*result)
     
-    logging.info("Pipeline execution finished.")
+    _shutdown_version_pools()
+    latency = latency_summary(latencies)
+    logging.info(f"Pipeline execution finished. {len(paper_folders) - len(failed)}/{len(paper_folders)} papers succeeded "
+                 f"({skipped} skipped as unchanged, {len(quarantine)} quarantined).")
+    logging.info(format_latency(latency))
+    cache_stats = get_default_cache().stats()
+    if cache_stats["hits"] + cache_stats["misses"]:
+        # Chỉ phản ánh process cha (sequential / thread); mỗi worker process có cache riêng
+        logging.info(f"Source file cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                     f"({cache_stats['dedup']} shared contents), {cache_stats['evictions']} evictions, "
+                     f"{cache_stats['bytes'] / 1e6:.1f}MB cached")
+    return {
+        "total": len(paper_folders),
+        "succeeded": len(paper_folders) - len(failed),
+        "skipped": skipped,
+        "failed": failed,
+        "quarantined": quarantine,
+        "metrics_path": metrics_path,
+        "latency": latency
+    }
 
 if __name__ == "__main__":
     # Example usage
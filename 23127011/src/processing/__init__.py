@@ -8,6 +8,8 @@ Classes:
     - ReferenceProcessor: Trích xuất references từ LaTeX
     - ReferenceDeduplicator: Loại bỏ references trùng lặp
     - ContentDeduplicator: Loại bỏ content trùng lặp
+    - VersionDedupVisitor: Lượt đăng ký content của một version (gộp được với lượt khác)
+    - StreamingHierarchyWriter: Ghi hierarchy.json theo kiểu streaming
 
 Functions:
     - replace_citations_in_text: Thay thế citation keys trong văn bản
@@ -17,12 +19,16 @@ from .reference_processor import ReferenceProcessor
 from .deduplicator import (
     ReferenceDeduplicator,
     ContentDeduplicator,
+    VersionDedupVisitor,
     replace_citations_in_text
 )
+from .hierarchy_writer import StreamingHierarchyWriter
 
 __all__ = [
     'ReferenceProcessor',
     'ReferenceDeduplicator', 
     'ContentDeduplicator',
-    'replace_citations_in_text'
+    'VersionDedupVisitor',
+    'replace_citations_in_text',
+    'StreamingHierarchyWriter'
 ]
\ No newline at end of file
@@ -8,6 +8,8 @@ Các class để loại bỏ trùng lặp references và content.
 import hashlib
 import re
 
+from ..utils.tree_walk import TreeVisitor, run_visitors
+
 
 class ReferenceDeduplicator:
     """
@@ -110,11 +112,18 @@ class ContentDeduplicator:
     Loại bỏ content trùng lặp giữa các versions của document.
     
     Sử dụng MD5 hash để so sánh content của các nodes trong cây cấu trúc.
+
+    Nếu truyền `writer` (StreamingHierarchyWriter), elements và hierarchy từng version
+    được ghi thẳng ra file thay vì giữ trong `global_elements` / `final_hierarchy`.
     """
     
-    def __init__(self):
+    def __init__(self, writer=None):
+        # Writer streaming (None = giữ toàn bộ trong bộ nhớ)
+        self.writer = writer
+
         # elements: { "id": "content string" }
         self.global_elements = {}
+        self.element_count = 0
         
         # Helper to find existing IDs by content: { "hash": "id" }
         self.content_hash_map = {}
@@ -138,6 +147,14 @@ class ContentDeduplicator:
             return parts[-1]
         return version_str
 
+    def _add_element(self, element_id: str, content: str):
+        """Lưu element vào bộ nhớ hoặc ghi thẳng ra writer."""
+        self.element_count += 1
+        if self.writer is not None:
+            self.writer.add_element(element_id, content)
+        else:
+            self.global_elements[element_id] = content
+
     def register_node(self, node: dict) -> str:
         """
         Đăng ký node content.
@@ -154,7 +171,7 @@ class ContentDeduplicator:
         # Case 1: Node không có content
         if not content.strip():
             if node.get('title'):
-                 self.global_elements[node['id']] = node['title']
+                 self._add_element(node['id'], node['title'])
             return node['id']
 
         # Case 2: Node có content -> Deduplicate
@@ -166,7 +183,7 @@ class ContentDeduplicator:
         
         # New content
         current_id = node['id']
-        self.global_elements[current_id] = content
+        self._add_element(current_id, content)
         self.content_hash_map[content_hash] = current_id
         
         return current_id
@@ -179,24 +196,27 @@ class ContentDeduplicator:
             full_version_str: Version identifier (e.g., "paper_id/v1")
             root_node: Root node của cây cấu trúc
         """
-        ver_num = self._extract_version_number(full_version_str)
-        version_map = {}
-        
-        def traverse(current_node, parent_id_context=None):
-            unified_id = self.register_node(current_node)
-            
-            if parent_id_context:
-                version_map[unified_id] = parent_id_context
+        run_visitors(root_node, self.version_visitor(full_version_str))
 
-            for child in current_node.get('children', []):
-                traverse(child, parent_id_context=unified_id)
+    def version_visitor(self, full_version_str: str) -> 'VersionDedupVisitor':
+        """
+        Visitor đăng ký một version (dùng với run_visitors để gộp với lượt tách nội dung / export).
         
-        traverse(root_node)
-        self.final_hierarchy[ver_num] = version_map
+        Args:
+            full_version_str: Version identifier (e.g., "paper_id/v1")
+        """
+        return VersionDedupVisitor(self, full_version_str)
+
+    def _store_version(self, ver_num, version_map: dict):
+        if self.writer is not None:
+            self.writer.add_version(ver_num, version_map)
+        else:
+            self.final_hierarchy[ver_num] = version_map
         
     def get_final_json(self) -> dict:
         """
         Xuất JSON structure cuối cùng.
+        Khi dùng writer, dữ liệu đã nằm trong file nên dict trả về rỗng.
         
         Returns:
             dict với keys 'hierarchy' và 'elements'
@@ -207,16 +227,38 @@ class ContentDeduplicator:
         }
 
 
+class VersionDedupVisitor(TreeVisitor):
+    """
+    Lượt đăng ký content của một version (context: unified ID của node cha).
+    finish() lưu map {child_id: parent_id} của version.
+    """
+
+    def __init__(self, deduplicator: ContentDeduplicator, full_version_str: str):
+        self.deduplicator = deduplicator
+        self.ver_num = deduplicator._extract_version_number(full_version_str)
+        self.version_map = {}
+
+    def enter(self, node, parent_id_context):
+        unified_id = self.deduplicator.register_node(node)
+        
+        if parent_id_context:
+            self.version_map[unified_id] = parent_id_context
+        return unified_id
+
+    def finish(self):
+        self.deduplicator._store_version(self.ver_num, self.version_map)
+
+
 def replace_citations_in_text(text: str, replacement_map: dict) -> str:
     """
     Thay thế \\cite{old} thành \\cite{new} trong văn bản.
     
     Args:
-        text: Văn bản LaTeX
+        text: Văn bản LaTeX, hoặc SourceMap của văn bản (spans được dịch theo các thay thế)
         replacement_map: Dict {old_key: new_key}
         
     Returns:
-        Văn bản đã được thay thế
+        Văn bản đã được thay thế (SourceMap nếu đầu vào là SourceMap)
     """
     if not replacement_map:
         return text
@@ -228,4 +270,6 @@ def replace_citations_in_text(text: str, replacement_map: dict) -> str:
         return f"{match.group(1)}{', '.join(new_keys)}{match.group(3)}"
 
     pattern = re.compile(r'(\\cite[a-z]*\s*(?:\[.*?\])?\s*\{)([^}]+)(\})', re.IGNORECASE)
+    if not isinstance(text, str):
+        return text.sub(pattern, replace_match)
     return pattern.sub(replace_match, text)
@@ -0,0 +1,123 @@
+"""
+Hierarchy Writer
+================
+
+Ghi `hierarchy.json` theo kiểu streaming thay vì dựng toàn bộ dict rồi `json.dump`.
+
+- Mỗi element được ghi ra file tạm (spool) ngay khi `ContentDeduplicator` đăng ký nó
+- Mỗi version map được ghi ngay khi version đó xử lý xong
+- Khi `close()`, hai phần được ghép lại thành file JSON cuối cùng (đổi tên atomic)
+
+Bộ nhớ đỉnh vì vậy không phụ thuộc vào kích thước paper. Với `indent=2`, output
+giống hệt từng byte với `json.dump(get_final_json(), f, indent=2, ensure_ascii=False)`;
+với `indent=None` là dạng compact (không xuống dòng, không khoảng trắng).
+
+Example:
+    >>> with StreamingHierarchyWriter("out/hierarchy.json", indent=None) as writer:
+    ...     dedup = ContentDeduplicator(writer=writer)
+    ...     dedup.process_version("paper/v1", root_tree)
+"""
+
+import json
+import os
+import shutil
+from typing import Optional
+
+
+class StreamingHierarchyWriter:
+    """
+    Writer streaming cho cấu trúc {"hierarchy": {ver: {child: parent}}, "elements": {id: content}}.
+
+    Attributes:
+        path: Đường dẫn file hierarchy.json cuối cùng
+        indent: Số spaces indent (None = compact)
+        element_count: Số elements đã ghi
+        version_count: Số versions đã ghi
+    """
+
+    def __init__(self, path: str, indent: Optional[int] = 2):
+        self.path = path
+        self.indent = indent
+        self.element_count = 0
+        self.version_count = 0
+
+        self._kv_sep = ': ' if indent is not None else ':'
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._spool_path = f"{path}.{os.getpid()}.elements.tmp"
+        self._out = open(self._tmp_path, 'w', encoding='utf-8')
+        self._spool = open(self._spool_path, 'w+', encoding='utf-8')
+        self._closed = False
+
+        self._out.write('{' + self._newline(1) + '"hierarchy"' + self._kv_sep + '{')
+
+    def _newline(self, level: int) -> str:
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * level)
+
+    def _pair(self, key: str, value: str) -> str:
+        return json.dumps(key, ensure_ascii=False) + self._kv_sep + json.dumps(value, ensure_ascii=False)
+
+    def add_element(self, element_id: str, content: str):
+        """Ghi một element ("id": "content") vào spool."""
+        prefix = ',' if self.element_count else ''
+        self._spool.write(prefix + self._newline(2) + self._pair(element_id, content))
+        self.element_count += 1
+
+    def add_version(self, version_num: str, version_map: dict):
+        """Ghi map {child_id: parent_id} của một version."""
+        prefix = ',' if self.version_count else ''
+        parts = [prefix, self._newline(2), json.dumps(version_num, ensure_ascii=False), self._kv_sep, '{']
+        for i, (child_id, parent_id) in enumerate(version_map.items()):
+            if i:
+                parts.append(',')
+            parts.append(self._newline(3))
+            parts.append(self._pair(child_id, parent_id))
+        if version_map:
+            parts.append(self._newline(2))
+        parts.append('}')
+        self._out.write(''.join(parts))
+        self.version_count += 1
+
+    def close(self) -> str:
+        """Ghép hierarchy + elements thành file JSON cuối cùng. Trả về đường dẫn file."""
+        if self._closed:
+            return self.path
+
+        out = self._out
+        if self.version_count:
+            out.write(self._newline(1))
+        out.write('},' + self._newline(1) + '"elements"' + self._kv_sep + '{')
+
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, out, 1 << 20)
+        if self.element_count:
+            out.write(self._newline(1))
+        out.write('}' + self._newline(0) + '}')
+
+        out.close()
+        self._spool.close()
+        os.remove(self._spool_path)
+        os.replace(self._tmp_path, self.path)
+        self._closed = True
+        return self.path
+
+    def abort(self):
+        """Hủy ghi: đóng và xóa các file tạm, giữ nguyên file cũ (nếu có)."""
+        if self._closed:
+            return
+        for handle, path in ((self._out, self._tmp_path), (self._spool, self._spool_path)):
+            handle.close()
+            if os.path.exists(path):
+                os.remove(path)
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -11,6 +11,8 @@ import logging
 import bibtexparser
 from bibtexparser.bparser import BibTexParser
 
+from ..utils.file_cache import get_default_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,10 +31,12 @@ class ReferenceProcessor:
         >>> print(f"Found {len(refs)} references")
     """
     
-    def __init__(self, paper_id: str, version: str, root_dir: str):
+    def __init__(self, paper_id: str, version: str, root_dir: str, file_index=None):
         self.paper_id = paper_id
         self.version = version
         self.root_dir = root_dir
+        # VersionFileIndex của root_dir (nếu có): dùng danh sách file & nội dung đã cache
+        self.file_index = file_index
         
         self.raw_refs = {} 
         self.MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
@@ -79,16 +83,12 @@ class ReferenceProcessor:
         logger.info(f"Found {len(used_keys)} cited keys (Regex engine).")
 
         # --- BƯỚC 2: VÉT CẠN FILE NGOÀI (.bib/.bbl) ---
-        if os.path.exists(self.root_dir):
-            with os.scandir(self.root_dir) as entries:
-                for entry in entries:
-                    if not entry.is_file(): continue
-                    
-                    fname_lower = entry.name.lower()
-                    if fname_lower.endswith('.bib'):
-                        self._try_parse_bib(entry.path, entry.name)
-                    elif fname_lower.endswith('.bbl'):
-                        self._try_parse_bbl(entry.path, entry.name)
+        for name, path in self._list_reference_files():
+            fname_lower = name.lower()
+            if fname_lower.endswith('.bib'):
+                self._try_parse_bib(path, name)
+            elif fname_lower.endswith('.bbl'):
+                self._try_parse_bbl(path, name)
 
         # --- BƯỚC 3: XỬ LÝ EMBEDDED ---
         block_match = self.REGEX_THEBIB_BLOCK.search(norm_content)
@@ -114,19 +114,39 @@ class ReferenceProcessor:
 
     # --- HELPER METHODS ---
 
+    def _list_reference_files(self):
+        """Các file nằm ngay trong root_dir: [(name, path)] theo thứ tự scandir."""
+        if self.file_index is not None:
+            return [(name, path) for name, path, _ in self.file_index.top_level_files]
+        if not os.path.exists(self.root_dir):
+            return []
+        with os.scandir(self.root_dir) as entries:
+            return [(entry.name, entry.path) for entry in entries if entry.is_file()]
+
+    def _read_text(self, path: str) -> str:
+        """Đọc file qua file_index (nếu có) hoặc cache dùng chung để không mở lại file đã đọc."""
+        if self.file_index is not None:
+            content = self.file_index.read(path)
+        else:
+            content = get_default_cache().read_text(path)
+        if content is None:
+            raise OSError(f"Cannot read {path}")
+        return content
+
     def _try_parse_bib(self, path: str, filename: str):
         """Parse file .bib"""
         try:
-            file_size = os.path.getsize(path)
+            file_size = self.file_index.size(path) if self.file_index is not None else None
+            if file_size is None:
+                file_size = os.path.getsize(path)
             if file_size > self.MAX_FILE_SIZE:
                 logger.warning(f"Skipping large file: {filename} ({file_size/1024/1024:.2f} MB)")
                 return
             
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                parser = BibTexParser(common_strings=True)
-                parser.ignore_nonstandard_types = True
-                parser.homogenise_fields = False
-                db = bibtexparser.load(f, parser=parser)
+            parser = BibTexParser(common_strings=True)
+            parser.ignore_nonstandard_types = True
+            parser.homogenise_fields = False
+            db = bibtexparser.loads(self._read_text(path), parser=parser)
                 
             count_new = 0
             for entry in db.entries:
@@ -148,8 +168,7 @@ class ReferenceProcessor:
     def _try_parse_bbl(self, path: str, filename: str):
         """Parse file .bbl"""
         try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            content = self._read_text(path)
             norm_content = re.sub(r'\s+', ' ', content)
             self._parse_bibitem_content_optimized(norm_content, source_type=filename)
         except Exception as e:
@@ -7,6 +7,13 @@ Các module tiện ích cho pipeline.
 Modules:
     - io: Đọc/ghi file (JSON, text)
     - tex_cleaner: Làm sạch LaTeX content
+    - brace_index: Chỉ mục cặp ngoặc {} cho title / caption / đối số lệnh
+    - manifest: Manifest input cho Phase 1 incremental / resumable
+    - metrics: Đo thời gian & counters từng stage của Phase 1
+    - scheduler: Lập lịch papers largest-first theo kích thước ước lượng
+    - worker_pool: Process pool có giới hạn thời gian / RSS từng paper
+    - file_cache: LRU cache nội dung file nguồn dùng chung giữa các stage / versions
+    - tree_walk: Duyệt cây không đệ quy (generator / visitor, gộp nhiều lượt thành một)
 """
 
 from .io import (
@@ -18,6 +25,28 @@ from .io import (
     list_subdirs
 )
 from .tex_cleaner import LatexCleaner
+from .brace_index import BraceIndex, replace_braced, unwrap_braced
+from .manifest import (
+    get_pipeline_code_version,
+    load_manifest,
+    write_manifest,
+    build_input_manifest,
+    is_paper_up_to_date,
+    load_quarantine,
+    write_quarantine,
+    remove_stale_temp_files
+)
+from .metrics import (
+    PaperMetrics,
+    load_metrics,
+    summarize_metrics,
+    format_metrics_table,
+    latency_summary
+)
+from .scheduler import estimate_paper_cost, plan_tasks
+from .worker_pool import SupervisedProcessPool
+from .file_cache import SourceFileCache, get_default_cache, configure_default_cache
+from .tree_walk import ENTER, LEAVE, SKIP, TreeVisitor, iter_tree, walk_tree, run_visitors
 
 __all__ = [
     # I/O
@@ -28,5 +57,40 @@ __all__ = [
     'ensure_dir',
     'list_subdirs',
     # Cleaner
-    'LatexCleaner'
+    'LatexCleaner',
+    'BraceIndex',
+    'replace_braced',
+    'unwrap_braced',
+    # Manifest
+    'get_pipeline_code_version',
+    'load_manifest',
+    'write_manifest',
+    'build_input_manifest',
+    'is_paper_up_to_date',
+    'load_quarantine',
+    'write_quarantine',
+    'remove_stale_temp_files',
+    # Metrics
+    'PaperMetrics',
+    'load_metrics',
+    'summarize_metrics',
+    'format_metrics_table',
+    'latency_summary',
+    # Scheduler
+    'estimate_paper_cost',
+    'plan_tasks',
+    # Worker pool
+    'SupervisedProcessPool',
+    # File cache
+    'SourceFileCache',
+    'get_default_cache',
+    'configure_default_cache',
+    # Tree walk
+    'ENTER',
+    'LEAVE',
+    'SKIP',
+    'TreeVisitor',
+    'iter_tree',
+    'walk_tree',
+    'run_visitors'
 ]
\ No newline at end of file
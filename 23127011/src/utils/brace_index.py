@@ -0,0 +1,170 @@
+"""
+Brace Index
+===========
+
+Chỉ mục cặp ngoặc nhọn {...} của một text: tính một lần, sau đó tra "dấu '}' khớp với dấu '{'
+tại vị trí p" trong O(1) (dict), thay cho việc đếm ngoặc từng ký tự bằng Python hoặc regex
+chỉ hỗ trợ lồng một cấp như `{((?:[^{}]|{[^{}]*})*)}`.
+
+- Text dài: quét độ sâu bằng numpy (cumsum trên mã ký tự), ghép cặp bằng sort ổn định theo
+  cấp độ sâu: trong cùng một cấp, '{' luôn được theo sau bởi chính dấu '}' khớp với nó
+- Text ngắn (tiêu đề, câu, caption...): đếm ngoặc bằng stack Python khi được tra, chỉ trên đoạn
+  từ '{' cần tra tới '}' khớp (tránh chi phí khởi tạo numpy và ghép cặp cả text)
+- Đếm ngoặc thô giống cách cũ (kể cả \\{ và \\}); '{' không có '}' khớp -> -1
+
+Các hàm `replace_braced` / `unwrap_braced` dùng chỉ mục để xử lý lệnh `\\cmd{đối số}` với
+đối số lồng ngoặc tùy ý.
+
+Example:
+    >>> braces = BraceIndex(r"\\title{A {\\em deep {nested}} title}")
+    >>> braces.match(6)
+    34
+    >>> unwrap_braced(re.compile(r'\\\\(textbf|emph)\\{'), r"\\textbf{a \\emph{b}} c")
+    'a b c'
+"""
+
+import re
+from typing import Callable, Optional
+
+import numpy as np
+
+# Dưới ngưỡng này (ký tự) ghép cặp lười bằng stack Python
+SMALL_TEXT_CHARS = 4096
+
+_REGEX_BRACE = re.compile(r'[{}]')
+
+
+class BraceIndex:
+    """
+    Chỉ mục cặp ngoặc nhọn của một text.
+
+    Args:
+        text: Text cần đánh chỉ mục
+
+    Attributes:
+        text: Text gốc
+        pairs: {vị trí '{': vị trí '}' khớp, -1 nếu không đóng}. Text dài: đủ mọi cặp ngay từ đầu;
+            text ngắn: điền dần khi tra (mỗi lần tra ghi luôn các cặp lồng bên trong)
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._complete = len(text) >= SMALL_TEXT_CHARS
+        self.pairs = self._pairs_numpy(text) if self._complete else {}
+
+    def _scan_from(self, open_pos: int) -> int:
+        """Đếm ngoặc từ '{' tại open_pos tới '}' khớp (stack Python, dùng cho text ngắn)."""
+        pairs = self.pairs
+        stack = [open_pos]
+        for match in _REGEX_BRACE.finditer(self.text, open_pos + 1):
+            if match.group() == '{':
+                stack.append(match.start())
+                continue
+            pairs[stack.pop()] = match.start()
+            if not stack:
+                return match.start()
+        for pos in stack:
+            pairs[pos] = -1
+        return -1
+
+    @staticmethod
+    def _pairs_numpy(text: str) -> dict:
+        if text.isascii():
+            codes = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        else:
+            codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+        positions = np.flatnonzero((codes == 123) | (codes == 125))
+        if len(positions) == 0:
+            return {}
+        is_open = codes[positions] == 123
+        depth = np.cumsum(np.where(is_open, 1, -1))
+        # Cấp của '{' = độ sâu sau nó; cấp của '}' = độ sâu trước nó
+        level = np.where(is_open, depth, depth + 1)
+        order = np.argsort(level, kind='stable')
+        sorted_open = is_open[order]
+        sorted_level = level[order]
+        paired = sorted_open[:-1] & ~sorted_open[1:] & (sorted_level[:-1] == sorted_level[1:])
+        opens = positions[order[:-1][paired]]
+        closes = positions[order[1:][paired]]
+        return dict(zip(opens.tolist(), closes.tolist()))
+
+    def match(self, open_pos: int) -> int:
+        """Vị trí '}' khớp với '{' tại open_pos; -1 nếu không đóng (open_pos phải là vị trí '{')."""
+        close = self.pairs.get(open_pos)
+        if close is None:
+            if self._complete:
+                return -1
+            close = self._scan_from(open_pos)
+        return close
+
+    def argument(self, open_pos: int) -> Optional[str]:
+        """Nội dung giữa '{' tại open_pos và '}' khớp với nó; None nếu không đóng."""
+        close = self.match(open_pos)
+        if close < 0:
+            return None
+        return self.text[open_pos + 1:close]
+
+
+def replace_braced(pattern, text: str, repl: Callable, braces: Optional[BraceIndex] = None) -> str:
+    """
+    Thay mỗi lệnh `<pattern>{đối số}` (đối số lồng ngoặc tùy ý) bằng repl(match, đối số).
+
+    Args:
+        pattern: Regex đã compile, khớp phần đầu lệnh và kết thúc ngay sau '{' mở đối số
+        text: Text cần xử lý
+        repl: Hàm (match, argument) -> chuỗi thay cho cả đoạn từ đầu lệnh tới '}' đóng
+        braces: BraceIndex của text (tự tạo nếu None)
+
+    Returns:
+        str: Text mới. Lệnh không có '}' khớp, hoặc nằm trong đối số của lệnh đã thay, giữ nguyên
+    """
+    pieces = []
+    last = 0
+    for match in pattern.finditer(text):
+        if match.start() < last:
+            continue
+        if braces is None:
+            braces = BraceIndex(text)
+        open_pos = match.end() - 1
+        close = braces.match(open_pos)
+        if close < 0:
+            continue
+        pieces.append(text[last:match.start()])
+        pieces.append(repl(match, text[open_pos + 1:close]))
+        last = close + 1
+    if not pieces:
+        return text
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+
+def unwrap_braced(pattern, text: str, braces: Optional[BraceIndex] = None) -> str:
+    """
+    Bóc mọi lệnh `<pattern>{đối số}` thành đối số, kể cả lồng nhau, trong một lượt:
+    xóa phần đầu lệnh và dấu '}' khớp (`\\textbf{\\emph{x}}` -> `x`).
+
+    Args:
+        pattern: Regex đã compile, khớp phần đầu lệnh và kết thúc ngay sau '{' mở đối số
+        text: Text cần xử lý
+        braces: BraceIndex của text (tự tạo nếu None)
+    """
+    cuts = []
+    for match in pattern.finditer(text):
+        if braces is None:
+            braces = BraceIndex(text)
+        close = braces.match(match.end() - 1)
+        if close >= 0:
+            cuts.append((match.start(), match.end()))
+            cuts.append((close, close + 1))
+    if not cuts:
+        return text
+    cuts.sort()
+    pieces = []
+    last = 0
+    for start, end in cuts:
+        if start < last:
+            continue
+        pieces.append(text[last:start])
+        last = end
+    pieces.append(text[last:])
+    return "".join(pieces)
@@ -0,0 +1,207 @@
+"""
+Source File Cache
+=================
+
+Cache nội dung file nguồn (.tex/.bib/.bbl) dùng chung giữa các stage và các versions.
+
+- Key: (đường dẫn, mtime, size) -> file đổi trên đĩa thì tự động đọc lại
+- Nội dung được dedup theo hash: các versions dùng chung file giống hệt nhau chỉ giữ một bản,
+  kết quả dẫn xuất (vd: text đã xóa comment) cũng được tính một lần cho mỗi nội dung
+- Giới hạn theo tổng bytes, loại bỏ theo LRU
+- Đếm hits / misses / dedup / evictions (thread-safe)
+- Nội dung đã có sẵn trong bộ nhớ (vd: member của archive .tar.gz/.zip) được truyền qua `data=`
+  và dedup theo hash như file thường
+
+Text được decode giống `open(path, 'r', encoding='utf-8', errors='ignore')`
+(bỏ byte lỗi, chuẩn hóa xuống dòng \\r\\n và \\r thành \\n).
+
+Example:
+    >>> cache = get_default_cache()
+    >>> text = cache.read_text("tex/v1/main.tex")
+    >>> clean = cache.derive("tex/v1/main.tex", "stripped", strip_comments)
+    >>> cache.stats()
+    {'hits': 12, 'misses': 30, 'dedup': 18, 'evictions': 0, 'entries': 12, 'bytes': 48213, ...}
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _value_size(value) -> int:
+    """Kích thước (ký tự) của giá trị dẫn xuất tính vào budget: str hoặc list/tuple các str."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(len(v) for v in value if isinstance(v, str))
+    return 0
+
+
+class _Blob:
+    """Một nội dung duy nhất trong cache (kèm các giá trị dẫn xuất)."""
+
+    __slots__ = ("text", "size", "derived", "keys")
+
+    def __init__(self, text: str, size: int):
+        self.text = text
+        self.size = size
+        self.derived = {}
+        self.keys = set()
+
+
+class SourceFileCache:
+    """
+    LRU cache nội dung file, giới hạn theo tổng bytes.
+
+    Args:
+        max_bytes: Tổng kích thước tối đa (bytes file gốc + độ dài các giá trị dẫn xuất dạng str / tuple các str)
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._blobs = OrderedDict()     # digest -> _Blob (cuối = mới dùng nhất)
+        self._keys = {}                 # (path, mtime_ns, size) -> digest
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.dedup = 0
+        self.evictions = 0
+
+    def _lookup(self, path: str, data: Optional[bytes] = None):
+        """
+        Trả về (digest, blob) cho path; đọc file nếu chưa có trong cache. None nếu không đọc được.
+        data: nội dung có sẵn (path chỉ dùng để định danh, không stat / đọc đĩa).
+        """
+        if data is not None:
+            return self._intern(hashlib.sha1(data).hexdigest(), data, key=None)
+
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (path, st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            digest = self._keys.get(key)
+            if digest is not None:
+                self.hits += 1
+                self._blobs.move_to_end(digest)
+                return digest, self._blobs[digest]
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return self._intern(hashlib.sha1(data).hexdigest(), data, key)
+
+    def _intern(self, digest: str, data: bytes, key):
+        """Thêm (hoặc dùng chung) blob của nội dung data; key = (path, mtime_ns, size) hoặc None."""
+        with self._lock:
+            self.misses += 1
+            blob = self._blobs.get(digest)
+            if blob is not None:
+                # Nội dung đã có (vd: cùng file ở version khác) -> dùng chung
+                self.dedup += 1
+                self._blobs.move_to_end(digest)
+            else:
+                text = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+                blob = _Blob(text, len(data))
+                if blob.size > self.max_bytes:
+                    return digest, blob
+                self._blobs[digest] = blob
+                self._bytes += blob.size
+            if key is not None:
+                blob.keys.add(key)
+                self._keys[key] = digest
+            self._evict()
+        return digest, blob
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            _, blob = self._blobs.popitem(last=False)
+            self._bytes -= blob.size + sum(_value_size(v) for v in blob.derived.values())
+            for key in blob.keys:
+                self._keys.pop(key, None)
+            self.evictions += 1
+
+    def read_text(self, path: str, data: Optional[bytes] = None) -> Optional[str]:
+        """Nội dung file dạng text; None nếu không tồn tại / không đọc được."""
+        found = self._lookup(path, data)
+        return found[1].text if found else None
+
+    def content_hash(self, path: str, data: Optional[bytes] = None) -> Optional[str]:
+        """SHA1 nội dung file (từ cache)."""
+        found = self._lookup(path, data)
+        return found[0] if found else None
+
+    def derive(self, path: str, name: str, func: Callable[[str], object], data: Optional[bytes] = None):
+        """
+        Giá trị dẫn xuất func(text) của file, cache theo (hash nội dung, name).
+        Các file có nội dung giống nhau chỉ tính func một lần.
+        """
+        found = self._lookup(path, data)
+        if found is None:
+            return None
+        digest, blob = found
+        with self._lock:
+            if name in blob.derived:
+                return blob.derived[name]
+        value = func(blob.text)
+        with self._lock:
+            if name not in blob.derived:
+                blob.derived[name] = value
+                # Chỉ tính vào budget khi blob còn nằm trong cache
+                if self._blobs.get(digest) is blob:
+                    self._bytes += _value_size(value)
+                    self._evict()
+        return value
+
+    def clear(self):
+        """Xóa toàn bộ nội dung cache (giữ nguyên counters)."""
+        with self._lock:
+            self._blobs.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Counters & kích thước hiện tại của cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "dedup": self.dedup,
+                "evictions": self.evictions,
+                "entries": len(self._blobs),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> SourceFileCache:
+    """Cache dùng chung trong process (tạo lazily)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SourceFileCache()
+        return _default_cache
+
+
+def configure_default_cache(max_bytes: int) -> SourceFileCache:
+    """Tạo lại cache dùng chung với giới hạn mới (0 = tắt cache nội dung)."""
+    global _default_cache
+    with _default_lock:
+        _default_cache = SourceFileCache(max_bytes)
+        return _default_cache
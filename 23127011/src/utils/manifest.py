@@ -0,0 +1,253 @@
+"""
+Manifest Utilities
+==================
+
+Manifest đầu vào cho từng paper, giúp Phase 1 chạy incremental / resumable.
+
+Mỗi paper sau khi xử lý xong sẽ có file `manifest.json` nằm cạnh
+`hierarchy.json` và `refs.bib`, ghi lại:
+    - size, mtime và hash của toàn bộ file input trong folder paper
+    - phiên bản code pipeline (hash của source code xử lý)
+    - trạng thái xử lý: "ok", "empty" hoặc "failed"
+
+Lần chạy sau, paper có input & code không đổi và trạng thái thành công sẽ
+được bỏ qua; paper lỗi hoặc bị ngắt giữa chừng (chưa có manifest) sẽ được chạy lại.
+
+Papers vượt giới hạn thời gian / bộ nhớ được ghi vào `data_output/quarantine.json`
+và bị bỏ qua ở các lần chạy resume sau (cho tới khi chạy với --force).
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Optional
+
+MANIFEST_FILENAME = "manifest.json"
+QUARANTINE_FILENAME = "quarantine.json"
+MANIFEST_SCHEMA = 1
+
+# Các file output bắt buộc phải có để coi paper là đã xử lý xong
+REQUIRED_OUTPUTS = ("hierarchy.json", "refs.bib")
+
+# File tạm của các lần ghi atomic (`<file>.<pid>.tmp`, spool `<file>.<pid>.elements.tmp` của
+# StreamingHierarchyWriter): worker bị kill (timeout / RSS) để lại các file này
+_STALE_TMP_REGEX = re.compile(r'\.\d+(?:\.elements)?\.tmp$')
+
+# Các phần source code ảnh hưởng tới output của Phase 1
+_CODE_PATHS = ("pipeline.py", "parser", "processing", "utils")
+
+
+@lru_cache(maxsize=1)
+def get_pipeline_code_version() -> str:
+    """
+    Hash toàn bộ source code của Phase 1 (pipeline, parser, processing, utils).
+    Code thay đổi -> version thay đổi -> mọi paper được xử lý lại.
+    """
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    hasher = hashlib.sha1()
+
+    for rel in _CODE_PATHS:
+        path = os.path.join(src_dir, rel)
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = []
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.endswith('.py'))
+
+        for file_path in files:
+            hasher.update(os.path.relpath(file_path, src_dir).replace('\\', '/').encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                hasher.update(f.read())
+
+    return hasher.hexdigest()[:16]
+
+
+def hash_file(filepath: str, chunk_size: int = 1 << 20) -> str:
+    """Tính SHA1 của file theo từng chunk (không load toàn bộ vào RAM)."""
+    hasher = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def scan_inputs(paper_raw_path: str) -> dict:
+    """
+    Liệt kê toàn bộ file input của một paper kèm size & mtime (chỉ stat, không đọc nội dung).
+
+    Returns:
+        dict: { "tex/v1/main.tex": {"size": int, "mtime_ns": int}, ... }
+    """
+    inputs = {}
+    for root, dirs, files in os.walk(paper_raw_path):
+        dirs.sort()
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            rel_path = os.path.relpath(full_path, paper_raw_path).replace('\\', '/')
+            inputs[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return inputs
+
+
+def build_input_manifest(paper_raw_path: str, previous: Optional[dict] = None) -> dict:
+    """
+    Tạo danh sách input kèm hash. Hash cũ được tái sử dụng nếu size & mtime không đổi.
+
+    Args:
+        paper_raw_path: Folder paper trong data_raw
+        previous: Phần "inputs" của manifest cũ (nếu có)
+    """
+    previous = previous or {}
+    inputs = scan_inputs(paper_raw_path)
+
+    for rel_path, info in inputs.items():
+        old = previous.get(rel_path)
+        if old and old.get("size") == info["size"] and old.get("mtime_ns") == info["mtime_ns"] and old.get("sha1"):
+            info["sha1"] = old["sha1"]
+        else:
+            info["sha1"] = hash_file(os.path.join(paper_raw_path, rel_path))
+    return inputs
+
+
+def load_manifest(paper_output_dir: str) -> Optional[dict]:
+    """Đọc manifest của paper, trả về None nếu chưa có hoặc bị hỏng."""
+    path = os.path.join(paper_output_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("schema") != MANIFEST_SCHEMA:
+        return None
+    return manifest
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def remove_stale_temp_files(paper_output_dir: str) -> int:
+    """
+    Xóa các file tạm còn sót trong folder output của paper (worker bị kill giữa lúc ghi;
+    lần chạy sau có pid khác nên không ghi đè chúng).
+    Chỉ gọi khi không có worker nào đang ghi paper này.
+
+    Returns:
+        int: Số file đã xóa
+    """
+    try:
+        names = os.listdir(paper_output_dir)
+    except OSError:
+        return 0
+    removed = 0
+    for name in names:
+        if _STALE_TMP_REGEX.search(name):
+            try:
+                os.remove(os.path.join(paper_output_dir, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def write_manifest(paper_output_dir: str, inputs: dict, status: str, errors: Optional[list] = None,
+                   options: Optional[dict] = None) -> str:
+    """
+    Ghi manifest (atomic: ghi file tạm rồi os.replace) để không bao giờ để lại manifest dở dang.
+
+    Args:
+        options: Các tùy chọn ảnh hưởng tới output (vd: compact_json); đổi options -> paper chạy lại
+
+    Returns:
+        Đường dẫn file manifest
+    """
+    os.makedirs(paper_output_dir, exist_ok=True)
+    path = os.path.join(paper_output_dir, MANIFEST_FILENAME)
+    manifest = {
+        "schema": MANIFEST_SCHEMA,
+        "code_version": get_pipeline_code_version(),
+        "status": status,
+        "errors": errors or [],
+        "options": options or {},
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "inputs": inputs
+    }
+    _write_json_atomic(path, manifest)
+    return path
+
+
+def _inputs_unchanged(paper_raw_path: str, recorded: dict) -> bool:
+    """So sánh input hiện tại với manifest: stat trước, chỉ hash lại khi size/mtime khác."""
+    current = scan_inputs(paper_raw_path)
+    if set(current) != set(recorded):
+        return False
+
+    for rel_path, info in current.items():
+        old = recorded[rel_path]
+        if old.get("size") != info["size"]:
+            return False
+        if old.get("mtime_ns") != info["mtime_ns"]:
+            # mtime đổi (copy/touch) nhưng nội dung có thể vẫn y nguyên
+            if old.get("sha1") != hash_file(os.path.join(paper_raw_path, rel_path)):
+                return False
+    return True
+
+
+def is_paper_up_to_date(paper_raw_path: str, paper_output_dir: str, options: Optional[dict] = None) -> bool:
+    """
+    Kiểm tra paper có thể bỏ qua không:
+    manifest tồn tại, trạng thái thành công, cùng code version & options, output còn đủ và input không đổi.
+    """
+    manifest = load_manifest(paper_output_dir)
+    if manifest is None:
+        return False
+    if manifest.get("code_version") != get_pipeline_code_version():
+        return False
+    if manifest.get("options", {}) != (options or {}):
+        return False
+
+    status = manifest.get("status")
+    if status == "ok":
+        for name in REQUIRED_OUTPUTS:
+            if not os.path.exists(os.path.join(paper_output_dir, name)):
+                return False
+    elif status != "empty":
+        # "failed" hoặc trạng thái lạ -> luôn chạy lại
+        return False
+
+    return _inputs_unchanged(paper_raw_path, manifest.get("inputs", {}))
+
+
+def load_quarantine(data_output_path: str) -> dict:
+    """
+    Đọc danh sách papers bị cách ly.
+
+    Returns:
+        dict: { paper_id: {"reason": "timeout" | "memory" | "crashed", "detail": str,
+                           "elapsed": float, "quarantined_at": str} }
+    """
+    path = os.path.join(data_output_path, QUARANTINE_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return entries if isinstance(entries, dict) else {}
+
+
+def write_quarantine(data_output_path: str, entries: dict) -> str:
+    """Ghi danh sách papers bị cách ly (atomic). Returns: đường dẫn file."""
+    path = os.path.join(data_output_path, QUARANTINE_FILENAME)
+    _write_json_atomic(path, entries)
+    return path
@@ -0,0 +1,261 @@
+"""
+Metrics Utilities
+=================
+
+Đo thời gian & kích thước từng stage của Phase 1 cho mỗi paper / version.
+
+Mỗi paper tạo một `PaperMetrics`, các stage được bọc bằng context manager
+`stage()` (chỉ tốn 2 lần gọi `time.perf_counter`). Kết quả được ghi thành
+từng dòng JSON trong `data_output/metrics.jsonl` và tổng hợp thành bảng
+ở cuối `run_full_pipeline`.
+
+Example:
+    >>> metrics = PaperMetrics("2403-00530")
+    >>> with metrics.stage("flatten", version="v1"):
+    ...     content = flattener.flatten()['content']
+    >>> metrics.count("bytes_in", len(content), version="v1")
+    >>> metrics.to_dict()
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+METRICS_FILENAME = "metrics.jsonl"
+
+# Thứ tự hiển thị các stage trong bảng tổng hợp
+STAGE_ORDER = (
+    "root_detection",
+    "flatten",
+    "references",
+    "build_tree",
+    "process_tree",
+    "dedup",
+    "export",
+)
+
+
+class PaperMetrics:
+    """
+    Bộ đếm thời gian & counters cho một paper.
+
+    Stage/counter có `version` được lưu theo version, không có thì tính cho cả paper.
+    """
+
+    def __init__(self, paper_id: str):
+        self.paper_id = paper_id
+        self.stages = {}
+        self.counters = {}
+        self.versions = {}
+        self._start = time.perf_counter()
+        self.total_seconds = None
+
+    def _target(self, version: Optional[str]) -> dict:
+        if version is None:
+            return {"stages": self.stages, "counters": self.counters}
+        return self.versions.setdefault(version, {"stages": {}, "counters": {}})
+
+    @contextmanager
+    def stage(self, name: str, version: Optional[str] = None):
+        """Đo thời gian một stage (cộng dồn nếu stage chạy nhiều lần)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = self._target(version)["stages"]
+            stages[name] = stages.get(name, 0.0) + (time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float, version: Optional[str] = None):
+        """Cộng thời gian đo từ nơi khác (vd: worker process) vào một stage."""
+        stages = self._target(version)["stages"]
+        stages[name] = stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int, version: Optional[str] = None):
+        """Cộng dồn một counter (bytes_in, nodes, refs...)."""
+        counters = self._target(version)["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+    def finish(self):
+        """Chốt tổng thời gian xử lý paper."""
+        self.total_seconds = time.perf_counter() - self._start
+        return self
+
+    def to_dict(self) -> dict:
+        """Xuất dict JSON-serializable (thời gian làm tròn tới micro giây)."""
+        if self.total_seconds is None:
+            self.finish()
+
+        def _round(stages):
+            return {k: round(v, 6) for k, v in stages.items()}
+
+        return {
+            "paper_id": self.paper_id,
+            "total_seconds": round(self.total_seconds, 6),
+            "stages": _round(self.stages),
+            "counters": dict(self.counters),
+            "versions": {
+                ver: {"stages": _round(data["stages"]), "counters": dict(data["counters"])}
+                for ver, data in self.versions.items()
+            }
+        }
+
+
+def count_tree_nodes(root_node: dict) -> int:
+    """Đếm số node trong cây (không đệ quy)."""
+    count = 0
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get('children', []))
+    return count
+
+
+def append_metrics(filepath: str, record: dict):
+    """Ghi thêm một dòng metrics (JSON Lines)."""
+    with open(filepath, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_metrics(filepath: str) -> List[dict]:
+    """Đọc toàn bộ metrics.jsonl, bỏ qua các dòng hỏng."""
+    records = []
+    if not os.path.exists(filepath):
+        return records
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def summarize_metrics(records: Iterable[dict]) -> dict:
+    """
+    Tổng hợp metrics của nhiều papers theo từng stage.
+
+    Returns:
+        dict: {
+            "papers": int,
+            "total_seconds": float,
+            "stages": { stage: {"total": s, "mean": s, "max": s, "max_paper": id, "share": %} },
+            "counters": { name: tổng },
+            "latency": {"count", "mean", "p50", "p95", "p99", "max"},
+            "slowest": [(paper_id, seconds), ...]
+        }
+    """
+    records = list(records)
+    stage_totals = {}
+    stage_max = {}
+    stage_calls = {}
+    counters = {}
+
+    for rec in records:
+        paper_id = rec.get("paper_id")
+        per_paper = dict(rec.get("stages", {}))
+        for ver_data in rec.get("versions", {}).values():
+            for name, sec in ver_data.get("stages", {}).items():
+                per_paper[name] = per_paper.get(name, 0.0) + sec
+            for name, val in ver_data.get("counters", {}).items():
+                counters[name] = counters.get(name, 0) + val
+        for name, val in rec.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + val
+
+        for name, sec in per_paper.items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + sec
+            stage_calls[name] = stage_calls.get(name, 0) + 1
+            if sec > stage_max.get(name, (-1.0, None))[0]:
+                stage_max[name] = (sec, paper_id)
+
+    grand_total = sum(stage_totals.values()) or 1.0
+    ordered = [s for s in STAGE_ORDER if s in stage_totals] + sorted(s for s in stage_totals if s not in STAGE_ORDER)
+
+    stages = {}
+    for name in ordered:
+        total = stage_totals[name]
+        stages[name] = {
+            "total": total,
+            "mean": total / stage_calls[name],
+            "max": stage_max[name][0],
+            "max_paper": stage_max[name][1],
+            "share": 100.0 * total / grand_total
+        }
+
+    slowest = sorted(
+        ((rec.get("paper_id"), rec.get("total_seconds", 0.0)) for rec in records),
+        key=lambda x: x[1], reverse=True
+    )[:5]
+
+    return {
+        "papers": len(records),
+        "total_seconds": sum(rec.get("total_seconds", 0.0) for rec in records),
+        "stages": stages,
+        "counters": counters,
+        "latency": latency_summary([rec.get("total_seconds", 0.0) for rec in records]),
+        "slowest": slowest
+    }
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentile q (0-100) theo nội suy tuyến tính; None nếu danh sách rỗng."""
+    if not values:
+        return None
+    data = sorted(values)
+    pos = (len(data) - 1) * q / 100.0
+    lower = int(pos)
+    upper = min(lower + 1, len(data) - 1)
+    return data[lower] + (data[upper] - data[lower]) * (pos - lower)
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    """
+    Tổng hợp latency từng paper.
+
+    Returns:
+        dict: {"count", "mean", "p50", "p95", "p99", "max"} (giây), rỗng nếu không có dữ liệu
+    """
+    if not latencies:
+        return {}
+    return {
+        "count": len(latencies),
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies)
+    }
+
+
+def format_latency(summary: dict) -> str:
+    """Định dạng latency summary thành 1 dòng text."""
+    if not summary:
+        return "Latency: n/a"
+    return (f"Latency per paper (n={summary['count']}): p50={summary['p50']:.3f}s "
+            f"p95={summary['p95']:.3f}s p99={summary['p99']:.3f}s max={summary['max']:.3f}s")
+
+
+def format_metrics_table(summary: dict) -> str:
+    """Định dạng kết quả `summarize_metrics` thành bảng text để in ra console."""
+    lines = [
+        f"{'Stage':<16}{'Total (s)':>12}{'Mean (s)':>12}{'Max (s)':>12}{'Share':>9}  Slowest paper",
+        "-" * 80
+    ]
+    for name, st in summary["stages"].items():
+        lines.append(
+            f"{name:<16}{st['total']:>12.3f}{st['mean']:>12.4f}{st['max']:>12.4f}{st['share']:>8.1f}%  {st['max_paper']}"
+        )
+    lines.append("-" * 80)
+    lines.append(f"Papers: {summary['papers']} | Time in papers: {summary['total_seconds']:.3f}s")
+    if summary.get("latency"):
+        lines.append(format_latency(summary["latency"]))
+    if summary["counters"]:
+        lines.append("Counters: " + ", ".join(f"{k}={v:,}" for k, v in sorted(summary["counters"].items())))
+    if summary["slowest"]:
+        lines.append("Slowest papers: " + ", ".join(f"{pid} ({sec:.2f}s)" for pid, sec in summary["slowest"]))
+    return "\n".join(lines)
@@ -1,11 +1,13 @@
 import re
-import uuid
+
+from src.utils.brace_index import replace_braced, unwrap_braced
 
 class LatexCleaner:
     # --- CẤU HÌNH ---
     
     # Regex bắt caption (giữ nguyên logic của bạn)
-    REGEX_CAPTION = re.compile(r'(\\caption)(\[.*?\])?\{((?:[^{}]|{[^{}]*})*)\}', re.DOTALL)
+    # Chỉ khớp tới '{' mở đối số; đối số (lồng ngoặc tùy ý) lấy theo BraceIndex
+    REGEX_CAPTION_HEAD = re.compile(r'(\\caption)(\[.*?\])?\{', re.DOTALL)
     REGEX_INCLUDE_GRAPHICS = re.compile(r'(\\includegraphics)(\[.*?\])?\{([^}]*)\}')
 
     # 1. Các lệnh rác DELETE BLOCK (Xóa cả lệnh lẫn nội dung bên trong)
@@ -38,9 +40,9 @@ class LatexCleaner:
     # Dùng để bảo vệ math trước khi clean text
     REGEX_INLINE_MATH = re.compile(r'(\$[^$]+\$|\\\([^\)]+\\\))')
 
-    # Xóa lệnh rác: \cmd{...}
-    REGEX_DELETE_BLOCK = re.compile(
-        r'\\(' + '|'.join(COMMANDS_TO_DELETE_BLOCK) + r')(\[[^\]]*\])?\{[^}]*\}'
+    # Xóa lệnh rác: \cmd{...} (regex khớp tới '{', '}' đóng lấy theo BraceIndex)
+    REGEX_DELETE_BLOCK_HEAD = re.compile(
+        r'\\(' + '|'.join(COMMANDS_TO_DELETE_BLOCK) + r')(\[[^\]]*\])?\{'
     )
 
     # Xóa lệnh layout: \cmd
@@ -52,14 +54,25 @@ class LatexCleaner:
     # Regex này xử lý trường hợp đơn giản không lồng ngoặc quá phức tạp
     REGEX_TEXORPDFSTRING = re.compile(r'\\texorpdfstring\s*\{((?:[^{}]|{[^{}]*})*)\}\s*\{((?:[^{}]|{[^{}]*})*)\}')
 
-    # Xử lý Formatting: \cmd{content} -> content
-    REGEX_UNWRAP_CMD = re.compile(
-        r'\\(' + '|'.join(COMMANDS_UNWRAP) + r')(\[[^\]]*\])?\{((?:[^{}]|{[^{}]*})*)\}'
+    # Xử lý Formatting: \cmd{content} -> content (regex khớp tới '{', '}' đóng lấy theo BraceIndex)
+    REGEX_UNWRAP_HEAD = re.compile(
+        r'\\(' + '|'.join(COMMANDS_UNWRAP) + r')(\[[^\]]*\])?\{'
     )
 
     # Xóa môi trường abstract (Chỉ xóa tag \begin{abstract} và \end{abstract})
     REGEX_ABSTRACT_TAGS = re.compile(r'\\(begin|end)\{abstract\}')
 
+    # Placeholder bảo vệ inline math: \x00MATH<số thứ tự>\x00 (xác định, khôi phục bằng một lượt sub).
+    # NUL bị TeX bỏ qua (catcode 9) và bị xóa khỏi text trước khi protect -> text gốc không thể chứa placeholder
+    REGEX_MATH_PLACEHOLDER = re.compile(r'\x00MATH(\d+)\x00')
+
+    # Một lượt quét lấy tên các lệnh có trong text: bước clean nào không có lệnh của mình thì bỏ qua
+    # (mọi regex bên trên đều cần '\\name' theo sau bởi ký tự không phải chữ cái -> đúng bằng tên quét được)
+    REGEX_COMMAND_NAME = re.compile(r'\\([A-Za-z]+)')
+    _DELETE_BLOCK_SET = frozenset(COMMANDS_TO_DELETE_BLOCK)
+    _LAYOUT_SET = frozenset(COMMANDS_LAYOUT_DELETE)
+    _UNWRAP_SET = frozenset(COMMANDS_UNWRAP)
+
     @staticmethod
     def clean_latex(text, is_preamble_safe=False):
         if not text: return ""
@@ -73,57 +86,114 @@ class LatexCleaner:
         text = text.replace(r'\end{document}', '')
 
         # 3. Xóa comment
-        text = re.sub(r'(?<!\\)%.*', '', text)
+        if '%' in text:
+            text = re.sub(r'(?<!\\)%.*', '', text)
 
         # --- BƯỚC QUAN TRỌNG: BẢO VỆ MATH ---
         # Thay thế tất cả inline math $...$ bằng placeholder độc nhất
         # Điều này ngăn các bước clean bên dưới xóa nhầm biến số như \nu, \alpha bên trong $ $
-        placeholders = {}
+        placeholders = []
         
         def protect_math(match):
-            key = f"__MATH_PROTECT_{uuid.uuid4().hex}__"
-            placeholders[key] = match.group(0)
+            key = f"\x00MATH{len(placeholders)}\x00"
+            placeholders.append(match.group(0))
             return key
 
-        text = LatexCleaner.REGEX_INLINE_MATH.sub(protect_math, text)
+        if '\x00' in text:
+            text = text.replace('\x00', '')
+        if '$' in text or '\\(' in text:
+            text = LatexCleaner.REGEX_INLINE_MATH.sub(protect_math, text)
 
         # --- BẮT ĐẦU CLEAN (Trên text đã bảo vệ math) ---
+        # Tên lệnh có trong text (một lượt quét). Xóa lệnh chỉ có thể ghép ra lệnh mới ngay tại chỗ nối
+        # (vd '\\' + '\\cite{x}' + 'textbf') -> chỉ quét lại khi một chỗ nối có thể tạo lệnh mới
+        names = set(LatexCleaner.REGEX_COMMAND_NAME.findall(text))
 
         # 4. Xử lý \texorpdfstring{math}{text} -> giữ lại math
         # Chạy vòng lặp để xử lý lồng nhau (đơn giản)
-        for _ in range(3): 
-            text = LatexCleaner.REGEX_TEXORPDFSTRING.sub(r'\1', text)
+        if 'texorpdfstring' in names:
+            for _ in range(3): 
+                text = LatexCleaner.REGEX_TEXORPDFSTRING.sub(r'\1', text)
+            names = set(LatexCleaner.REGEX_COMMAND_NAME.findall(text))
 
         # 5. Xóa các lệnh rác (footnote, cite...)
-        text = LatexCleaner.REGEX_DELETE_BLOCK.sub('', text)
+        if not names.isdisjoint(LatexCleaner._DELETE_BLOCK_SET):
+            deleted = []
+
+            def delete_block(match, argument):
+                deleted.append((match.start(), match.end() + len(argument) + 1))
+                return ''
+
+            new_text = replace_braced(LatexCleaner.REGEX_DELETE_BLOCK_HEAD, text, delete_block)
+            if LatexCleaner._joins_command(text, deleted):
+                names = set(LatexCleaner.REGEX_COMMAND_NAME.findall(new_text))
+            text = new_text
 
         # 6. Xóa các lệnh layout (centering, hfill...)
-        text = LatexCleaner.REGEX_DELETE_LAYOUT.sub('', text)
+        if not names.isdisjoint(LatexCleaner._LAYOUT_SET):
+            text, names = LatexCleaner._delete_matches(LatexCleaner.REGEX_DELETE_LAYOUT, text, names)
 
         # 7. Xóa tags Abstract (\begin{abstract})
-        text = LatexCleaner.REGEX_ABSTRACT_TAGS.sub('', text)
+        if '{abstract}' in text:
+            text, names = LatexCleaner._delete_matches(LatexCleaner.REGEX_ABSTRACT_TAGS, text, names)
 
         # 8. Unwrap Formatting (\textbf{text} -> text)
-        # Chạy vòng lặp để xử lý lồng nhau: \textbf{\textit{ABC}} -> \textit{ABC} -> ABC
-        for _ in range(5): # Chạy 3-5 lần để bóc hết các lớp lồng nhau
-            new_text = LatexCleaner.REGEX_UNWRAP_CMD.sub(r'\3', text)
-            if new_text == text:
-                break
-            text = new_text
+        # Bóc mọi lớp lồng nhau trong một lượt: \textbf{\textit{ABC}} -> ABC
+        if not names.isdisjoint(LatexCleaner._UNWRAP_SET):
+            text = unwrap_braced(LatexCleaner.REGEX_UNWRAP_HEAD, text)
 
         # 9. Dọn dẹp Text rác còn sót lại
         # Thay thế ngoặc đơn lẻ hoặc các ký tự điều khiển nếu cần thiết
         # Lưu ý: Không dùng regex catch-all solo (\\[a-z]+) nữa vì rất nguy hiểm
         
         # --- BƯỚC KHÔI PHỤC: RESTORE MATH ---
-        for key, value in placeholders.items():
-            text = text.replace(key, value)
+        if placeholders:
+            text = LatexCleaner.REGEX_MATH_PLACEHOLDER.sub(
+                lambda match: LatexCleaner._restore_placeholder(placeholders, match), text
+            )
 
         # Polish
         text = re.sub(r'\s+', ' ', text).strip()
         
         return text
 
+    @staticmethod
+    def _restore_placeholder(placeholders, match):
+        return placeholders[int(match.group(1))]
+
+    @staticmethod
+    def _delete_matches(pattern, text, names):
+        """Xóa mọi match của pattern; trả về (text mới, tên lệnh có trong text mới - có thể là tập lớn hơn)."""
+        deleted = []
+
+        def delete(match):
+            deleted.append(match.span())
+            return ''
+
+        new_text = pattern.sub(delete, text)
+        if LatexCleaner._joins_command(text, deleted):
+            names = set(LatexCleaner.REGEX_COMMAND_NAME.findall(new_text))
+        return new_text, names
+
+    @staticmethod
+    def _joins_command(text, deleted):
+        """
+        Xóa các đoạn `deleted` ([(start, end)] tăng dần, mỗi đoạn bắt đầu bằng '\\') có thể tạo ra
+        tên lệnh mới không: chỗ nối có chữ cái bên phải và '\\' hoặc chữ cái bên trái.
+        """
+        run_start = -1
+        for i, (start, end) in enumerate(deleted):
+            # Các đoạn xóa liền nhau tạo một chỗ nối duy nhất: từ trước đoạn đầu tới sau đoạn cuối
+            if i == 0 or deleted[i - 1][1] != start:
+                run_start = start
+            if i + 1 < len(deleted) and deleted[i + 1][0] == end:
+                continue
+            if end < len(text) and text[end].isascii() and text[end].isalpha() and run_start > 0:
+                left = text[run_start - 1]
+                if left == '\\' or (left.isascii() and left.isalpha()):
+                    return True
+        return False
+
     @staticmethod
     def clean_figure_table(raw_block):
         """
@@ -143,15 +213,14 @@ class LatexCleaner:
 
         # 4. Xử lý Caption (Optional): Nếu muốn clean text trong caption
         # Tìm caption và thay thế nội dung bên trong bằng text đã clean
-        def clean_caption_inner(match):
+        def clean_caption_inner(match, content):
             prefix = match.group(1) # \caption
             opt = match.group(2) if match.group(2) else "" # [opt]
-            content = match.group(3)
             # Clean nhẹ text trong caption (bỏ bold, italic...)
             cleaned_content = LatexCleaner.clean_latex(content, is_preamble_safe=True)
             return f"{prefix}{opt}{{{cleaned_content}}}"
 
-        raw_block = LatexCleaner.REGEX_CAPTION.sub(clean_caption_inner, raw_block)
+        raw_block = replace_braced(LatexCleaner.REGEX_CAPTION_HEAD, raw_block, clean_caption_inner)
 
         # 5. Clean whitespace thừa nhưng giữ lại newline quan trọng cho bảng
         # (Nếu xóa hết newline thì tabular code sẽ khó đọc, nhưng hiển thị thì không sao)
@@ -0,0 +1,186 @@
+"""
+Tree Walk
+=========
+
+Duyệt cây cấu trúc (HierarchyNode hoặc dict có key 'children') bằng stack tường minh, không đệ quy:
+không tốn một lời gọi hàm Python cho mỗi cấp và không bị giới hạn recursion với list / section
+lồng rất sâu. Thứ tự giống hệt duyệt đệ quy (pre-order; LEAVE của node sau mọi node con).
+
+- `iter_tree`: generator (event, node, depth) - ENTER theo pre-order, LEAVE (nếu post_order)
+- `walk_tree`: callback enter(node, context) -> context cho các con (SKIP: không duyệt con),
+  leave(node, context) sau khi duyệt xong các con
+- `TreeVisitor` + `run_visitors`: gộp nhiều lượt (tách nội dung, dedup, export...) thành MỘT lượt
+  duyệt; mỗi visitor có context và quyết định SKIP riêng
+
+Danh sách con của node được đọc SAU khi enter(node) chạy, nên visitor có thể thêm con cho node
+(vd tách nội dung) và các visitor sau trong cùng lượt thấy ngay các con mới.
+
+Example:
+    >>> tree = {'id': 'a', 'children': [{'id': 'b', 'children': []}, {'id': 'c'}]}
+    >>> [(event, node['id'], depth) for event, node, depth in iter_tree(tree, post_order=True)]
+    [('enter', 'a', 0), ('enter', 'b', 1), ('leave', 'b', 1), ('enter', 'c', 1), ('leave', 'c', 1), ('leave', 'a', 0)]
+"""
+
+from typing import Callable, Iterator, Optional, Tuple
+
+ENTER = 'enter'
+LEAVE = 'leave'
+
+
+class _Skip:
+    """Giá trị trả về của enter: không duyệt các con của node."""
+
+    def __repr__(self):
+        return 'SKIP'
+
+
+SKIP = _Skip()
+
+
+def node_children(node):
+    """Danh sách con của node (rỗng nếu không có)."""
+    return node.get('children') or ()
+
+
+def iter_tree(root, post_order: bool = False,
+              children: Callable = node_children) -> Iterator[Tuple[str, object, int]]:
+    """
+    Duyệt cây, yield (event, node, depth).
+
+    Args:
+        root: Node gốc
+        post_order: True -> yield thêm (LEAVE, node, depth) sau các con của node
+        children: Hàm lấy danh sách con của node
+
+    Yields:
+        (ENTER | LEAVE, node, depth) - depth của root là 0
+    """
+    yield ENTER, root, 0
+    # Mỗi frame: (iterator các con còn lại, node cha, depth của cha)
+    stack = [(iter(children(root)), root, 0)]
+    while stack:
+        it, parent, depth = stack[-1]
+        for node in it:
+            yield ENTER, node, depth + 1
+            kids = children(node)
+            if kids:
+                stack.append((iter(kids), node, depth + 1))
+                break
+            if post_order:
+                yield LEAVE, node, depth + 1
+        else:
+            stack.pop()
+            if post_order:
+                yield LEAVE, parent, depth
+
+
+def walk_tree(root, enter: Callable, leave: Optional[Callable] = None, context=None,
+              children: Callable = node_children):
+    """
+    Duyệt cây với callback.
+
+    Args:
+        root: Node gốc
+        enter: enter(node, context) -> context cho các con của node; trả SKIP để bỏ qua các con
+        leave: leave(node, context) gọi sau khi duyệt xong các con (context: như lúc enter)
+        context: Context của root (vd parent id, depth)
+        children: Hàm lấy danh sách con của node
+    """
+    child_context = enter(root, context)
+    if child_context is not SKIP:
+        # Mỗi frame: (iterator các con còn lại, context của các con, node cha, context của cha).
+        # Chỉ node có con mới tạo frame; node lá không tạo object nào
+        stack = [(iter(children(root)), child_context, root, context)]
+        while stack:
+            it, frame_context, parent, parent_context = stack[-1]
+            for node in it:
+                child_context = enter(node, frame_context)
+                if child_context is not SKIP:
+                    kids = children(node)
+                    if kids:
+                        stack.append((iter(kids), child_context, node, frame_context))
+                        break
+                if leave is not None:
+                    leave(node, frame_context)
+            else:
+                stack.pop()
+                if leave is not None and stack:
+                    leave(parent, parent_context)
+    if leave is not None:
+        leave(root, context)
+
+
+class TreeVisitor:
+    """
+    Một lượt xử lý cây dạng visitor (ghép được với visitor khác bằng `run_visitors`).
+
+    Attributes:
+        context: Context của root
+    """
+
+    context = None
+
+    def enter(self, node, context):
+        """Xử lý node trước các con; trả context cho các con hoặc SKIP."""
+        return context
+
+    def leave(self, node, context):
+        """Xử lý node sau các con."""
+
+    def finish(self):
+        """Gọi sau khi duyệt xong cả cây; giá trị trả về là kết quả của visitor."""
+        return None
+
+
+def _no_leave(visitor) -> bool:
+    """Visitor không viết lại leave -> không cần lượt LEAVE."""
+    return type(visitor).leave is TreeVisitor.leave
+
+
+class _FusedVisitor:
+    """Ghép nhiều TreeVisitor: context là tuple context của từng visitor (SKIP -> visitor bỏ qua cây con)."""
+
+    def __init__(self, visitors):
+        # Bound method lấy sẵn một lần (không tra thuộc tính ở mỗi node)
+        self.enters = [visitor.enter for visitor in visitors]
+        self.size = len(visitors)
+        # (vị trí, leave) của các visitor có viết lại leave
+        self.leaving = [(i, visitor.leave) for i, visitor in enumerate(visitors) if not _no_leave(visitor)]
+
+    def enter(self, node, contexts):
+        child_contexts = tuple([
+            SKIP if context is SKIP else enter(node, context)
+            for enter, context in zip(self.enters, contexts)
+        ])
+        if child_contexts.count(SKIP) == self.size:
+            return SKIP
+        return child_contexts
+
+    def leave(self, node, contexts):
+        for i, leave in self.leaving:
+            context = contexts[i]
+            if context is not SKIP:
+                leave(node, context)
+
+
+def run_visitors(root, *visitors: TreeVisitor, children: Callable = node_children) -> list:
+    """
+    Chạy các visitor trên cây trong MỘT lượt duyệt (theo thứ tự truyền vào tại mỗi node).
+
+    Args:
+        root: Node gốc
+        *visitors: Các TreeVisitor
+        children: Hàm lấy danh sách con của node
+
+    Returns:
+        list: Kết quả finish() của từng visitor
+    """
+    if len(visitors) == 1:
+        visitor = visitors[0]
+        leave = None if _no_leave(visitor) else visitor.leave
+        walk_tree(root, visitor.enter, leave, visitor.context, children)
+    else:
+        fused = _FusedVisitor(visitors)
+        leave = fused.leave if fused.leaving else None
+        walk_tree(root, fused.enter, leave, tuple(v.context for v in visitors), children)
+    return [visitor.finish() for visitor in visitors]
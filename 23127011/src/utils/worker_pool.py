@@ -0,0 +1,235 @@
+"""
+Supervised Worker Pool
+======================
+
+Process pool có giám sát cho Phase 1, dùng khi cần giới hạn tài nguyên từng paper.
+
+`concurrent.futures.ProcessPoolExecutor` không thể dừng một task đang chạy: một paper
+bệnh lý (regex backtracking, `\\input` dữ liệu khổng lồ...) có thể giữ worker mãi mãi.
+`SupervisedProcessPool` tự quản lý các worker process, mỗi worker một `Pipe` riêng
+(kill một worker không làm hỏng kênh của worker khác), và process cha:
+
+    - theo dõi paper mỗi worker đang xử lý và thời điểm bắt đầu
+    - kill worker khi paper vượt quá thời gian (`timeout`) hoặc RSS (`max_rss_mb`, đọc /proc)
+    - đưa phần còn lại của batch bị gián đoạn trở lại hàng đợi
+    - thay worker mới sau `max_tasks_per_child` tasks (tránh phình bộ nhớ / leak)
+
+Example:
+    >>> pool = SupervisedProcessPool(func, workers=8, timeout=300, max_rss_mb=4096)
+    >>> for kind, item, payload in pool.run([["2403-00001"], ["2403-00002", "2403-00003"]]):
+    ...     if kind == "result": handle(payload)
+    ...     else: quarantine(item, payload)    # kind == "quarantined"
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# Số lần liên tiếp worker chết trước khi bắt đầu bất kỳ item nào -> coi như lỗi hệ thống
+MAX_STARTUP_FAILURES = 3
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """RSS hiện tại của process (MB) đọc từ /proc; None nếu không đọc được (non-Linux, process đã chết)."""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _worker_main(conn, func, initializer, initargs):
+    """
+    Vòng lặp của worker: nhận batch, báo "start" trước mỗi item và "done" sau khi xong.
+    Nhận None -> thoát.
+    """
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            batch = conn.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        for item in batch:
+            conn.send(("start", item))
+            try:
+                result = func(item)
+            except Exception as e:
+                result = e
+            conn.send(("done", item, result))
+        conn.send(("idle",))
+    conn.close()
+
+
+class _WorkerState:
+    """Trạng thái một worker phía process cha."""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.remaining = []
+        self.current = None
+        self.started_at = None
+        self.tasks_done = 0
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.remaining)
+
+
+class SupervisedProcessPool:
+    """
+    Process pool giám sát thời gian & bộ nhớ từng item.
+
+    Args:
+        func: Hàm module-level (picklable) xử lý một item
+        workers: Số worker processes
+        timeout: Thời gian tối đa (giây) cho một item (None = không giới hạn)
+        max_rss_mb: RSS tối đa (MB) của worker khi xử lý một item (None = không giới hạn)
+        max_tasks_per_child: Số tasks (batches) trước khi thay worker mới (None = không thay)
+        initializer, initargs: Hàm khởi tạo chạy trong mỗi worker
+        poll_interval: Chu kỳ kiểm tra giới hạn (giây)
+    """
+
+    def __init__(self, func: Callable, workers: int, timeout: Optional[float] = None,
+                 max_rss_mb: Optional[float] = None, max_tasks_per_child: Optional[int] = None,
+                 initializer: Optional[Callable] = None, initargs: tuple = (),
+                 poll_interval: float = 0.2):
+        self.func = func
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self.initializer = initializer
+        self.initargs = initargs
+        self.poll_interval = poll_interval
+        self._ctx = multiprocessing.get_context()
+        self._startup_failures = 0
+
+        if max_rss_mb and read_rss_mb(os.getpid()) is None:
+            logging.warning("RSS limit requested but /proc is not available; memory cap disabled.")
+            self.max_rss_mb = None
+
+    def _spawn(self) -> _WorkerState:
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.func, self.initializer, self.initargs),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return _WorkerState(process, parent_conn)
+
+    def _stop(self, state: _WorkerState, kill: bool = False):
+        if kill:
+            state.process.kill()
+        else:
+            try:
+                state.conn.send(None)
+            except (OSError, ValueError):
+                state.process.kill()
+        state.process.join()
+        state.conn.close()
+
+    def _check_limits(self, state: _WorkerState, now: float) -> Optional[dict]:
+        """Trả về thông tin vi phạm (reason, detail) nếu item hiện tại vượt giới hạn."""
+        if state.current is None:
+            return None
+        elapsed = now - state.started_at
+        if self.timeout and elapsed > self.timeout:
+            return {"reason": "timeout", "detail": f"exceeded {self.timeout:g}s", "elapsed": round(elapsed, 3)}
+        if self.max_rss_mb:
+            rss = read_rss_mb(state.process.pid)
+            if rss is not None and rss > self.max_rss_mb:
+                return {"reason": "memory", "detail": f"RSS {rss:.0f}MB > {self.max_rss_mb:g}MB",
+                        "elapsed": round(elapsed, 3)}
+        return None
+
+    def run(self, tasks: Iterable[List]) -> Iterator[Tuple[str, object, object]]:
+        """
+        Chạy các tasks (mỗi task là một list items) và yield kết quả theo thứ tự hoàn thành.
+
+        Yields:
+            ("result", item, kết quả của func(item) hoặc Exception nó raise)
+            ("quarantined", item, {"reason": "timeout" | "memory" | "crashed", "detail": str, "elapsed": float})
+        """
+        pending = deque(list(task) for task in tasks if task)
+        states = []
+
+        try:
+            while pending or any(s.busy for s in states):
+                # Bỏ worker rảnh đã chết, giao việc cho worker rảnh, tạo thêm worker nếu còn thiếu
+                for state in [s for s in states if not s.busy and not s.process.is_alive()]:
+                    self._stop(state, kill=True)
+                    states.remove(state)
+                while len(states) < self.workers and len(states) < len(pending) + sum(s.busy for s in states):
+                    states.append(self._spawn())
+                for state in states:
+                    if not state.busy and pending:
+                        state.remaining = pending.popleft()
+                        state.conn.send(state.remaining)
+
+                ready = wait([s.conn for s in states if s.busy], timeout=self.poll_interval)
+                events = []
+                for state in [s for s in states if s.conn in ready]:
+                    try:
+                        while state.conn.poll():
+                            events.append((state, state.conn.recv()))
+                    except (EOFError, OSError):
+                        # Worker chết (segfault, OOM killer...) -> xử lý ở bước kiểm tra bên dưới
+                        pass
+
+                for state, msg in events:
+                    kind = msg[0]
+                    if kind == "start":
+                        state.current = msg[1]
+                        state.started_at = time.monotonic()
+                        self._startup_failures = 0
+                    elif kind == "done":
+                        state.remaining.remove(msg[1])
+                        state.current = None
+                        yield ("result", msg[1], msg[2])
+                    elif kind == "idle":
+                        state.tasks_done += 1
+
+                now = time.monotonic()
+                for state in list(states):
+                    if not state.busy:
+                        if self.max_tasks_per_child and state.tasks_done >= self.max_tasks_per_child:
+                            self._stop(state)
+                            states.remove(state)
+                        continue
+
+                    violation = self._check_limits(state, now)
+                    if violation is None and not state.process.is_alive():
+                        violation = {"reason": "crashed", "detail": f"exit code {state.process.exitcode}",
+                                     "elapsed": round(now - state.started_at, 3) if state.started_at else 0.0}
+                    if violation is None:
+                        continue
+
+                    self._stop(state, kill=True)
+                    states.remove(state)
+                    rest = [item for item in state.remaining if item != state.current]
+                    if state.current is not None:
+                        yield ("quarantined", state.current, violation)
+                    else:
+                        # Worker chết trước khi bắt đầu item nào (vd: lỗi initializer)
+                        self._startup_failures += 1
+                        if self._startup_failures >= MAX_STARTUP_FAILURES:
+                            raise RuntimeError(f"Worker process failed to start: {violation['detail']}")
+                    if rest:
+                        pending.appendleft(rest)
+        finally:
+            for state in states:
+                self._stop(state, kill=state.busy)
@@ -0,0 +1,8 @@
+"""Cho phép chạy `pytest` từ thư mục gốc của repo (import package `src`)."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,77 @@
+"""
+BraceIndex: ghép cặp bằng numpy (`_pairs_numpy`, text dài) và stack Python lười (text ngắn)
+phải giống đếm ngoặc tham chiếu, kể cả ngoặc không cân bằng và text không phải ASCII.
+"""
+
+import random
+import re
+
+import pytest
+
+from src.utils import brace_index
+from src.utils.brace_index import BraceIndex, replace_braced, unwrap_braced
+
+ALPHABETS = ['{}a', '{}{}\\x ', '{}é字\\ \n']
+
+
+def reference_match(text, open_pos):
+    """'}' khớp với '{' tại open_pos bằng đếm ngoặc từng ký tự; -1 nếu không đóng."""
+    depth = 0
+    for pos in range(open_pos, len(text)):
+        if text[pos] == '{':
+            depth += 1
+        elif text[pos] == '}':
+            depth -= 1
+            if depth == 0:
+                return pos
+    return -1
+
+
+def reference_pairs(text):
+    """Mọi cặp {vị trí '{': vị trí '}'} của text ('}' thừa bị bỏ qua, '{' không đóng không có mặt)."""
+    pairs, stack = {}, []
+    for pos, char in enumerate(text):
+        if char == '{':
+            stack.append(pos)
+        elif char == '}' and stack:
+            pairs[stack.pop()] = pos
+    return pairs
+
+
+def random_text(rng):
+    alphabet = rng.choice(ALPHABETS)
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 300)))
+
+
+@pytest.mark.parametrize('seed', range(500))
+def test_pairs_numpy_matches_reference(seed):
+    text = random_text(random.Random(seed))
+    assert BraceIndex._pairs_numpy(text) == reference_pairs(text)
+
+
+@pytest.mark.parametrize('seed', range(300))
+@pytest.mark.parametrize('small_text_chars', [0, 1 << 30])
+def test_match_numpy_and_lazy_paths(monkeypatch, seed, small_text_chars):
+    monkeypatch.setattr(brace_index, 'SMALL_TEXT_CHARS', small_text_chars)
+    rng = random.Random(seed)
+    text = random_text(rng)
+    braces = BraceIndex(text)
+    opens = [pos for pos, char in enumerate(text) if char == '{']
+    # Thứ tự tra ngẫu nhiên: đường lười điền pairs dần, kết quả không được phụ thuộc thứ tự
+    rng.shuffle(opens)
+    for pos in opens:
+        assert braces.match(pos) == reference_match(text, pos)
+
+
+def test_long_text_uses_numpy_index():
+    text = '\\textbf{a {b} c}' * brace_index.SMALL_TEXT_CHARS
+    braces = BraceIndex(text)
+    assert braces.pairs == reference_pairs(text)
+    assert braces.argument(7) == 'a {b} c'
+
+
+def test_replace_and_unwrap_nested():
+    text = r'x \textbf{a \emph{b {c}} d} \cite{k{1}} \textbf{open'
+    assert unwrap_braced(re.compile(r'\\(textbf|emph)\{'), text) == r'x a b {c} d \cite{k{1}} \textbf{open'
+    assert replace_braced(re.compile(r'\\cite\{'), text, lambda match, argument: '[%s]' % argument) == \
+        r'x \textbf{a \emph{b {c}} d} [k{1}] \textbf{open'
@@ -0,0 +1,118 @@
+"""
+Root detection: chấm điểm có dừng sớm / chỉ đọc phần đầu file phải chọn cùng file gốc
+(và cùng lý do) với chấm điểm toàn bộ mọi file .tex.
+
+Bảo vệ `score_upper_bound`, `EARLY_EXIT_MARGIN` và quét include streaming (`STREAM_CHUNK_CHARS`).
+"""
+
+import os
+import random
+
+import pytest
+
+from src.parser import file_index as file_index_module
+from src.parser.file_index import VersionFileIndex
+from src.parser.file_loader import EARLY_EXIT_MARGIN, PRIO_NAMES, decide_root_tex_file, get_score
+
+NAMES = ['main', 'ms', 'paper', 'article', 'arxiv', 'template', 'sample_paper', 'response',
+         'reply_letter', 'supplement', 'slides', 'figure', 'intro', 'method', 'appendix']
+CLASSES = ['article', 'revtex4', 'beamer', 'standalone', 'letter', 'IEEEtran']
+BODY_MARKERS = ['\\maketitle', '\\begin{abstract}x\\end{abstract}', '\\bibliography{refs}',
+                '\\begin{thebibliography}{9}\\end{thebibliography}']
+
+
+def exhaustive_root(folder):
+    """Chọn file gốc bằng cách đọc và chấm điểm TẤT CẢ file .tex (không dừng sớm, không cắt prefix)."""
+    index = VersionFileIndex(folder)
+    dep_map = index.dependency_map()
+    order = {path: i for i, path in enumerate(index.tex_files)}
+    candidates = []
+    for path in index.tex_files:
+        content = index.read(path)
+        score = get_score(path, content, index.file_names, dep_map, clean_content=index.stripped(path))
+        if score > -100:
+            candidates.append({'path': path, 'name': os.path.basename(path), 'score': score, 'len': len(content)})
+    if not candidates:
+        return None, 'no_candidates'
+
+    candidates.sort(key=lambda x: order[x['path']])
+    candidates.sort(key=lambda x: (x['score'], x['len']), reverse=True)
+    winner, reason = candidates[0], 'top_score'
+    if len(candidates) >= 2:
+        top1, top2 = candidates[0], candidates[1]
+        if top1['score'] - top2['score'] < EARLY_EXIT_MARGIN:
+            if top1['name'].lower() not in PRIO_NAMES and top2['name'].lower() in PRIO_NAMES:
+                winner, reason = top2, 'tie_standard_name'
+            elif top2['len'] > top1['len'] * 1.5:
+                winner, reason = top2, 'tie_larger_file'
+    return os.path.relpath(winner['path'], index.root).replace(os.sep, '/'), reason
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def make_folder(folder, rng):
+    """Sinh một version folder ngẫu nhiên: nhiều ứng viên gốc, file con, file vệ tinh, file lớn."""
+    names = rng.sample(NAMES, rng.randint(1, 7))
+    for name in names:
+        lines = []
+        if rng.random() < 0.8:
+            prefix = '% \\documentclass{article}\n' if rng.random() < 0.1 else ''
+            lines.append(prefix + '\\documentclass{%s}' % rng.choice(CLASSES))
+        if rng.random() < 0.7:
+            lines.append('\\begin{document}')
+        if rng.random() < 0.4:
+            # Ứng viên "đầy đủ": đạt đúng cận trên điểm nội dung -> dễ hòa sát nút với ứng viên khác
+            lines.extend(BODY_MARKERS)
+            lines.extend('\\input{part%d}' % i for i in range(10))
+        else:
+            lines.extend(rng.sample(BODY_MARKERS, rng.randint(0, len(BODY_MARKERS))))
+        # Phần thân lớn: include nằm sau prefix và vắt qua nhiều chunk streaming
+        lines.extend('filler line %d with some words' % i for i in range(rng.choice([0, 5, 400])))
+        for child in rng.sample(names, rng.randint(0, min(3, len(names)))):
+            if child != name:
+                lines.append(rng.choice(['\\input{%s}', '\\include{sections/%s.tex}', '%% \\input{%s}']) % child)
+        lines.append('\\end{document}')
+        _write(os.path.join(folder, name + '.tex'), '\n'.join(lines) + '\n')
+        for ext in ('.bbl', '.bib', '.log'):
+            if rng.random() < 0.2:
+                _write(os.path.join(folder, name + ext), 'x\n')
+
+
+@pytest.mark.parametrize('seed', range(1000))
+def test_early_exit_matches_exhaustive(tmp_path, seed):
+    folder = str(tmp_path / 'v1')
+    make_folder(folder, random.Random(seed))
+
+    expected = exhaustive_root(folder)
+    decision = decide_root_tex_file(folder, file_index=VersionFileIndex(folder))
+    assert (decision['root'], decision['reason']) == expected
+
+
+@pytest.mark.parametrize('seed', range(60))
+@pytest.mark.parametrize('prefix_chars,chunk_chars', [(64, 7), (200, 1), (1024, 33)])
+def test_prefix_and_tiny_stream_chunks_match_exhaustive(tmp_path, monkeypatch, seed, prefix_chars, chunk_chars):
+    folder = str(tmp_path / 'v1')
+    make_folder(folder, random.Random(seed))
+    monkeypatch.setattr(file_index_module, 'STREAM_CHUNK_CHARS', chunk_chars)
+
+    expected = exhaustive_root(folder)
+    decision = decide_root_tex_file(folder, file_index=VersionFileIndex(folder), prefix_chars=prefix_chars)
+    assert (decision['root'], decision['reason']) == expected
+
+
+def test_early_exit_skips_hopeless_candidates(tmp_path):
+    folder = str(tmp_path / 'v1')
+    _write(os.path.join(folder, 'main.tex'),
+           '\\documentclass{article}\n\\begin{document}\n\\maketitle\n\\bibliography{refs}\n\\end{document}\n')
+    _write(os.path.join(folder, 'main.bbl'), 'x\n')
+    for i in range(5):
+        _write(os.path.join(folder, 'letter%d.tex' % i), '\\documentclass{letter}\n\\begin{document}\n\\end{document}\n')
+
+    decision = decide_root_tex_file(folder)
+    assert decision['root'] == 'main.tex'
+    assert decision['early_exit']
+    assert decision['scored'] == 1
@@ -0,0 +1,96 @@
+"""
+SourceMap: `apply_edits` / `sub` phải cho text giống re.sub và mọi ký tự giữ đúng (file, dòng) nguồn,
+so với mô hình tham chiếu gán nguồn cho từng ký tự.
+"""
+
+import random
+import re
+
+import pytest
+
+from src.parser.source_map import GENERATED, SourceMap
+
+FILES = ['main.tex', 'sections/intro.tex', 'sections/method.tex']
+ALPHABET = 'ab \n\n{}%'
+
+
+def make_map(rng):
+    """SourceMap ngẫu nhiên kèm nguồn tham chiếu của từng ký tự: (file, dòng) hoặc None (text sinh ra)."""
+    smap = SourceMap(files=FILES)
+    pieces, origins = [], []
+    offset = 0
+    for _ in range(rng.randint(0, 8)):
+        piece = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12)))
+        fid = rng.choice([GENERATED, 0, 1, 2])
+        line = rng.randint(1, 50)
+        smap.add_span(offset, fid, line)
+        for k, char in enumerate(piece):
+            origins.append(None if fid == GENERATED else (FILES[fid], line + piece.count('\n', 0, k)))
+        pieces.append(piece)
+        offset += len(piece)
+    smap.text = ''.join(pieces)
+    return smap, origins
+
+
+def make_edits(rng, length):
+    """Các edit (start, end, replacement) tăng dần, không chồng lấn (gồm chèn thuần và xóa thuần)."""
+    cuts = sorted(rng.randint(0, length) for _ in range(2 * rng.randint(0, 4)))
+    return [(cuts[i], cuts[i + 1], ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 5))))
+            for i in range(0, len(cuts), 2)]
+
+
+def expected_origins(smap, origins, edits):
+    """Nguồn tham chiếu sau khi sửa: text thay thế mang nguồn của vị trí start, phần còn lại giữ nguồn cũ."""
+    result, pos = [], 0
+    for start, end, replacement in edits:
+        result.extend(origins[pos:start])
+        base = smap.locate(start)
+        for k in range(len(replacement)):
+            result.append(None if base is None else (base[0], base[1] + replacement.count('\n', 0, k)))
+        pos = end
+    result.extend(origins[pos:])
+    return result
+
+
+@pytest.mark.parametrize('seed', range(500))
+def test_apply_edits_keeps_origin_of_every_char(seed):
+    rng = random.Random(seed)
+    smap, origins = make_map(rng)
+    assert [smap.locate(k) for k in range(len(smap.text))] == origins
+
+    edits = make_edits(rng, len(smap.text))
+    new = smap.apply_edits(edits)
+
+    text, pos = [], 0
+    for start, end, replacement in edits:
+        text.append(smap.text[pos:start] + replacement)
+        pos = end
+    text.append(smap.text[pos:])
+    assert new.text == ''.join(text)
+    assert list(new.starts) == sorted(new.starts)
+    assert [new.locate(k) for k in range(len(new.text))] == expected_origins(smap, origins, edits)
+
+
+@pytest.mark.parametrize('seed', range(200))
+@pytest.mark.parametrize('pattern,repl', [
+    (r'\{(a*)\}', r'[\1]'),
+    (r'%[^\n]*', ''),
+    (r'\n\n+', '\n'),
+    (r'b', lambda m: 'BB\n'),
+])
+def test_sub_matches_re_sub(seed, pattern, repl):
+    smap, origins = make_map(random.Random(seed))
+    regex = re.compile(pattern)
+    new = smap.sub(regex, repl)
+
+    assert new.text == regex.sub(repl, smap.text)
+    if callable(repl):
+        edits = [(m.start(), m.end(), repl(m)) for m in regex.finditer(smap.text)]
+    else:
+        edits = [(m.start(), m.end(), m.expand(repl)) for m in regex.finditer(smap.text)]
+    assert [new.locate(k) for k in range(len(new.text))] == expected_origins(smap, origins, edits)
+
+
+def test_no_edits_returns_same_map():
+    smap, _ = make_map(random.Random(0))
+    assert smap.apply_edits([]) is smap
@@ -0,0 +1,51 @@
+"""
+Bảng token cấu trúc: header (token SECTION) và cách tách block (token BEGIN/END, $$, \\[ \\])
+phải giống các regex cũ chạy thẳng trên text, kể cả khi text còn comment.
+"""
+
+import random
+import re
+
+import pytest
+
+from src.parser import tex_tokenizer
+from src.parser.tex_parser import LatexContentProcessor, LatexStructureBuilder
+from src.parser.tex_tokenizer import tokenize
+
+ATOMS = ['\\begin{figure}', '\\end{figure}', '\\begin{Table*}', '\\end{table*}', '\\begin{equation}',
+         '\\end{equation*}', '$$', '$', '\\[', '\\]', '\\begin{itemize}', '\\end{enumerate}', '\\begin{ITEMIZE}',
+         '%', '\\%', '\n', 'x ', '\\section{', '\\Subsection *{', '\\paragraph{', '\\begin{a$$b}', '\\end{a\\]}',
+         '\\begin{', '\\end{', '}', '\\\\']
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return LatexContentProcessor('p', 'v1')
+
+
+def combined_split(processor, text):
+    """Cách tách block cũ: re.split với pattern tổng hợp Math | Figure | List (bỏ group không khớp)."""
+    pattern = re.compile(
+        f"({processor.REGEX_MATH_BLOCK.pattern}|{processor.REGEX_FIGURE.pattern}|{processor.REGEX_LIST.pattern})",
+        re.DOTALL | re.IGNORECASE
+    )
+    return [part for part in pattern.split(text) if part is not None]
+
+
+@pytest.mark.parametrize('seed', range(2000))
+def test_tokens_match_regex_split(processor, seed):
+    rng = random.Random(seed)
+    text = ''.join(rng.choice(ATOMS) for _ in range(rng.randint(0, 30)))
+    tokens = tokenize(text)
+
+    assert processor._split_blocks(text, tokens) == combined_split(processor, text)
+    section_regex = LatexStructureBuilder('', 'p', 'v1').SECTION_START_REGEX
+    assert [start for kind, start, _, _ in tokens
+            if kind in (tex_tokenizer.SECTION, tex_tokenizer.SECTION_STAR)] == \
+        [match.start() for match in section_regex.finditer(text)]
+
+
+def test_comment_does_not_hide_block_closer(processor):
+    text = '\\begin{figure}x %\\end{figure}\nmore\\end{figure} tail'
+    assert processor._split_blocks(text, tokenize(text)) == combined_split(processor, text)
+    assert processor._split_blocks(text, tokenize(text))[1] == '\\begin{figure}x %\\end{figure}'